@@ -0,0 +1,240 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from io import BytesIO
+from typing import Optional
+
+import numpy as np
+
+from warm import s3_client
+
+SOURCE_CACHE_DIR = os.environ.get('SOURCE_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'source-cache')
+SOURCE_CACHE_BYTES = int(os.environ.get('SOURCE_CACHE_BYTES') or 1024 ** 3)
+SOURCE_CACHE_S3 = os.environ.get('SOURCE_CACHE_S3') == '1'
+SEGMENT_CACHE_DIR = os.environ.get('SEGMENT_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'segment-cache')
+SEGMENT_CACHE_BYTES = int(os.environ.get('SEGMENT_CACHE_BYTES') or 1024 ** 3)
+SEGMENT_CACHE_S3 = os.environ.get('SEGMENT_CACHE_S3') == '1'
+THUMBNAIL_SHARE = 0.1
+IMMUTABLE_URL_PREFIX = 'https://cdn.poehali.dev/'
+
+def content_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class SourceCache:
+    """Кэш декодированных и приведённых к размеру кадра исходников.
+
+    Ключ - хэш содержимого фото и целевой размер. Первый уровень - локальный диск
+    с LRU-вытеснением по суммарному размеру, второй (опционально) - бакет files в S3.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, use_s3: bool = False):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.use_s3 = use_s3
+        self.stats = {'lookups': 0, 'disk_hits': 0, 's3_hits': 0, 'misses': 0,
+                      'download_bytes_saved': 0, 'decoded_bytes_served': 0}
+        self.pinned = {}
+        os.makedirs(os.path.join(directory, 'urls'), exist_ok=True)
+
+    def _path(self, digest: str, size: tuple) -> str:
+        return os.path.join(self.directory, f'{digest}-{size[0]}x{size[1]}.npy')
+
+    def _url_path(self, url: str) -> str:
+        return os.path.join(self.directory, 'urls', hashlib.sha1(url.encode()).hexdigest())
+
+    def pin(self, url: str, digest: str, download_bytes: int = 0):
+        """Хэш для любой ссылки до unpin_all: пакетный рендер скачивает общее фото один раз на все проекты"""
+        self.pinned[url] = (digest, download_bytes)
+
+    def unpin_all(self):
+        self.pinned.clear()
+
+    def lookup_url(self, url: str) -> tuple:
+        """(хэш, размер файла) уже скачанного фото; только для неизменяемых CDN-ссылок и закреплённых через pin"""
+        if url in self.pinned:
+            return self.pinned[url]
+        if not url.startswith(IMMUTABLE_URL_PREFIX):
+            return None, 0
+        try:
+            with open(self._url_path(url)) as entry:
+                fields = entry.read().split()
+        except OSError:
+            return None, 0
+        if not fields:
+            return None, 0
+        return fields[0], int(fields[1]) if len(fields) > 1 else 0
+
+    def digest_for_url(self, url: str) -> Optional[str]:
+        return self.lookup_url(url)[0]
+
+    def remember_url(self, url: str, digest: str, download_bytes: int = 0):
+        if url.startswith(IMMUTABLE_URL_PREFIX):
+            self._write_atomic(self._url_path(url), f'{digest} {download_bytes}'.encode())
+
+    def contains(self, digest: str, size: tuple) -> bool:
+        return os.path.exists(self._path(digest, size))
+
+    def skip_download(self, download_bytes: int):
+        """Учёт загрузки, которую не пришлось делать: исходник уже в кэше"""
+        self.stats['download_bytes_saved'] += download_bytes
+
+    def get(self, digest: str, size: tuple) -> Optional[np.ndarray]:
+        self.stats['lookups'] += 1
+        path = self._path(digest, size)
+        try:
+            array = np.load(path)
+            os.utime(path)
+            self.stats['disk_hits'] += 1
+        except (OSError, ValueError):
+            array = self._get_s3(digest, size)
+            if array is None:
+                self.stats['misses'] += 1
+                return None
+            self.stats['s3_hits'] += 1
+            self._store_disk(path, array)
+        self.stats['decoded_bytes_served'] += array.nbytes
+        return array
+
+    def put(self, digest: str, size: tuple, array: np.ndarray):
+        self._store_disk(self._path(digest, size), array)
+        if self.use_s3:
+            buffer = BytesIO()
+            np.save(buffer, array)
+            buffer.seek(0)
+            s3_client().put_object(Bucket='files', Key=self._s3_key(digest, size), Body=buffer)
+
+    def _s3_key(self, digest: str, size: tuple) -> str:
+        return f'cache/sources/{digest}-{size[0]}x{size[1]}.npy'
+
+    def _get_s3(self, digest: str, size: tuple) -> Optional[np.ndarray]:
+        if not self.use_s3:
+            return None
+        try:
+            response = s3_client().get_object(Bucket='files', Key=self._s3_key(digest, size))
+            return np.load(BytesIO(response['Body'].read()))
+        except Exception:
+            return None
+
+    def _store_disk(self, path: str, array: np.ndarray):
+        buffer = BytesIO()
+        np.save(buffer, array)
+        self._write_atomic(path, buffer.getbuffer())
+        evict_lru(self.directory, '.npy', self.max_bytes)
+
+    def _write_atomic(self, path: str, data):
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as tmp:
+            tmp.write(data)
+        os.replace(tmp_path, path)
+
+
+class SegmentCache:
+    """Кэш готовых закодированных сегментов: фото, его переход и настройки рендера.
+
+    Рядом с сегментом лежат его миниатюры для спрайта (.npy), чтобы повторное использование
+    сегмента не требовало декодировать видео; под них отводится THUMBNAIL_SHARE лимита.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, use_s3: bool = False):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.use_s3 = use_s3
+        self.stats = {'lookups': 0, 'disk_hits': 0, 's3_hits': 0, 'misses': 0}
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f'{key}.mp4')
+
+    def _thumbnails_path(self, key: str, tag: str) -> str:
+        return os.path.join(self.directory, f'{key}-{tag}.npy')
+
+    def get_thumbnails(self, key: str, tag: str) -> Optional[np.ndarray]:
+        path = self._thumbnails_path(key, tag)
+        try:
+            array = np.load(path)
+            os.utime(path)
+            return array
+        except (OSError, ValueError):
+            pass
+        if not self.use_s3:
+            return None
+        try:
+            response = s3_client().get_object(Bucket='files', Key=f'cache/segments/{key}-{tag}.npy')
+            array = np.load(BytesIO(response['Body'].read()))
+        except Exception:
+            return None
+        self.put_thumbnails(key, tag, array, upload=False)
+        return array
+
+    def put_thumbnails(self, key: str, tag: str, array: np.ndarray, upload: bool = True):
+        buffer = BytesIO()
+        np.save(buffer, array)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as tmp:
+            tmp.write(buffer.getbuffer())
+        os.replace(tmp_path, self._thumbnails_path(key, tag))
+        evict_lru(self.directory, '.npy', int(self.max_bytes * THUMBNAIL_SHARE))
+        if self.use_s3 and upload:
+            buffer.seek(0)
+            s3_client().put_object(Bucket='files', Key=f'cache/segments/{key}-{tag}.npy', Body=buffer)
+
+    def fetch(self, key: str, destination: str) -> bool:
+        """Кладёт закэшированный сегмент в destination, если он есть"""
+        self.stats['lookups'] += 1
+        path = self._path(key)
+        if os.path.exists(path):
+            os.utime(path)
+            link_or_copy(path, destination)
+            self.stats['disk_hits'] += 1
+            return True
+        if self.use_s3:
+            try:
+                s3_client().download_file('files', f'cache/segments/{key}.mp4', destination)
+                self.store(key, destination, upload=False)
+                self.stats['s3_hits'] += 1
+                return True
+            except Exception:
+                pass
+        self.stats['misses'] += 1
+        return False
+
+    def store(self, key: str, source_path: str, upload: bool = True):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        os.close(fd)
+        shutil.copyfile(source_path, tmp_path)
+        os.replace(tmp_path, self._path(key))
+        evict_lru(self.directory, '.mp4', self.max_bytes)
+        if self.use_s3 and upload:
+            s3_client().upload_file(source_path, 'files', f'cache/segments/{key}.mp4')
+
+
+def link_or_copy(source_path: str, destination: str):
+    try:
+        os.link(source_path, destination)
+    except OSError:
+        shutil.copyfile(source_path, destination)
+
+
+def evict_lru(directory: str, suffix: str, max_bytes: int):
+    """Удаляет давно не использованные записи, пока кэш не уложится в лимит"""
+    entries = []
+    with os.scandir(directory) as listing:
+        for entry in listing:
+            if entry.name.endswith(suffix):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+
+source_cache = SourceCache(SOURCE_CACHE_DIR, SOURCE_CACHE_BYTES, SOURCE_CACHE_S3)
+segment_cache = SegmentCache(SEGMENT_CACHE_DIR, SEGMENT_CACHE_BYTES, SEGMENT_CACHE_S3)
@@ -0,0 +1,97 @@
+from functools import lru_cache
+
+import numpy as np
+
+WEIGHT_BITS = 7
+WEIGHT_ONE = 1 << WEIGHT_BITS
+
+BRAND_GRADIENT = ((155, 135, 245), (217, 70, 239), (249, 115, 22))
+
+
+def vertical_gradient(size: tuple, stops=BRAND_GRADIENT) -> np.ndarray:
+    """Вертикальный градиент через равномерно расставленные цвета, кадр HxWx3"""
+    width, height = size
+    ratio = np.arange(height, dtype=np.float32) / height
+    points = np.linspace(0, 1, len(stops))
+    colors = np.asarray(stops, dtype=np.float32)
+    column = np.stack([np.interp(ratio, points, colors[:, c]) for c in range(3)], axis=1)
+    return np.ascontiguousarray(np.broadcast_to(column.astype(np.uint8)[:, None, :], (height, width, 3)))
+
+
+def darken(frame: np.ndarray, opacity: float) -> np.ndarray:
+    """Накладывает чёрный слой с заданной непрозрачностью"""
+    return scale(frame, round((1 - opacity) * WEIGHT_ONE))
+
+
+def scale(frame: np.ndarray, weight: int) -> np.ndarray:
+    if weight >= WEIGHT_ONE:
+        return frame
+    if weight <= 0:
+        return np.zeros_like(frame)
+    acc = frame.astype(np.uint16)
+    acc *= weight
+    acc >>= WEIGHT_BITS
+    return acc.astype(np.uint8)
+
+
+def mix(current: np.ndarray, upcoming: np.ndarray, weights) -> np.ndarray:
+    """Взвешенная сумма двух кадров; веса в фиксированной точке, сумма не больше WEIGHT_ONE"""
+    current_weight, upcoming_weight = int(weights[0]), int(weights[1])
+    if upcoming_weight == 0:
+        return scale(current, current_weight)
+    if current_weight == 0:
+        return scale(upcoming, upcoming_weight)
+    acc = current.astype(np.uint16)
+    acc *= current_weight
+    acc += upcoming.astype(np.uint16) * upcoming_weight
+    acc >>= WEIGHT_BITS
+    return acc.astype(np.uint8)
+
+
+def slide(current: np.ndarray, upcoming: np.ndarray, alpha: float) -> np.ndarray:
+    """Следующий кадр выталкивает текущий влево"""
+    width = current.shape[1]
+    offset = min(width, max(0, round(width * alpha)))
+    frame = np.empty_like(current)
+    frame[:, :width - offset] = current[:, offset:]
+    frame[:, width - offset:] = upcoming[:, :offset]
+    return frame
+
+
+@lru_cache(maxsize=64)
+def transition_alphas(steps: int) -> np.ndarray:
+    """Прогресс перехода по кадрам, не включая крайние 0 и 1"""
+    return np.arange(1, steps + 1, dtype=np.float64) / (steps + 1)
+
+
+@lru_cache(maxsize=64)
+def transition_ramp(transition: str, steps: int) -> np.ndarray:
+    """Веса (текущий, следующий) для каждого кадра перехода, считаются один раз"""
+    alpha = transition_alphas(steps)
+    if transition in ('dissolve', 'slide', 'zoom'):
+        current = 1 - alpha
+        upcoming = alpha
+    else:
+        current = np.clip(1 - alpha * 2, 0, 1)
+        upcoming = np.clip(alpha * 2 - 1, 0, 1)
+    ramp = np.stack([current, upcoming], axis=1) * WEIGHT_ONE
+    ramp = np.rint(ramp).astype(np.int32)
+    ramp.setflags(write=False)
+    return ramp
+
+
+def ken_burns_boxes(source_size: tuple, progress: np.ndarray, animation: dict, extra_zoom=None) -> np.ndarray:
+    """Окна выборки (left, top, right, bottom) в исходнике для массива прогрессов"""
+    src_w, src_h = source_size
+    zoom_from, zoom_to = animation['zoom']
+    pan_from, pan_to = animation['pan']
+    zoom = zoom_from + (zoom_to - zoom_from) * progress
+    pan = pan_from + (pan_to - pan_from) * progress
+    center_x = src_w / 2 + (src_w - src_w / zoom) / 2 * pan
+    center_y = np.full_like(zoom, src_h / 2)
+    if extra_zoom is not None:
+        zoom = zoom * extra_zoom
+
+    half_w = src_w / zoom / 2
+    half_h = src_h / zoom / 2
+    return np.stack([center_x - half_w, center_y - half_h, center_x + half_w, center_y + half_h], axis=1)
@@ -1,19 +1,43 @@
 import json
 import os
 import base64
-import boto3
+import hmac
 from io import BytesIO
-from PIL import Image, ImageDraw, ImageFont
 import uuid
 
-s3 = boto3.client('s3',
-    endpoint_url='https://bucket.poehali.dev',
-    aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'],
-    aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY'],
+from db import get_db_connection
+from timing import add_bytes, span, traced
+from jobs import ANONYMOUS_OWNER, QUALITIES, enqueue_batch, enqueue_job, get_job, job_owner, load_projects, queue_metrics, render_owner, upgrade_job, video_key
+from scheduler import BATCH_PLAN, DEFAULT_RESOLUTION, RESOLUTIONS, admission_error, capped_resolution, plan_name
+from warm import s3_client, warm
+
+PREVIEW_SIZE = (1280, 720)
+PREVIEW_WIDTHS = (1280, 640, 320)
+PREVIEW_WEBP_QUALITY = int(os.environ.get('PREVIEW_WEBP_QUALITY') or 80)
+PREVIEW_WEBP_METHOD = int(os.environ.get('PREVIEW_WEBP_METHOD') or 0)
+PREVIEW_JPEG_QUALITY = int(os.environ.get('PREVIEW_JPEG_QUALITY') or 85)
+PREVIEW_FORMATS = (
+    ('webp', 'WEBP', {'quality': PREVIEW_WEBP_QUALITY, 'method': PREVIEW_WEBP_METHOD}),
+    ('jpg', 'JPEG', {'quality': PREVIEW_JPEG_QUALITY, 'optimize': True}),
 )
+PREVIEW_UPLOAD_WORKERS = 6
+BATCH_MAX_PROJECTS = 200
+BATCH_API_TOKEN = os.environ.get('BATCH_API_TOKEN') or ''
+
+
+def request_header(event: dict, header: str):
+    return next((value for name, value in (event.get('headers') or {}).items() if name.lower() == header), None)
+
+
+def batch_authorized(event: dict) -> bool:
+    """Пакетный рендер - служебный вызов: заголовок X-Batch-Token должен совпасть с BATCH_API_TOKEN; без токена в окружении выключен"""
+    token = request_header(event, 'x-batch-token')
+    return bool(BATCH_API_TOKEN) and token is not None and hmac.compare_digest(token.encode(), BATCH_API_TOKEN.encode())
 
+
+@traced('generate-video')
 def handler(event: dict, context) -> dict:
-    """API для генерации видео из фотографий с анимацией и переходами"""
+    """API для генерации видео из фотографий: ставит в очередь рендер одного видео или пакета проектов (project_ids) и отдаёт статус"""
     method = event.get('httpMethod', 'POST')
 
     if method == 'OPTIONS':
@@ -21,122 +45,375 @@ def handler(event: dict, context) -> dict:
             'statusCode': 200,
             'headers': {
                 'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type'
+                'Access-Control-Allow-Methods': 'GET, POST, PUT, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Batch-Token, X-Session-Token, X-Profile'
             },
             'body': ''
         }
 
-    if method != 'POST':
+    headers = {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}
+
+    if method not in ('GET', 'POST', 'PUT'):
         return {
             'statusCode': 405,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'headers': headers,
             'body': json.dumps({'error': 'Method not allowed'})
         }
 
+    conn = None
     try:
-        body = json.loads(event.get('body', '{}'))
+        if method == 'GET':
+            query = event.get('queryStringParameters') or {}
+            if 'queue' in query:
+                conn = get_db_connection()
+                return {
+                    'statusCode': 200,
+                    'headers': headers,
+                    'body': json.dumps({'plans': queue_metrics(conn)}, default=str)
+                }
+
+            job_id = query.get('job_id')
+            if not job_id:
+                return {
+                    'statusCode': 400,
+                    'headers': headers,
+                    'body': json.dumps({'error': 'job_id required'})
+                }
+
+            conn = get_db_connection()
+            job = get_job(conn, job_id)
+            if not job:
+                return {
+                    'statusCode': 404,
+                    'headers': headers,
+                    'body': json.dumps({'error': 'Job not found'})
+                }
+
+            return {
+                'statusCode': 200,
+                'headers': headers,
+                'body': json.dumps(dict(job), default=str)
+            }
+
+        if method == 'PUT':
+            body = json.loads(event.get('body') or '{}')
+            job_id = body.get('job_id')
+            if not job_id or body.get('quality') != 'final':
+                return {
+                    'statusCode': 400,
+                    'headers': headers,
+                    'body': json.dumps({'error': 'job_id and quality: final required'})
+                }
+
+            conn = get_db_connection()
+            draft = job_owner(conn, job_id)
+            if not draft:
+                return {
+                    'statusCode': 404,
+                    'headers': headers,
+                    'body': json.dumps({'error': 'Job not found'})
+                }
+
+            owner = render_owner(conn, request_header(event, 'x-session-token'))
+            if draft['user_id'] != owner['user_id']:
+                return {
+                    'statusCode': 403,
+                    'headers': headers,
+                    'body': json.dumps({'error': 'Only the owner of the render can upgrade it'})
+                }
+            plan = plan_name(owner['subscription_plan'])
+            rejection = admission_error(plan, {**draft['params'], 'quality': 'final'}, owner['backlog_cost'])
+            if rejection:
+                status, error = rejection
+                return {
+                    'statusCode': status,
+                    'headers': headers,
+                    'body': json.dumps({'error': error, 'plan': plan})
+                }
+
+            job = upgrade_job(conn, job_id, plan)
+            if not job:
+                return {
+                    'statusCode': 409,
+                    'headers': headers,
+                    'body': json.dumps({'error': 'Only a finished draft can be upgraded'})
+                }
+
+            return {
+                'statusCode': 202,
+                'headers': headers,
+                'body': json.dumps({
+                    'job_id': job['id'],
+                    'video_id': job['video_id'],
+                    'video_url': cdn_url(video_key(job['video_id'])),
+                    'quality': 'final',
+                    'status': job['status'],
+                    'progress': job['progress']
+                })
+            }
+
+        with span('parse', len(event.get('body') or '')):
+            body = json.loads(event.get('body', '{}'))
+        if 'project_ids' in body:
+            project_ids = body['project_ids']
+            resolution = body.get('resolution', DEFAULT_RESOLUTION)
+            if (not isinstance(project_ids, list) or not project_ids or len(project_ids) > BATCH_MAX_PROJECTS
+                    or not all(isinstance(project_id, int) for project_id in project_ids)):
+                return {
+                    'statusCode': 400,
+                    'headers': headers,
+                    'body': json.dumps({'error': f'project_ids must be a list of 1-{BATCH_MAX_PROJECTS} integer ids'})
+                }
+            if resolution not in RESOLUTIONS:
+                return {
+                    'statusCode': 400,
+                    'headers': headers,
+                    'body': json.dumps({'error': f"resolution must be one of: {', '.join(RESOLUTIONS)}"})
+                }
+            if not batch_authorized(event):
+                return {
+                    'statusCode': 403,
+                    'headers': headers,
+                    'body': json.dumps({'error': 'Batch rendering requires a valid X-Batch-Token'})
+                }
+
+            conn = get_db_connection()
+            projects = {project['id']: project for project in load_projects(conn, project_ids)}
+            results = []
+            batch = []
+            for project_id in dict.fromkeys(project_ids):
+                project = projects.get(project_id)
+                if not project or not project['photos']:
+                    results.append({'project_id': project_id, 'status': 'not_found' if not project else 'no_photos'})
+                    continue
+                video_id = str(uuid.uuid4())
+                batch.append({
+                    'project_id': project_id,
+                    'video_id': video_id,
+                    'photos': project['photos'],
+                    'duration': project['duration'] or 5,
+                    'animationType': project['animation_type'] or 'subtle',
+                    'transition': project['transition'] or 'fade',
+                })
+                results.append({'project_id': project_id, 'status': 'queued', 'video_id': video_id,
+                                'video_url': cdn_url(video_key(video_id))})
+            if not batch:
+                return {
+                    'statusCode': 400,
+                    'headers': headers,
+                    'body': json.dumps({'error': 'No projects with photos', 'projects': results})
+                }
+
+            resolution = capped_resolution(resolution, BATCH_PLAN)
+            job = enqueue_batch(conn, str(uuid.uuid4()), {'batch': batch, 'resolution': resolution})
+            photo_refs = [photo.get('content_hash') or photo['url'] for item in batch for photo in item['photos']]
+            return {
+                'statusCode': 202,
+                'headers': headers,
+                'body': json.dumps({
+                    'job_id': job['id'],
+                    'status': job['status'],
+                    'progress': job['progress'],
+                    'resolution': resolution,
+                    'cost': job['cost'],
+                    'photos': len(photo_refs),
+                    'unique_photos': len(set(photo_refs)),
+                    'projects': results
+                })
+            }
+
         photos = body.get('photos', [])
         duration = body.get('duration', 5)
         animation_type = body.get('animationType', 'subtle')
         transition = body.get('transition', 'fade')
+        project_id = body.get('project_id')
+        user_id = body.get('user_id')
+        quality = body.get('quality', 'final')
+        resolution = body.get('resolution', DEFAULT_RESOLUTION)
         
         if not photos or len(photos) == 0:
             return {
                 'statusCode': 400,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'headers': headers,
                 'body': json.dumps({'error': 'No photos provided'})
             }
 
+        if quality not in QUALITIES:
+            return {
+                'statusCode': 400,
+                'headers': headers,
+                'body': json.dumps({'error': f"quality must be one of: {', '.join(QUALITIES)}"})
+            }
+
+        if resolution not in RESOLUTIONS:
+            return {
+                'statusCode': 400,
+                'headers': headers,
+                'body': json.dumps({'error': f"resolution must be one of: {', '.join(RESOLUTIONS)}"})
+            }
+
+        if user_id is not None and not isinstance(user_id, int):
+            return {
+                'statusCode': 400,
+                'headers': headers,
+                'body': json.dumps({'error': 'user_id must be an integer id'})
+            }
+
+        owner = dict(ANONYMOUS_OWNER)
+        session_token = request_header(event, 'x-session-token')
+        if session_token:
+            conn = get_db_connection()
+            owner = render_owner(conn, session_token, project_id, user_id)
+        plan = plan_name(owner['subscription_plan'])
+        resolution = capped_resolution(resolution, plan)
+        rejection = admission_error(plan, {'photos': photos, 'duration': duration, 'quality': quality,
+                                           'resolution': resolution}, owner['backlog_cost'])
+        if rejection:
+            status, error = rejection
+            return {
+                'statusCode': status,
+                'headers': headers,
+                'body': json.dumps({'error': error, 'plan': plan})
+            }
+
         video_id = str(uuid.uuid4())
         
         preview_image = generate_video_preview(photos, duration, animation_type, transition)
+        previews = upload_previews(video_id, encode_previews(preview_image))
         
-        preview_key = f'videos/{video_id}/preview.png'
-        s3.put_object(
-            Bucket='files',
-            Key=preview_key,
-            Body=preview_image,
-            ContentType='image/png'
-        )
+        video_url = cdn_url(video_key(video_id, quality))
         
-        preview_url = f"https://cdn.poehali.dev/projects/{os.environ['AWS_ACCESS_KEY_ID']}/bucket/{preview_key}"
-        
-        video_url = f"https://cdn.poehali.dev/projects/{os.environ['AWS_ACCESS_KEY_ID']}/bucket/videos/{video_id}/output.mp4"
+        settings = {
+            'duration': duration,
+            'animationType': animation_type,
+            'transition': transition,
+            'quality': quality,
+            'resolution': resolution
+        }
+        if conn is None:
+            conn = get_db_connection()
+        job = enqueue_job(conn, video_id, {'photos': photos, **settings}, owner['project_id'], owner['user_id'], plan)
         
         return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'statusCode': 202,
+            'headers': headers,
             'body': json.dumps({
+                'job_id': job['id'],
                 'video_id': video_id,
-                'preview_url': preview_url,
+                'preview_url': previews[0]['url'],
+                'previews': previews,
                 'video_url': video_url,
-                'status': 'completed',
+                'status': job['status'],
+                'progress': job['progress'],
                 'duration': len(photos) * duration,
-                'settings': {
-                    'duration': duration,
-                    'animationType': animation_type,
-                    'transition': transition
-                }
+                'plan': plan,
+                'settings': settings
             })
         }
 
     except Exception as e:
         return {
             'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'headers': headers,
             'body': json.dumps({'error': str(e)})
         }
 
+    finally:
+        if conn is not None:
+            conn.close()
 
-def generate_video_preview(photos: list, duration: int, animation_type: str, transition: str) -> bytes:
-    """Генерирует превью видео с информацией о настройках"""
-    width, height = 1280, 720
-    img = Image.new('RGB', (width, height))
-    draw = ImageDraw.Draw(img)
-    
-    gradient_colors = [
-        (155, 135, 245),
-        (217, 70, 239), 
-        (249, 115, 22)
-    ]
-    
-    for y in range(height):
-        ratio = y / height
-        if ratio < 0.5:
-            r = int(gradient_colors[0][0] + (gradient_colors[1][0] - gradient_colors[0][0]) * ratio * 2)
-            g = int(gradient_colors[0][1] + (gradient_colors[1][1] - gradient_colors[0][1]) * ratio * 2)
-            b = int(gradient_colors[0][2] + (gradient_colors[1][2] - gradient_colors[0][2]) * ratio * 2)
-        else:
-            ratio = (ratio - 0.5) * 2
-            r = int(gradient_colors[1][0] + (gradient_colors[2][0] - gradient_colors[1][0]) * ratio)
-            g = int(gradient_colors[1][1] + (gradient_colors[2][1] - gradient_colors[1][1]) * ratio)
-            b = int(gradient_colors[1][2] + (gradient_colors[2][2] - gradient_colors[1][2]) * ratio)
-        draw.line([(0, y), (width, y)], fill=(r, g, b))
-    
-    overlay = Image.new('RGBA', (width, height), (0, 0, 0, 153))
-    img = Image.alpha_composite(img.convert('RGBA'), overlay).convert('RGB')
-    draw = ImageDraw.Draw(img)
+
+def cdn_url(s3_key: str) -> str:
+    return f"https://cdn.poehali.dev/projects/{os.environ['AWS_ACCESS_KEY_ID']}/bucket/{s3_key}"
+
+
+def downscale(img, width: int):
+    """Уменьшение до ширины width; кратное уменьшение через reduce() в разы быстрее LANCZOS"""
+    from PIL import Image
+
+    factor = img.width // width
+    if factor > 1 and img.width == width * factor and img.height % factor == 0:
+        return img.reduce(factor)
+    return img.resize((width, max(1, round(img.height * width / img.width))), Image.LANCZOS)
+
+
+def encode_previews(img) -> list:
+    """Все варианты превью из одного кадра: размеры от большего к меньшему, каждый во всех PREVIEW_FORMATS"""
+    variants = []
+    current = img
+    for width in PREVIEW_WIDTHS:
+        if width != current.width:
+            with span('resize'):
+                current = downscale(current, width)
+        for extension, image_format, options in PREVIEW_FORMATS:
+            buffer = BytesIO()
+            with span(f'encode_{extension}'):
+                current.save(buffer, format=image_format, **options)
+            add_bytes(f'encode_{extension}', buffer.tell())
+            buffer.seek(0)
+            variants.append({
+                'width': current.width,
+                'height': current.height,
+                'format': extension,
+                'content_type': f'image/{image_format.lower()}',
+                'data': buffer,
+            })
+    return variants
+
+
+def upload_pool():
+    def create():
+        from concurrent.futures import ThreadPoolExecutor
+        return ThreadPoolExecutor(max_workers=PREVIEW_UPLOAD_WORKERS)
+    return warm('preview_uploads', create)
+
+
+def upload_previews(video_id: str, variants: list) -> list:
+    """Параллельная загрузка вариантов в S3; BytesIO уходит в put_object как файл, без getvalue() и копий"""
+    def put(variant: dict) -> dict:
+        key = f"videos/{video_id}/preview-{variant['width']}.{variant['format']}"
+        s3_client().put_object(Bucket='files', Key=key, Body=variant['data'], ContentType=variant['content_type'])
+        return {
+            'width': variant['width'],
+            'height': variant['height'],
+            'format': variant['format'],
+            'bytes': variant['data'].getbuffer().nbytes,
+            'url': cdn_url(key),
+        }
+
+    with span('s3_put', sum(variant['data'].getbuffer().nbytes for variant in variants)):
+        return list(upload_pool().map(put, variants))
+
+
+def generate_video_preview(photos: list, duration: int, animation_type: str, transition: str):
+    """Рисует кадр превью с информацией о настройках; кодирование - в encode_previews"""
+    with span('imports'):
+        from PIL import Image, ImageDraw
+        from compositing import darken, vertical_gradient
+
+    width, height = PREVIEW_SIZE
+    with span('background'):
+        frame = darken(vertical_gradient((width, height)), 0.6)
+        img = Image.fromarray(frame)
+        draw = ImageDraw.Draw(img)
     
-    try:
-        title_text = f"Видео из {len(photos)} фото"
-        info_text = f"{duration}с · {animation_type} · {transition}"
+    with span('draw'):
+        try:
+            title_text = f"Видео из {len(photos)} фото"
+            info_text = f"{duration}с · {animation_type} · {transition}"
         
-        title_bbox = draw.textbbox((0, 0), title_text)
-        title_width = title_bbox[2] - title_bbox[0]
-        title_x = (width - title_width) // 2
+            title_bbox = draw.textbbox((0, 0), title_text)
+            title_width = title_bbox[2] - title_bbox[0]
+            title_x = (width - title_width) // 2
         
-        draw.text((title_x, height // 2 - 40), title_text, fill='white')
+            draw.text((title_x, height // 2 - 40), title_text, fill='white')
         
-        info_bbox = draw.textbbox((0, 0), info_text)
-        info_width = info_bbox[2] - info_bbox[0]
-        info_x = (width - info_width) // 2
+            info_bbox = draw.textbbox((0, 0), info_text)
+            info_width = info_bbox[2] - info_bbox[0]
+            info_x = (width - info_width) // 2
         
-        draw.text((info_x, height // 2 + 20), info_text, fill='white')
-    except:
-        pass
+            draw.text((info_x, height // 2 + 20), info_text, fill='white')
+        except:
+            pass
     
-    buffer = BytesIO()
-    img.save(buffer, format='PNG')
-    buffer.seek(0)
-    return buffer.read()
+    return img
@@ -0,0 +1,281 @@
+import hashlib
+import json
+from typing import Optional
+
+from scheduler import BATCH_PLAN, DEFAULT_PLAN, DRAFT_COST_FACTOR, FAIR_SHARE_WINDOW_MINUTES, estimate_cost, pick
+
+STALE_LOCK_MINUTES = 15
+METRICS_WINDOW_MINUTES = 60
+QUALITIES = ('final', 'draft')
+
+
+def is_draft(params: dict) -> bool:
+    """Черновик не трогает проект: статус и video_url проекта меняет только финальный рендер"""
+    return params.get('quality') == 'draft'
+
+
+def video_key(video_id: str, quality: str = 'final') -> str:
+    return f"videos/{video_id}/{'draft' if quality == 'draft' else 'output'}.mp4"
+
+
+ANONYMOUS_OWNER = {'user_id': None, 'subscription_plan': None, 'backlog_cost': 0, 'project_id': None}
+
+
+def render_owner(conn, session_token: Optional[str], project_id=None, user_id=None) -> dict:
+    """Владелец рендера по сессии X-Session-Token, его тариф (истёкшая подписка - demo) и стоимость его ещё не готовых рендеров.
+
+    user_id и project_id из тела запроса ничего не доказывают: если они не совпадают с пользователем сессии
+    (или сессии нет), рендер считается анонимным - тариф по умолчанию, без проекта и без чужого бэклога.
+    """
+    if not session_token:
+        return dict(ANONYMOUS_OWNER)
+    with conn.cursor() as cur:
+        cur.execute('''
+            SELECT u.id AS user_id,
+                   CASE WHEN u.subscription_expires_at < CURRENT_TIMESTAMP THEN %s ELSE u.subscription_plan END AS subscription_plan,
+                   (SELECT COALESCE(SUM(cost), 0) FROM render_jobs
+                    WHERE user_id = u.id AND status IN ('queued', 'rendering')) AS backlog_cost,
+                   (SELECT id FROM projects WHERE id = %s AND user_id = u.id) AS project_id
+            FROM user_sessions s
+            JOIN users u ON u.id = s.user_id
+            WHERE s.token_hash = %s AND s.expires_at > CURRENT_TIMESTAMP
+        ''', (DEFAULT_PLAN, project_id, hashlib.sha256(session_token.encode()).hexdigest()))
+        owner = cur.fetchone()
+    if not owner or (user_id is not None and user_id != owner['user_id']) or (project_id and owner['project_id'] is None):
+        return dict(ANONYMOUS_OWNER)
+    return owner
+
+
+def enqueue_job(conn, video_id: str, params: dict, project_id=None, user_id=None, plan: str = DEFAULT_PLAN) -> dict:
+    """Ставит рендер в очередь и сразу фиксирует транзакцию"""
+    with conn.cursor() as cur:
+        cur.execute('''
+            INSERT INTO render_jobs (video_id, project_id, params, user_id, plan, cost)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            RETURNING id, video_id, project_id, status, progress, created_at
+        ''', (video_id, project_id, json.dumps(params), user_id, plan, estimate_cost(params)))
+        job = cur.fetchone()
+        if project_id and not is_draft(params):
+            cur.execute('''
+                UPDATE projects SET status = 'processing', updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s
+            ''', (project_id,))
+    conn.commit()
+    return job
+
+
+def load_projects(conn, project_ids: list) -> list:
+    """Проекты с настройками и фото по порядку одним запросом; фото - в виде, который понимает рендер"""
+    with conn.cursor() as cur:
+        cur.execute('''
+            SELECT p.id, p.user_id, p.duration, p.animation_type, p.transition,
+                   COALESCE(json_agg(json_build_object(
+                       'url', pp.photo_url, 'name', pp.photo_name, 'content_hash', pp.content_hash,
+                       'proxy_720_url', pp.proxy_720_url, 'proxy_1080_url', pp.proxy_1080_url
+                   ) ORDER BY pp.position, pp.id) FILTER (WHERE pp.id IS NOT NULL), '[]') AS photos
+            FROM projects p
+            LEFT JOIN project_photos pp ON pp.project_id = p.id
+            WHERE p.id = ANY(%s)
+            GROUP BY p.id
+        ''', (project_ids,))
+        return cur.fetchall()
+
+
+def enqueue_batch(conn, video_id: str, params: dict) -> dict:
+    """Одна задача BATCH_PLAN на все проекты params['batch'] и один UPDATE их статусов"""
+    cost = sum(estimate_cost({**item, 'resolution': params.get('resolution')}) for item in params['batch'])
+    with conn.cursor() as cur:
+        cur.execute('''
+            INSERT INTO render_jobs (video_id, params, plan, cost)
+            VALUES (%s, %s, %s, %s)
+            RETURNING id, video_id, status, progress, cost, created_at
+        ''', (video_id, json.dumps(params), BATCH_PLAN, cost))
+        job = cur.fetchone()
+        cur.execute('''
+            UPDATE projects SET status = 'processing', updated_at = CURRENT_TIMESTAMP
+            WHERE id = ANY(%s)
+        ''', ([item['project_id'] for item in params['batch']],))
+    conn.commit()
+    return job
+
+
+def job_owner(conn, job_id) -> dict:
+    """Владелец и параметры задачи для проверок перед переводом черновика в финал"""
+    with conn.cursor() as cur:
+        cur.execute('SELECT id, user_id, params FROM render_jobs WHERE id = %s', (job_id,))
+        return cur.fetchone()
+
+
+def upgrade_job(conn, job_id, plan: str = DEFAULT_PLAN) -> dict:
+    """Ставит готовый черновик в очередь на финальное качество: та же задача, тот же video_id и кэш исходников"""
+    with conn.cursor() as cur:
+        cur.execute('''
+            UPDATE render_jobs
+            SET params = params || '{"quality": "final"}', cost = cost / %s, plan = %s, status = 'queued', progress = 0,
+                error = NULL, locked_by = NULL, locked_at = NULL, queued_at = CURRENT_TIMESTAMP, started_at = NULL,
+                finished_at = NULL, updated_at = CURRENT_TIMESTAMP
+            WHERE id = %s AND params->>'quality' = 'draft' AND status IN ('completed', 'failed')
+            RETURNING id, video_id, project_id, status, progress, created_at
+        ''', (DRAFT_COST_FACTOR, plan, job_id))
+        job = cur.fetchone()
+        if job and job['project_id']:
+            cur.execute('''
+                UPDATE projects SET status = 'processing', updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s
+            ''', (job['project_id'],))
+    conn.commit()
+    return job
+
+
+def get_job(conn, job_id) -> dict:
+    with conn.cursor() as cur:
+        cur.execute('''
+            SELECT id, video_id, project_id, COALESCE(params->>'quality', 'final') AS quality, plan,
+                   status, progress, video_url, stats, error, created_at, updated_at, finished_at
+            FROM render_jobs WHERE id = %s
+        ''', (job_id,))
+        return cur.fetchone()
+
+
+def claim_job(conn, worker_id: str) -> dict:
+    """Забирает задачу, выбранную scheduler.pick; у одного пользователя черновики идут раньше финальных.
+
+    Выбор идёт под транзакционной advisory-блокировкой: параллельные воркеры выбирают по очереди
+    и видят рендеры друг друга, поэтому лимиты одновременных рендеров не превышаются.
+    Задача без пользователя считается отдельным пользователем: анонимные рендеры не делят
+    между собой лимит одного пользователя, их общий предел - concurrency тарифа.
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext('render_jobs.claim'))")
+        cur.execute('''
+            WITH recent AS (
+                SELECT id, COALESCE(user_id::text, 'job-' || id) AS user_key, plan, cost, queued_at, status = 'rendering' AS rendering,
+                       params->>'quality' = 'draft' AS draft,
+                       status = 'queued'
+                           OR (status = 'rendering' AND locked_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 minute') AS claimable
+                FROM render_jobs
+                WHERE status IN ('queued', 'rendering')
+                   OR started_at > CURRENT_TIMESTAMP - %s * INTERVAL '1 minute'
+            ), heads AS (
+                SELECT DISTINCT ON (user_key) user_key, id, plan, cost, queued_at
+                FROM recent WHERE claimable
+                ORDER BY user_key, draft DESC, queued_at, id
+            )
+            SELECT r.user_key, COALESCE(h.plan, MAX(r.plan)) AS plan,
+                   COUNT(*) FILTER (WHERE r.rendering AND NOT r.claimable) AS running,
+                   COALESCE(SUM(r.cost) FILTER (WHERE NOT r.claimable), 0) AS service,
+                   h.id AS job_id, h.cost AS job_cost, h.queued_at
+            FROM recent r LEFT JOIN heads h ON h.user_key = r.user_key
+            GROUP BY r.user_key, h.id, h.plan, h.cost, h.queued_at
+        ''', (STALE_LOCK_MINUTES, FAIR_SHARE_WINDOW_MINUTES))
+        job_id = pick(cur.fetchall())
+        job = None
+        if job_id is not None:
+            cur.execute('''
+                UPDATE render_jobs
+                SET status = 'rendering', locked_by = %s, locked_at = CURRENT_TIMESTAMP, started_at = CURRENT_TIMESTAMP,
+                    attempts = attempts + 1, progress = 0, updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s
+                RETURNING *
+            ''', (worker_id, job_id))
+            job = cur.fetchone()
+    conn.commit()
+    return job
+
+
+def queue_metrics(conn) -> list:
+    """Глубина очереди и ожидание по тарифам: сейчас в очереди и в рендере, перцентили ожидания за METRICS_WINDOW_MINUTES"""
+    with conn.cursor() as cur:
+        cur.execute('''
+            SELECT plan,
+                   COUNT(*) FILTER (WHERE status = 'queued') AS queued,
+                   COALESCE(SUM(cost) FILTER (WHERE status = 'queued'), 0) AS queued_cost,
+                   COUNT(*) FILTER (WHERE status = 'rendering') AS rendering,
+                   EXTRACT(EPOCH FROM MAX(CURRENT_TIMESTAMP - queued_at) FILTER (WHERE status = 'queued'))::float AS oldest_wait_seconds,
+                   COUNT(*) FILTER (WHERE started_at > CURRENT_TIMESTAMP - %s * INTERVAL '1 minute') AS started,
+                   percentile_cont(0.5) WITHIN GROUP (ORDER BY EXTRACT(EPOCH FROM started_at - queued_at))
+                       FILTER (WHERE started_at > CURRENT_TIMESTAMP - %s * INTERVAL '1 minute') AS wait_p50_seconds,
+                   percentile_cont(0.95) WITHIN GROUP (ORDER BY EXTRACT(EPOCH FROM started_at - queued_at))
+                       FILTER (WHERE started_at > CURRENT_TIMESTAMP - %s * INTERVAL '1 minute') AS wait_p95_seconds
+            FROM render_jobs
+            WHERE status IN ('queued', 'rendering') OR started_at > CURRENT_TIMESTAMP - %s * INTERVAL '1 minute'
+            GROUP BY plan
+            ORDER BY plan
+        ''', (METRICS_WINDOW_MINUTES,) * 4)
+        return cur.fetchall()
+
+
+def update_progress(conn, job_id, progress: int):
+    with conn.cursor() as cur:
+        cur.execute('''
+            UPDATE render_jobs SET progress = %s, locked_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+            WHERE id = %s
+        ''', (progress, job_id))
+    conn.commit()
+
+
+def touch_job(conn, job_id):
+    """Продлевает блокировку задачи без изменения прогресса, чтобы её не забрали как зависшую"""
+    with conn.cursor() as cur:
+        cur.execute('UPDATE render_jobs SET locked_at = CURRENT_TIMESTAMP WHERE id = %s', (job_id,))
+    conn.commit()
+
+
+def complete_job(conn, job: dict, video_url: str, stats: dict):
+    """Завершает задачу и обновляет проект теми же колонками, что и PUT в projects"""
+    with conn.cursor() as cur:
+        cur.execute('''
+            UPDATE render_jobs
+            SET status = 'completed', progress = 100, video_url = %s, stats = %s,
+                updated_at = CURRENT_TIMESTAMP, finished_at = CURRENT_TIMESTAMP
+            WHERE id = %s
+        ''', (video_url, json.dumps(stats), job['id']))
+        if job.get('project_id') and not is_draft(job['params']):
+            cur.execute('''
+                UPDATE projects SET status = 'ready', video_url = %s, updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s
+            ''', (video_url, job['project_id']))
+    conn.commit()
+
+
+def complete_batch(conn, job: dict, results: list, stats: dict):
+    """Завершает пакетную задачу; статусы и video_url всех её проектов - одним UPDATE"""
+    with conn.cursor() as cur:
+        cur.execute('''
+            UPDATE render_jobs
+            SET status = 'completed', progress = 100, stats = %s,
+                updated_at = CURRENT_TIMESTAMP, finished_at = CURRENT_TIMESTAMP
+            WHERE id = %s
+        ''', (json.dumps({**stats, 'projects': results}), job['id']))
+        cur.execute('''
+            UPDATE projects p
+            SET status = r.status, video_url = COALESCE(r.video_url, p.video_url), updated_at = CURRENT_TIMESTAMP
+            FROM unnest(%s::int[], %s::text[], %s::text[]) AS r(id, status, video_url)
+            WHERE p.id = r.id
+        ''', (
+            [result['project_id'] for result in results],
+            [result['status'] for result in results],
+            [result.get('video_url') for result in results],
+        ))
+    conn.commit()
+
+
+def fail_job(conn, job: dict, error: str):
+    conn.rollback()
+    with conn.cursor() as cur:
+        cur.execute('''
+            UPDATE render_jobs
+            SET status = 'failed', error = %s, updated_at = CURRENT_TIMESTAMP, finished_at = CURRENT_TIMESTAMP
+            WHERE id = %s
+        ''', (error, job['id']))
+        if job.get('project_id') and not is_draft(job['params']):
+            cur.execute('''
+                UPDATE projects SET status = 'failed', updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s
+            ''', (job['project_id'],))
+        if job['params'].get('batch'):
+            cur.execute('''
+                UPDATE projects SET status = 'failed', updated_at = CURRENT_TIMESTAMP
+                WHERE id = ANY(%s)
+            ''', ([item['project_id'] for item in job['params']['batch']],))
+    conn.commit()
@@ -0,0 +1,75 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator
+
+PREFETCH_CONCURRENCY = int(os.environ.get('PREFETCH_CONCURRENCY') or 8)
+PREFETCH_MAX_BYTES = int(os.environ.get('PREFETCH_MAX_BYTES') or 256 * 1024 ** 2)
+
+
+class Prefetcher:
+    """Загружает элементы пулом потоков и отдаёт результаты строго по порядку.
+
+    load(item) возвращает (результат, байт в памяти). Загрузки стартуют по порядку, не больше
+    concurrency одновременно; новая не начинается, пока готовые, но ещё не отданные результаты
+    занимают max_bytes и больше. Исключение load пробрасывается потребителю на его позиции.
+    """
+
+    def __init__(self, items: list, load: Callable, concurrency: int = PREFETCH_CONCURRENCY,
+                 max_bytes: int = PREFETCH_MAX_BYTES):
+        self.items = items
+        self.load = load
+        self.concurrency = max(1, concurrency)
+        self.max_bytes = max_bytes
+        self.condition = threading.Condition()
+        self.ready = {}
+        self.started = 0
+        self.consumed = 0
+        self.in_flight = 0
+        self.buffered = 0
+        self.peak_buffered = 0
+        self.closed = False
+
+    def _start_more(self, pool: ThreadPoolExecutor):
+        """Вызывается под condition; позицию, которую ждёт потребитель, запускает даже сверх лимита байт"""
+        while (not self.closed and self.started < len(self.items) and self.in_flight < self.concurrency
+               and (self.buffered < self.max_bytes or self.started == self.consumed)):
+            index = self.started
+            self.started += 1
+            self.in_flight += 1
+            pool.submit(self._run, pool, index)
+
+    def _run(self, pool: ThreadPoolExecutor, index: int):
+        try:
+            value, size = self.load(self.items[index])
+            outcome = (value, size, None)
+        except Exception as e:
+            outcome = (None, 0, e)
+        with self.condition:
+            self.in_flight -= 1
+            self.ready[index] = outcome
+            self.buffered += outcome[1]
+            self.peak_buffered = max(self.peak_buffered, self.buffered)
+            self._start_more(pool)
+            self.condition.notify_all()
+
+    def __iter__(self) -> Iterator:
+        pool = ThreadPoolExecutor(max_workers=self.concurrency)
+        try:
+            with self.condition:
+                self._start_more(pool)
+            for index in range(len(self.items)):
+                with self.condition:
+                    while index not in self.ready:
+                        self.condition.wait()
+                    value, size, error = self.ready.pop(index)
+                    self.buffered -= size
+                    self.consumed = index + 1
+                    self._start_more(pool)
+                if error is not None:
+                    raise error
+                yield value
+        finally:
+            with self.condition:
+                self.closed = True
+            pool.shutdown(wait=True, cancel_futures=True)
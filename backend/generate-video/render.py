@@ -0,0 +1,512 @@
+import subprocess
+import tempfile
+import time
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Callable, Iterator, Optional
+from PIL import Image, ImageOps
+
+import imageio_ffmpeg
+import numpy as np
+import urllib3
+
+from cache import content_digest, segment_cache, source_cache
+from compositing import ken_burns_boxes, mix, slide, transition_alphas, transition_ramp, vertical_gradient
+from prefetch import PREFETCH_CONCURRENCY, Prefetcher
+from thumbnails import capture, empty_thumbnails, thumbnail_tag, write_sprites
+from warm import warm
+
+TARGET_FPS_PER_CORE = 30
+RENDER_WORKERS = int(os.environ.get('RENDER_WORKERS') or os.cpu_count() or 1)
+ENCODER_THREADS = 1
+RENDER_VERSION = 1
+TRANSITION_SECONDS = 1.0
+FETCH_TIMEOUT = 15
+DRAFT_SCALE = float(os.environ.get('DRAFT_SCALE') or 0.375)
+DRAFT_FRAME_STEP = int(os.environ.get('DRAFT_FRAME_STEP') or 2)
+
+QUALITIES = {
+    'final': {'scale': 1.0, 'frame_step': 1},
+    'draft': {'scale': DRAFT_SCALE, 'frame_step': DRAFT_FRAME_STEP},
+}
+
+PROXIES = (
+    ('proxy_720_url', (1600, 900)),
+    ('proxy_1080_url', (2400, 1350)),
+)
+
+ANIMATIONS = {
+    'subtle': {'zoom': (1.0, 1.05), 'pan': (0.0, 0.0)},
+    'medium': {'zoom': (1.0, 1.12), 'pan': (0.0, 0.0)},
+    'dynamic': {'zoom': (1.0, 1.2), 'pan': (-0.3, 0.3)},
+    'zoom': {'zoom': (1.0, 1.25), 'pan': (0.0, 0.0)},
+    'pan': {'zoom': (1.15, 1.15), 'pan': (-1.0, 1.0)},
+}
+
+@dataclass(frozen=True)
+class RenderSpec:
+    """Настройки рендера. width, height и fps задают геометрию и шкалу времени, общие для всех качеств;
+    scale и frame_step уменьшают только выходной кадр и частоту: кадр номер n всегда в момент n / fps.
+    """
+    width: int = 1280
+    height: int = 720
+    fps: int = 30
+    duration: float = 5
+    animation_type: str = 'subtle'
+    transition: str = 'fade'
+    scale: float = 1.0
+    frame_step: int = 1
+
+    @classmethod
+    def for_quality(cls, quality: str, **settings) -> 'RenderSpec':
+        return cls(**QUALITIES.get(quality, QUALITIES['final']), **settings)
+
+    @property
+    def size(self) -> tuple:
+        return (self.width, self.height)
+
+    @property
+    def output_size(self) -> tuple:
+        """Чётные стороны: yuv420p не кодирует нечётные"""
+        return (max(2, round(self.width * self.scale / 2) * 2), max(2, round(self.height * self.scale / 2) * 2))
+
+    @property
+    def is_final(self) -> bool:
+        return self.scale == 1.0 and self.frame_step == 1
+
+    def output_frames(self, start: int, count: int) -> int:
+        """Сколько кадров шкалы [start, start + count) попадает в выход: номера, кратные frame_step"""
+        return -(-(start + count) // self.frame_step) + (-start // self.frame_step)
+
+    @property
+    def frames_per_photo(self) -> int:
+        return max(1, round(self.duration * self.fps))
+
+    @property
+    def transition_frames(self) -> int:
+        seconds = min(TRANSITION_SECONDS, self.duration / 2)
+        return max(1, round(seconds * self.fps))
+
+    @property
+    def animation(self) -> dict:
+        return ANIMATIONS.get(self.animation_type, ANIMATIONS['subtle'])
+
+
+def photo_url(photo, spec: RenderSpec) -> str:
+    """Самая маленькая копия фото, которой хватает для кадра без увеличения"""
+    if not isinstance(photo, dict):
+        return str(photo)
+    needed = source_size(spec)
+    for field, covers in PROXIES:
+        if photo.get(field) and covers[0] >= needed[0] and covers[1] >= needed[1]:
+            return photo[field]
+    return photo.get('url', '')
+
+
+def placeholder_source(spec: RenderSpec) -> Image.Image:
+    """Подставляется вместо фото, которое не удалось скачать"""
+    return Image.fromarray(vertical_gradient(spec.size))
+
+
+def http_pool() -> urllib3.PoolManager:
+    """Keep-alive соединения к CDN; свои в каждом процессе, чтобы воркеры пула не делили сокеты родителя"""
+    return warm(f'http-{os.getpid()}', lambda: urllib3.PoolManager(
+        maxsize=PREFETCH_CONCURRENCY, retries=False, timeout=FETCH_TIMEOUT,
+    ))
+
+
+def fetch_photo(url: str) -> bytes:
+    if not url.startswith(('http://', 'https://')):
+        raise ValueError(f'unsupported photo url: {url!r}')
+    try:
+        response = http_pool().request('GET', url)
+    except urllib3.exceptions.HTTPError as e:
+        raise OSError(f'{url}: {e}') from e
+    if response.status >= 400:
+        raise OSError(f'{url}: HTTP {response.status}')
+    return response.data
+
+
+def segment_key(digest: Optional[str], upcoming: str, spec: RenderSpec, start: int = 0) -> str:
+    """Всё, от чего зависят кадры сегмента: соседние фото и настройки рендера; upcoming = 'end' у последнего"""
+    parts = [
+        f'v{RENDER_VERSION}', digest or 'missing', upcoming,
+        spec.animation_type, spec.transition, str(spec.duration),
+        f'{spec.width}x{spec.height}@{spec.fps}',
+    ]
+    if not spec.is_final:
+        width, height = spec.output_size
+        parts.append(f'{width}x{height}/{spec.frame_step}+{start % spec.frame_step}')
+    return content_digest('|'.join(parts).encode())
+
+
+def source_size(spec: RenderSpec) -> tuple:
+    """Размер исходника: кадр с запасом на максимальный зум анимации"""
+    max_zoom = max(spec.animation['zoom'])
+    return (round(spec.width * max_zoom), round(spec.height * max_zoom))
+
+
+def fit_source(img: Image.Image, spec: RenderSpec) -> Image.Image:
+    return ImageOps.fit(img, source_size(spec), Image.LANCZOS)
+
+
+def decode_source(data: bytes, spec: RenderSpec) -> Image.Image:
+    img = ImageOps.exif_transpose(Image.open(BytesIO(data)))
+    return fit_source(img.convert('RGB'), spec)
+
+
+def download_source(url: str, spec: RenderSpec) -> tuple:
+    """Скачивает фото: (хэш содержимого или None, исходник); при ошибке - заглушка"""
+    try:
+        data = fetch_photo(url)
+    except (OSError, ValueError):
+        return None, fit_source(placeholder_source(spec), spec)
+
+    size = source_size(spec)
+    digest = content_digest(data)
+    source_cache.remember_url(url, digest, len(data))
+    cached = source_cache.get(digest, size)
+    if cached is not None:
+        return digest, Image.fromarray(cached)
+
+    try:
+        source = decode_source(data, spec)
+    except (OSError, ValueError):
+        return digest, fit_source(placeholder_source(spec), spec)
+    source_cache.put(digest, size, np.asarray(source))
+    return digest, source
+
+
+def load_source(photo, spec: RenderSpec) -> Image.Image:
+    """Исходник из кэша по хэшу содержимого, иначе скачивание и декодирование"""
+    url = photo_url(photo, spec)
+    digest = source_cache.digest_for_url(url)
+    if digest:
+        cached = source_cache.get(digest, source_size(spec))
+        if cached is not None:
+            return Image.fromarray(cached)
+    return download_source(url, spec)[1]
+
+
+def prefetched_source(photo, digest: Optional[str], spec: RenderSpec) -> Image.Image:
+    """Исходник, который предзагрузка уже скачала: по хэшу из кэша; хэш None - фото не скачалось, заглушка.
+
+    Нужен процессам пула: они запущены до предзагрузки и не видят ни её исходников, ни pin.
+    """
+    if digest is None:
+        return fit_source(placeholder_source(spec), spec)
+    cached = source_cache.get(digest, source_size(spec))
+    if cached is not None:
+        return Image.fromarray(cached)
+    return load_source(photo, spec)
+
+
+def prefetch_source(photo, spec: RenderSpec) -> tuple:
+    """Шаг предзагрузки: ((хэш, исходник), байт в памяти).
+
+    Для CDN-ссылки с известным хэшем ничего не скачивается: исходник None, сегмент может
+    оказаться в кэше целиком, а если нет - load_source прочитает исходник с диска. Сэкономленные
+    байты загрузки считаются здесь, один раз на фото, если исходник лежит на диске.
+    """
+    url = photo_url(photo, spec)
+    digest, download_bytes = source_cache.lookup_url(url)
+    if digest:
+        if source_cache.contains(digest, source_size(spec)):
+            source_cache.skip_download(download_bytes)
+        return (digest, None), 0
+    digest, source = download_source(url, spec)
+    return (digest, source), source.width * source.height * len(source.getbands())
+
+
+def iter_sources(photos: list, spec: RenderSpec) -> Iterator[tuple]:
+    """(индекс, хэш, исходник, хэш следующего, исходник следующего) по порядку, пока следующие фото ещё качаются"""
+    previous = None
+    for index, (digest, source) in enumerate(Prefetcher(photos, lambda photo: prefetch_source(photo, spec))):
+        if previous is not None:
+            yield (index - 1, *previous, digest, source)
+        previous = (digest, source)
+    if previous is not None:
+        yield (len(photos) - 1, *previous, None, None)
+
+
+def prefetch_batch(entries: list, on_loaded: Optional[Callable[[], None]] = None) -> dict:
+    """Общие фото пакета: каждая ссылка скачивается один раз, декодируется по разу на каждый нужный размер.
+
+    entries - пары (фото, RenderSpec) всех проектов. Хэши скачанного закрепляются в source_cache.pin,
+    поэтому render_video проектов берёт исходники из кэша, не скачивая их снова. on_loaded
+    вызывается после каждой ссылки.
+    """
+    needed = {}
+    for photo, spec in entries:
+        needed.setdefault(photo_url(photo, spec), {})[source_size(spec)] = spec
+
+    def load(item: tuple) -> tuple:
+        url, specs = item
+        try:
+            data = fetch_photo(url)
+        except (OSError, ValueError):
+            return (url, None, 0), 0
+        digest = content_digest(data)
+        source_cache.remember_url(url, digest, len(data))
+        for size, spec in specs.items():
+            if source_cache.contains(digest, size):
+                continue
+            try:
+                source = decode_source(data, spec)
+            except (OSError, ValueError):
+                return (url, None, len(data)), 0
+            source_cache.put(digest, size, np.asarray(source))
+        return (url, digest, len(data)), 0
+
+    downloaded = 0
+    for url, digest, size in Prefetcher(list(needed.items()), load):
+        downloaded += size
+        if digest:
+            source_cache.pin(url, digest, size)
+        if on_loaded is not None:
+            on_loaded()
+    return {'photos': len(entries), 'unique_photos': len(needed), 'download_bytes': downloaded}
+
+
+def sample(source: Image.Image, box, spec: RenderSpec) -> np.ndarray:
+    return np.asarray(source.resize(spec.output_size, Image.BILINEAR, box=tuple(box)))
+
+
+def scaled_source(source: Image.Image, spec: RenderSpec) -> Image.Image:
+    """Для черновика исходник уменьшается один раз на сегмент, а не в каждом кадре; рамки Ken Burns относительны"""
+    if spec.scale >= 1:
+        return source
+    size = (max(1, round(source.width * spec.scale)), max(1, round(source.height * spec.scale)))
+    return source.resize(size, Image.BILINEAR, reducing_gap=2.0)
+
+
+def iter_segment_frames(current: Image.Image, upcoming: Optional[Image.Image], spec: RenderSpec,
+                        start: int = 0) -> Iterator[np.ndarray]:
+    """Кадры одного фото вместе с исходящим переходом к следующему.
+
+    start - номер первого кадра сегмента на общей шкале; при frame_step > 1 выводятся только
+    кадры с номерами, кратными frame_step, поэтому черновик совпадает с финалом по времени.
+    """
+    total = spec.frames_per_photo
+    lead = spec.transition_frames
+    span = total + lead
+    transition_start = total - lead
+
+    def kept(index: int) -> bool:
+        return (start + index) % spec.frame_step == 0
+
+    current_boxes = ken_burns_boxes(current.size, (np.arange(total) + lead) / span, spec.animation)
+    if upcoming is None:
+        for index, box in enumerate(current_boxes):
+            if kept(index):
+                yield sample(current, box, spec)
+        return
+
+    alphas = transition_alphas(lead)
+    ramp = transition_ramp(spec.transition, lead)
+    upcoming_boxes = ken_burns_boxes(upcoming.size, np.arange(lead) / span, spec.animation)
+    if spec.transition == 'zoom':
+        current_boxes[transition_start:] = ken_burns_boxes(
+            current.size, (np.arange(transition_start, total) + lead) / span, spec.animation, 1 + alphas * 0.5
+        )
+
+    for index in range(transition_start):
+        if kept(index):
+            yield sample(current, current_boxes[index], spec)
+    for step in range(lead):
+        if not kept(transition_start + step):
+            continue
+        current_weight, upcoming_weight = ramp[step]
+        frame = sample(current, current_boxes[transition_start + step], spec) if current_weight or not upcoming_weight else None
+        incoming = sample(upcoming, upcoming_boxes[step], spec) if upcoming_weight else None
+        if spec.transition == 'slide':
+            yield slide(frame, incoming, alphas[step])
+        else:
+            yield mix(frame, incoming, ramp[step])
+
+
+def run_ffmpeg(args: list, frames: Optional[Iterator[np.ndarray]] = None) -> int:
+    """Запускает ffmpeg, при наличии кадров передаёт их по одному через stdin"""
+    command = [imageio_ffmpeg.get_ffmpeg_exe(), '-y', '-loglevel', 'error', *args]
+    count = 0
+    with tempfile.TemporaryFile() as log:
+        process = subprocess.Popen(command, stdin=subprocess.PIPE if frames is not None else subprocess.DEVNULL, stderr=log)
+        try:
+            for frame in frames or ():
+                process.stdin.write(memoryview(np.ascontiguousarray(frame)))
+                count += 1
+        except BrokenPipeError:
+            pass
+        finally:
+            if process.stdin:
+                process.stdin.close()
+            code = process.wait()
+        if code != 0:
+            log.seek(0)
+            raise RuntimeError(f'ffmpeg failed: {log.read().decode(errors="replace")[-500:]}')
+    return count
+
+
+def encode_frames(frames: Iterator[np.ndarray], output_path: str, spec: RenderSpec) -> int:
+    """Кодирует поток кадров в H.264; настройки одинаковы для всех сегментов, чтобы их можно было склеить без перекодирования"""
+    return run_ffmpeg([
+        '-f', 'rawvideo', '-pix_fmt', 'rgb24',
+        '-s', '{}x{}'.format(*spec.output_size), '-r', f'{spec.fps}/{spec.frame_step}',
+        '-i', '-',
+        '-c:v', 'libx264', '-preset', 'veryfast', '-pix_fmt', 'yuv420p', '-threads', str(ENCODER_THREADS),
+        output_path,
+    ], frames)
+
+
+def concat_segments(segment_paths: list, output_path: str):
+    """Склеивает сегменты по порядку без перекодирования"""
+    list_path = f'{output_path}.txt'
+    with open(list_path, 'w') as listing:
+        listing.writelines(f"file '{path}'\n" for path in segment_paths)
+    run_ffmpeg(['-f', 'concat', '-safe', '0', '-i', list_path, '-c', 'copy', '-movflags', '+faststart', output_path])
+    os.remove(list_path)
+
+
+def render_segment(photos: list, index: int, spec: RenderSpec, output_path: str,
+                   current: Optional[Image.Image] = None, upcoming: Optional[Image.Image] = None,
+                   digests: Optional[tuple] = None) -> dict:
+    """Сегмент = фото index и его исходящий переход; не зависит от остальных сегментов.
+
+    Уже загруженные исходники можно передать в current и upcoming, недостающие берутся через load_source,
+    а если предзагрузка уже выяснила хэши фото и следующего (digests) - через prefetched_source.
+    Миниатюры для спрайта снимаются с тех же кадров по пути в ffmpeg.
+    """
+    cache_before = dict(source_cache.stats)
+
+    def load(position: int) -> Image.Image:
+        if digests is None:
+            return load_source(photos[position], spec)
+        return prefetched_source(photos[position], digests[position - index], spec)
+
+    if current is None:
+        current = load(index)
+    if upcoming is None and index + 1 < len(photos):
+        upcoming = load(index + 1)
+    current = scaled_source(current, spec)
+    upcoming = scaled_source(upcoming, spec) if upcoming is not None else None
+    start = index * spec.frames_per_photo
+    thumbnails = []
+    frames = encode_frames(capture(iter_segment_frames(current, upcoming, spec, start), start, spec, thumbnails),
+                           output_path, spec)
+    return {
+        'frames': frames,
+        'thumbnails': np.stack(thumbnails) if thumbnails else empty_thumbnails(spec),
+        'cache': {key: value - cache_before[key] for key, value in source_cache.stats.items()},
+    }
+
+
+def store_segment(key: str, path: str, result: dict, thumbnails: dict, index: int, spec: RenderSpec):
+    segment_cache.store(key, path)
+    segment_cache.put_thumbnails(key, thumbnail_tag(spec, index * spec.frames_per_photo), result['thumbnails'])
+    thumbnails[index] = result['thumbnails']
+
+
+def add_cache_stats(total: dict, delta: dict):
+    for key, value in delta.items():
+        total[key] = total.get(key, 0) + value
+
+
+def summarize_cache(cache: dict) -> dict:
+    hits = cache['disk_hits'] + cache['s3_hits']
+    return {**cache, 'hit_rate': round(hits / cache['lookups'], 3) if cache['lookups'] else 0.0}
+
+
+def start_pool(workers: int) -> ProcessPoolExecutor:
+    """Пул процессов, запущенный до потоков предзагрузки: fork при живых потоках наследует захваченные ими блокировки"""
+    pool = ProcessPoolExecutor(max_workers=workers)
+    pool.submit(int).result()
+    return pool
+
+
+def render_video(photos: list, spec: RenderSpec, output_path: str,
+                 on_progress: Optional[Callable[[int, int], None]] = None, workers: Optional[int] = None,
+                 thumbnails_dir: Optional[str] = None, pool: Optional[ProcessPoolExecutor] = None) -> dict:
+    """Рендерит mp4 из списка фото по сегментам, последовательно или в пуле процессов.
+
+    Пул можно передать свой (start_pool), чтобы несколько видео подряд шли через одни и те же процессы.
+
+    С thumbnails_dir туда же пишутся листы миниатюр и их индексы (thumbnails.write_sprites).
+
+    Фото качаются и декодируются заранее и параллельно (prefetch.Prefetcher); сегмент уходит
+    в рендер, как только готовы его фото и следующее, не дожидаясь остальных загрузок.
+    """
+    workers = max(1, min(workers or RENDER_WORKERS, len(photos)))
+    total = spec.output_frames(0, len(photos) * spec.frames_per_photo)
+    started = time.perf_counter()
+    cache_before = dict(source_cache.stats)
+    cache = dict.fromkeys(source_cache.stats, 0)
+    counts = {'done': 0, 'rendered': 0, 'reused': 0, 'segments_reused': 0}
+
+    def finished(frames: int, rendered: bool):
+        counts['done'] += frames
+        counts['rendered' if rendered else 'reused'] += frames
+        counts['segments_reused'] += 0 if rendered else 1
+        if on_progress is not None:
+            on_progress(counts['done'], total)
+
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(output_path))) as workdir:
+        segment_paths = [os.path.join(workdir, f'segment-{index:05d}.mp4') for index in range(len(photos))]
+        keys = {}
+        thumbnails = {}
+        futures = {}
+        own_pool = pool is None and workers > 1
+        if own_pool:
+            pool = start_pool(workers)
+        try:
+            for index, digest, current, upcoming_digest, upcoming in iter_sources(photos, spec):
+                upcoming_key = 'end' if index + 1 == len(photos) else upcoming_digest or 'missing'
+                start = index * spec.frames_per_photo
+                keys[index] = segment_key(digest, upcoming_key, spec, start)
+                thumbnails[index] = segment_cache.get_thumbnails(keys[index], thumbnail_tag(spec, start))
+                if thumbnails[index] is not None and segment_cache.fetch(keys[index], segment_paths[index]):
+                    finished(spec.output_frames(start, spec.frames_per_photo), False)
+                elif pool is None:
+                    result = render_segment(photos, index, spec, segment_paths[index], current, upcoming)
+                    store_segment(keys[index], segment_paths[index], result, thumbnails, index, spec)
+                    finished(result['frames'], True)
+                else:
+                    futures[pool.submit(render_segment, photos, index, spec, segment_paths[index],
+                                        digests=(digest, upcoming_digest))] = index
+            for future in as_completed(futures):
+                result = future.result()
+                index = futures[future]
+                store_segment(keys[index], segment_paths[index], result, thumbnails, index, spec)
+                add_cache_stats(cache, result['cache'])
+                finished(result['frames'], True)
+        finally:
+            if own_pool:
+                pool.shutdown(cancel_futures=True)
+        concat_segments(segment_paths, output_path)
+
+    sprites = None
+    if thumbnails_dir is not None:
+        ordered = np.concatenate([thumbnails[index] for index in range(len(photos))])
+        sprites = write_sprites(ordered, spec, len(photos) * spec.frames_per_photo, thumbnails_dir)
+
+    add_cache_stats(cache, {key: value - cache_before[key] for key, value in source_cache.stats.items()})
+    count = counts['rendered']
+    reused = counts['segments_reused']
+    elapsed = time.perf_counter() - started
+    fps = count / elapsed if elapsed > 0 else 0.0
+    return {
+        'frames': count + counts['reused'],
+        'frames_rendered': count,
+        'segments': len(photos),
+        'segments_rendered': len(photos) - reused,
+        'segments_reused': reused,
+        'workers': workers,
+        'seconds': round(elapsed, 3),
+        'fps': round(fps, 1),
+        'fps_per_core': round(fps / workers, 1),
+        'target_fps_per_core': TARGET_FPS_PER_CORE,
+        'bytes': os.path.getsize(output_path),
+        'source_cache': summarize_cache(cache),
+        'thumbnails': sprites,
+    }
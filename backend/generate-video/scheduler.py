@@ -0,0 +1,114 @@
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+FAIR_SHARE_WINDOW_MINUTES = float(os.environ.get('FAIR_SHARE_WINDOW_MINUTES') or 15)
+DEFAULT_PLAN = 'demo'
+BATCH_PLAN = 'backoffice'
+DEFAULT_RESOLUTION = '720p'
+DRAFT_COST_FACTOR = 0.15
+
+RESOLUTIONS = {
+    '720p': (1280, 720),
+    '1080p': (1920, 1080),
+    '2160p': (3840, 2160),
+}
+
+
+@dataclass(frozen=True)
+class Plan:
+    """Лимиты тарифа; стоимость - секунды видео в пересчёте на 720p (estimate_cost).
+
+    weight делится поровну между активными пользователями тарифа; concurrency и user_concurrency -
+    одновременные рендеры тарифа и одного пользователя (None - без лимита); max_job_cost и
+    max_backlog_cost - допуск в очередь одной задачи и всего недоделанного у пользователя.
+    """
+    weight: float
+    concurrency: Optional[int]
+    user_concurrency: int
+    max_resolution: str
+    max_job_cost: Optional[float]
+    max_backlog_cost: Optional[float]
+
+
+PLANS = {
+    'demo': Plan(weight=1, concurrency=2, user_concurrency=1, max_resolution='720p',
+                 max_job_cost=60, max_backlog_cost=120),
+    'pro': Plan(weight=4, concurrency=8, user_concurrency=2, max_resolution='1080p',
+                max_job_cost=450, max_backlog_cost=2000),
+    'enterprise': Plan(weight=8, concurrency=None, user_concurrency=4, max_resolution='2160p',
+                       max_job_cost=None, max_backlog_cost=None),
+    BATCH_PLAN: Plan(weight=2, concurrency=1, user_concurrency=1, max_resolution='1080p',
+                     max_job_cost=None, max_backlog_cost=None),
+}
+
+
+def plan_name(subscription_plan: Optional[str]) -> str:
+    """Тариф из users.subscription_plan; неизвестные и пустые считаются demo, служебный BATCH_PLAN тоже"""
+    name = (subscription_plan or '').lower()
+    return name if name in PLANS and name != BATCH_PLAN else DEFAULT_PLAN
+
+
+def queue_plan(plan: Optional[str]) -> str:
+    """Тариф, записанный в задаче очереди; в отличие от plan_name, пакетный BATCH_PLAN допустим"""
+    return plan if plan in PLANS else DEFAULT_PLAN
+
+
+def capped_resolution(resolution: str, plan: str) -> str:
+    cap = PLANS[queue_plan(plan)].max_resolution
+    return resolution if RESOLUTIONS[resolution][1] <= RESOLUTIONS[cap][1] else cap
+
+
+def estimate_cost(params: dict) -> float:
+    """len(photos) * duration с поправкой на число пикселей относительно 720p; черновик в разы дешевле финала"""
+    width, height = RESOLUTIONS.get(params.get('resolution'), RESOLUTIONS[DEFAULT_RESOLUTION])
+    cost = len(params.get('photos') or ()) * float(params.get('duration', 5)) * width * height / (1280 * 720)
+    return cost * (DRAFT_COST_FACTOR if params.get('quality') == 'draft' else 1.0)
+
+
+def admission_error(plan: str, params: dict, backlog_cost: float) -> Optional[tuple]:
+    """(HTTP-статус, текст ошибки), если тариф не пускает задачу в очередь, иначе None.
+
+    Лимит одной задачи считается по финальному качеству: черновик потом можно перевести в финал.
+    """
+    limits = PLANS[queue_plan(plan)]
+    final_cost = estimate_cost({**params, 'quality': 'final'})
+    if limits.max_job_cost is not None and final_cost > limits.max_job_cost:
+        return 403, f'Render cost {final_cost:g} exceeds the {plan} plan limit of {limits.max_job_cost:g}'
+    if limits.max_backlog_cost is not None and backlog_cost + estimate_cost(params) > limits.max_backlog_cost:
+        return 429, f'Too many unfinished renders for the {plan} plan, try again later'
+    return None
+
+
+def pick(users: list) -> Optional[int]:
+    """Следующая задача по взвешенному справедливому разделению воркеров между тарифами и пользователями.
+
+    users - строка на пользователя: plan, running (идущие рендеры), service (стоимость начатого за
+    FAIR_SHARE_WINDOW_MINUTES и ещё идущего) и job_id, job_cost, queued_at первой задачи его очереди
+    (job_id None, если ждущих нет). Вес тарифа делится между его активными пользователями, побеждает
+    наименьшая (service + job_cost) / доля, при равенстве - дольше ждущая задача. Пользователи и
+    тарифы, упёршиеся в лимит одновременных рендеров, пропускаются.
+    """
+    running = {}
+    active = {}
+    for user in users:
+        plan = queue_plan(user['plan'])
+        running[plan] = running.get(plan, 0) + user['running']
+        if user['running'] or user['job_id'] is not None:
+            active[plan] = active.get(plan, 0) + 1
+
+    best = None
+    for user in users:
+        if user['job_id'] is None:
+            continue
+        plan = queue_plan(user['plan'])
+        limits = PLANS[plan]
+        if user['running'] >= limits.user_concurrency:
+            continue
+        if limits.concurrency is not None and running[plan] >= limits.concurrency:
+            continue
+        share = limits.weight / active[plan]
+        rank = ((user['service'] + user['job_cost']) / share, user['queued_at'])
+        if best is None or rank < best[0]:
+            best = (rank, user['job_id'])
+    return best[1] if best else None
@@ -0,0 +1,108 @@
+import json
+import os
+from typing import Iterator
+
+import numpy as np
+from PIL import Image
+
+THUMBNAIL_INTERVAL = float(os.environ.get('THUMBNAIL_INTERVAL') or 2.0)
+THUMBNAIL_WIDTH = int(os.environ.get('THUMBNAIL_WIDTH') or 160)
+THUMBNAIL_JPEG_QUALITY = int(os.environ.get('THUMBNAIL_JPEG_QUALITY') or 75)
+SPRITE_COLUMNS = 10
+SPRITE_ROWS = 10
+INDEX_VTT = 'thumbnails.vtt'
+INDEX_JSON = 'thumbnails.json'
+
+
+def thumbnail_size(spec) -> tuple:
+    """По геометрии рендера, а не по выходному кадру: у черновика и финала одинаковые миниатюры"""
+    return (THUMBNAIL_WIDTH, max(2, round(THUMBNAIL_WIDTH * spec.height / spec.width / 2) * 2))
+
+
+def interval_frames(spec) -> int:
+    """Шаг миниатюр в кадрах шкалы; кратен frame_step, чтобы нужные кадры были и в черновике"""
+    frames = max(1, round(THUMBNAIL_INTERVAL * spec.fps))
+    return -(-frames // spec.frame_step) * spec.frame_step
+
+
+def thumbnail_tag(spec, start: int) -> str:
+    """Настройки миниатюр для ключа кэша рядом с ключом сегмента.
+
+    Какие кадры сегмента попадут в миниатюры, зависит от его положения на шкале: start % interval
+    входит в тег, иначе сегмент, сдвинутый по шкале, вернул бы миниатюры со старой сеткой.
+    """
+    interval = interval_frames(spec)
+    return 'thumbs-{}f+{}-{}x{}'.format(interval, start % interval, *thumbnail_size(spec))
+
+
+def empty_thumbnails(spec) -> np.ndarray:
+    width, height = thumbnail_size(spec)
+    return np.zeros((0, height, width, 3), dtype=np.uint8)
+
+
+def capture(frames: Iterator[np.ndarray], start: int, spec, thumbnails: list) -> Iterator[np.ndarray]:
+    """Пропускает кадры сегмента дальше без изменений и уменьшает копии тех, что попадают на шаг миниатюр.
+
+    start - номер первого кадра сегмента на общей шкале; из сегмента выходят только кадры,
+    кратные frame_step, поэтому номер n-го из них - first + n * frame_step.
+    """
+    step = spec.frame_step
+    first = -(-start // step) * step
+    interval = interval_frames(spec)
+    size = thumbnail_size(spec)
+    for offset, frame in enumerate(frames):
+        if (first + offset * step) % interval == 0:
+            thumbnails.append(np.asarray(Image.fromarray(frame).resize(size, Image.BILINEAR, reducing_gap=2.0)))
+        yield frame
+
+
+def write_sprites(thumbnails: np.ndarray, spec, total_frames: int, directory: str) -> dict:
+    """Склеивает миниатюры в листы SPRITE_COLUMNS x SPRITE_ROWS и пишет индексы WebVTT и JSON.
+
+    Миниатюра k показывает кадр k * interval и закрывает отрезок до следующей; последняя - до конца видео.
+    """
+    width, height = thumbnail_size(spec)
+    per_sheet = SPRITE_COLUMNS * SPRITE_ROWS
+    interval = interval_frames(spec) / spec.fps
+    duration = total_frames / spec.fps
+    sheets = []
+    cues = []
+    for sheet_start in range(0, len(thumbnails), per_sheet):
+        batch = thumbnails[sheet_start:sheet_start + per_sheet]
+        rows = -(-len(batch) // SPRITE_COLUMNS)
+        columns = min(len(batch), SPRITE_COLUMNS)
+        grid = np.zeros((rows * height, columns * width, 3), dtype=np.uint8)
+        name = f'sprite-{len(sheets)}.jpg'
+        for position, thumbnail in enumerate(batch):
+            row, column = divmod(position, SPRITE_COLUMNS)
+            x, y = column * width, row * height
+            grid[y:y + height, x:x + width] = thumbnail
+            number = sheet_start + position
+            cues.append({
+                'start': round(number * interval, 3),
+                'end': round(min(duration, (number + 1) * interval), 3),
+                'sheet': name,
+                'x': x, 'y': y, 'w': width, 'h': height,
+            })
+        Image.fromarray(grid).save(os.path.join(directory, name), format='JPEG',
+                                   quality=THUMBNAIL_JPEG_QUALITY, optimize=True)
+        sheets.append(name)
+    if cues:
+        cues[-1]['end'] = round(duration, 3)
+
+    with open(os.path.join(directory, INDEX_VTT), 'w') as vtt:
+        vtt.write('WEBVTT\n')
+        for cue in cues:
+            vtt.write(f"\n{vtt_time(cue['start'])} --> {vtt_time(cue['end'])}\n"
+                      f"{cue['sheet']}#xywh={cue['x']},{cue['y']},{cue['w']},{cue['h']}\n")
+    with open(os.path.join(directory, INDEX_JSON), 'w') as index:
+        json.dump({'interval': interval, 'width': width, 'height': height, 'columns': SPRITE_COLUMNS,
+                   'sheets': sheets, 'cues': cues}, index)
+    return {'count': len(cues), 'sheets': sheets, 'files': [*sheets, INDEX_VTT, INDEX_JSON]}
+
+
+def vtt_time(seconds: float) -> str:
+    milliseconds = round(seconds * 1000)
+    hours, milliseconds = divmod(milliseconds, 3600000)
+    minutes, milliseconds = divmod(milliseconds, 60000)
+    return f'{hours:02d}:{minutes:02d}:{milliseconds / 1000:06.3f}'
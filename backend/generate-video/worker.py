@@ -0,0 +1,203 @@
+import os
+import socket
+import tempfile
+import time
+
+from db import get_db_connection
+from cache import source_cache
+from jobs import claim_job, complete_batch, complete_job, fail_job, touch_job, update_progress, video_key
+from render import RENDER_WORKERS, RenderSpec, prefetch_batch, render_video, start_pool
+from scheduler import DEFAULT_RESOLUTION, RESOLUTIONS, capped_resolution
+from thumbnails import INDEX_JSON, INDEX_VTT
+from warm import s3_client
+
+WORKER_ID = os.environ.get('WORKER_ID') or f'{socket.gethostname()}-{os.getpid()}'
+POLL_INTERVAL = float(os.environ.get('WORKER_POLL_INTERVAL', '2'))
+PROGRESS_STEP = 5
+LOCK_REFRESH_SECONDS = 60
+CONTENT_TYPES = {'.jpg': 'image/jpeg', '.vtt': 'text/vtt', '.json': 'application/json'}
+
+
+def job_spec(params: dict, plan: str) -> RenderSpec:
+    resolution = capped_resolution(params.get('resolution') or DEFAULT_RESOLUTION, plan)
+    width, height = RESOLUTIONS[resolution]
+    return RenderSpec.for_quality(
+        params.get('quality', 'final'),
+        width=width,
+        height=height,
+        duration=params.get('duration', 5),
+        animation_type=params.get('animationType', 'subtle'),
+        transition=params.get('transition', 'fade'),
+    )
+
+
+def progress_reporter(conn, job_id):
+    """on_progress для render_video: пишет в базу не чаще, чем раз в PROGRESS_STEP процентов"""
+    reported = {'progress': 0}
+
+    def on_progress(done: int, total: int):
+        progress = min(99, done * 100 // total)
+        if progress >= reported['progress'] + PROGRESS_STEP:
+            reported['progress'] = progress
+            update_progress(conn, job_id, progress)
+    return on_progress
+
+
+def lock_keeper(conn, job_id):
+    """Продлевает locked_at не чаще раза в LOCK_REFRESH_SECONDS; для стадий без прогресса рендера -
+    предзагрузки пакета и загрузок в S3, - иначе другой воркер счёл бы задачу зависшей"""
+    touched = {'at': time.monotonic()}
+
+    def keep():
+        now = time.monotonic()
+        if now - touched['at'] >= LOCK_REFRESH_SECONDS:
+            touched['at'] = now
+            touch_job(conn, job_id)
+    return keep
+
+
+def render_and_upload(photos: list, spec: RenderSpec, video_id: str, quality: str, on_progress, pool=None,
+                      on_upload=None) -> tuple:
+    """Рендер в temp-каталоге и загрузка видео с миниатюрами; (video_url, статистика рендера).
+
+    on_upload вызывается после каждого загруженного файла.
+    """
+    key = video_key(video_id, quality)
+    with tempfile.TemporaryDirectory() as workdir:
+        output_path = os.path.join(workdir, 'output.mp4')
+        thumbnails_dir = os.path.join(workdir, 'thumbnails')
+        os.mkdir(thumbnails_dir)
+        stats = render_video(photos, spec, output_path, on_progress, thumbnails_dir=thumbnails_dir, pool=pool)
+        s3_client().upload_file(output_path, 'files', key, ExtraArgs={'ContentType': 'video/mp4'})
+        if on_upload is not None:
+            on_upload()
+        thumbnails = upload_thumbnails(video_id, thumbnails_dir, stats['thumbnails'], on_upload)
+    return cdn_url(key), {**stats, 'thumbnails': thumbnails}
+
+
+def process_job(conn, job: dict) -> dict:
+    """Рендерит видео задачи, загружает его в S3 и отмечает задачу выполненной"""
+    params = job['params']
+    if params.get('batch'):
+        return process_batch(conn, job)
+    quality = params.get('quality', 'final')
+    spec = job_spec(params, job['plan'])
+    video_url, stats = render_and_upload(params['photos'], spec, job['video_id'], quality,
+                                         progress_reporter(conn, job['id']), on_upload=lock_keeper(conn, job['id']))
+    stats = {
+        **stats,
+        'quality': quality,
+        'resolution': '{}x{}'.format(*spec.output_size),
+        'output_fps': spec.fps / spec.frame_step,
+        'plan': job['plan'],
+        'queue_wait_seconds': round((job['started_at'] - job['queued_at']).total_seconds(), 3),
+    }
+    complete_job(conn, job, video_url, stats)
+    return stats
+
+
+def process_batch(conn, job: dict) -> dict:
+    """Пакет проектов: общие фото качаются один раз (prefetch_batch), все видео идут через один пул
+    процессов, ошибка проекта не останавливает остальные, проекты обновляются одним UPDATE"""
+    params = job['params']
+    items = params['batch']
+    specs = [job_spec({**item, 'resolution': params.get('resolution')}, job['plan']) for item in items]
+    totals = [spec.output_frames(0, len(item['photos']) * spec.frames_per_photo) for item, spec in zip(items, specs)]
+    report = progress_reporter(conn, job['id'])
+    keep_lock = lock_keeper(conn, job['id'])
+    offset = {'frames': 0}
+
+    def on_progress(done: int, total: int):
+        report(offset['frames'] + done, sum(totals))
+
+    started = time.perf_counter()
+    shared = prefetch_batch([(photo, spec) for item, spec in zip(items, specs) for photo in item['photos']], keep_lock)
+    results = []
+    pool = start_pool(RENDER_WORKERS) if RENDER_WORKERS > 1 else None
+    try:
+        for item, spec, total in zip(items, specs, totals):
+            result = {'project_id': item['project_id'], 'video_id': item['video_id']}
+            try:
+                video_url, stats = render_and_upload(item['photos'], spec, item['video_id'], 'final', on_progress, pool,
+                                                     keep_lock)
+                result.update(status='ready', video_url=video_url, frames=stats['frames'], seconds=stats['seconds'],
+                              thumbnails_url=stats['thumbnails']['vtt_url'])
+            except Exception as e:
+                result.update(status='failed', error=str(e))
+            results.append(result)
+            offset['frames'] += total
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        source_cache.unpin_all()
+
+    elapsed = time.perf_counter() - started
+    frames = sum(result.get('frames', 0) for result in results)
+    ready = sum(1 for result in results if result['status'] == 'ready')
+    video_seconds = sum(len(item['photos']) * spec.duration for item, spec, result in zip(items, specs, results)
+                        if result['status'] == 'ready')
+    stats = {
+        'project_count': len(items),
+        'ready': ready,
+        'failed': len(items) - ready,
+        **shared,
+        'workers': RENDER_WORKERS,
+        'resolution': '{}x{}'.format(*specs[0].output_size),
+        'frames': frames,
+        'seconds': round(elapsed, 3),
+        'fps': round(frames / elapsed, 1) if elapsed > 0 else 0.0,
+        'projects_per_minute': round(ready * 60 / elapsed, 2) if elapsed > 0 else 0.0,
+        'video_seconds_per_second': round(video_seconds / elapsed, 3) if elapsed > 0 else 0.0,
+        'plan': job['plan'],
+        'queue_wait_seconds': round((job['started_at'] - job['queued_at']).total_seconds(), 3),
+    }
+    complete_batch(conn, job, results, stats)
+    return stats
+
+
+def cdn_url(key: str) -> str:
+    return f"https://cdn.poehali.dev/projects/{os.environ['AWS_ACCESS_KEY_ID']}/bucket/{key}"
+
+
+def upload_thumbnails(video_id: str, directory: str, sprites: dict, on_upload=None) -> dict:
+    """Листы миниатюр и индексы кладутся рядом с превью; ссылки в VTT относительные, поэтому файлы держатся вместе"""
+    urls = {}
+    for name in sprites['files']:
+        key = f'videos/{video_id}/{name}'
+        content_type = CONTENT_TYPES[os.path.splitext(name)[1]]
+        s3_client().upload_file(os.path.join(directory, name), 'files', key, ExtraArgs={'ContentType': content_type})
+        urls[name] = cdn_url(key)
+        if on_upload is not None:
+            on_upload()
+    return {
+        'count': sprites['count'],
+        'vtt_url': urls[INDEX_VTT],
+        'json_url': urls[INDEX_JSON],
+        'sprite_urls': [urls[name] for name in sprites['sheets']],
+    }
+
+
+def run_once(conn) -> bool:
+    job = claim_job(conn, WORKER_ID)
+    if not job:
+        return False
+    try:
+        process_job(conn, job)
+    except Exception as e:
+        fail_job(conn, job, str(e))
+    return True
+
+
+def run_forever():
+    """Цикл воркера; можно запускать сколько угодно экземпляров на одну базу"""
+    conn = get_db_connection()
+    try:
+        while True:
+            if not run_once(conn):
+                time.sleep(POLL_INTERVAL)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    run_forever()
@@ -0,0 +1,151 @@
+import os
+import threading
+import time
+from typing import Optional
+
+import psycopg2
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+from psycopg2.extras import RealDictCursor
+
+from timing import span
+
+POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE') or 4)
+POOL_WAIT_TIMEOUT = float(os.environ.get('DB_POOL_WAIT_TIMEOUT') or 5)
+HEALTH_CHECK_IDLE_SECONDS = float(os.environ.get('DB_HEALTH_CHECK_IDLE_SECONDS') or 30)
+PREPARED_STATEMENTS = os.environ.get('DB_PREPARED_STATEMENTS') == '1'
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class TimedCursor(RealDictCursor):
+    """RealDictCursor, время запросов которого попадает в стадию db текущего запроса"""
+
+    def execute(self, query, vars=None):
+        with span('db'):
+            return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        with span('db'):
+            return super().executemany(query, vars_list)
+
+
+class PooledConnection:
+    """Обёртка над соединением: close() возвращает его в пул, остальное делегируется psycopg2"""
+
+    def __init__(self, pool: 'ConnectionPool', raw):
+        self._pool = pool
+        self._raw = raw
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def commit(self):
+        with span('db'):
+            self._raw.commit()
+
+    def close(self):
+        if self._raw is not None:
+            self._pool.release(self._raw)
+            self._raw = None
+
+
+class ConnectionPool:
+    """Пул соединений уровня процесса: переживает тёплые вызовы функции и ограничивает число соединений"""
+
+    def __init__(self, dsn: str, max_size: int = POOL_MAX_SIZE, wait_timeout: float = POOL_WAIT_TIMEOUT):
+        self.dsn = dsn
+        self.wait_timeout = wait_timeout
+        self.slots = threading.BoundedSemaphore(max_size)
+        self.lock = threading.Lock()
+        self.idle = []
+        self.prepared = {}
+
+    def acquire(self) -> PooledConnection:
+        if not self.slots.acquire(timeout=self.wait_timeout):
+            raise PoolTimeout(f'no database connection available within {self.wait_timeout}s')
+        try:
+            return PooledConnection(self, self._checkout())
+        except Exception:
+            self.slots.release()
+            raise
+
+    def release(self, raw):
+        try:
+            if not raw.closed and raw.info.transaction_status != TRANSACTION_STATUS_IDLE:
+                raw.rollback()
+            if raw.closed:
+                self.prepared.pop(id(raw), None)
+            else:
+                with self.lock:
+                    self.idle.append((raw, time.monotonic()))
+        except psycopg2.Error:
+            self._discard(raw)
+        finally:
+            self.slots.release()
+
+    def _checkout(self):
+        while True:
+            with self.lock:
+                raw, last_used = self.idle.pop() if self.idle else (None, 0)
+            if raw is None:
+                return psycopg2.connect(self.dsn, cursor_factory=TimedCursor)
+            if self._healthy(raw, time.monotonic() - last_used):
+                return raw
+            self._discard(raw)
+
+    def _healthy(self, raw, idle_seconds: float) -> bool:
+        """Проверка соединения перед выдачей; SELECT 1 только после долгого простоя"""
+        if raw.closed:
+            return False
+        if idle_seconds < HEALTH_CHECK_IDLE_SECONDS:
+            return True
+        try:
+            with raw.cursor() as cur:
+                cur.execute('SELECT 1')
+            raw.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, raw):
+        self.prepared.pop(id(raw), None)
+        try:
+            raw.close()
+        except psycopg2.Error:
+            pass
+
+
+_pool: Optional[ConnectionPool] = None
+
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        _pool = ConnectionPool(os.environ.get('DATABASE_URL'))
+    return _pool
+
+
+def get_db_connection() -> PooledConnection:
+    with span('db_connect'):
+        return get_pool().acquire()
+
+
+def execute_prepared(conn: PooledConnection, cur, name: str, query: str, params: tuple):
+    """Выполняет фиксированный запрос; при DB_PREPARED_STATEMENTS=1 через PREPARE/EXECUTE.
+
+    В query параметры обозначаются как %s, для PREPARE они заменяются на $1, $2, ...
+    """
+    if not PREPARED_STATEMENTS:
+        cur.execute(query, params)
+        return
+    prepared = conn._pool.prepared.setdefault(id(conn._raw), set())
+    if name not in prepared:
+        numbered = query
+        for index in range(1, len(params) + 1):
+            numbered = numbered.replace('%s', f'${index}', 1)
+        cur.execute(f'PREPARE {name} AS {numbered}')
+        prepared.add(name)
+    placeholders = ', '.join(['%s'] * len(params))
+    cur.execute(f'EXECUTE {name} ({placeholders})' if params else f'EXECUTE {name}', params)
@@ -1,12 +1,121 @@
 import json
-import os
-import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import execute_values
 
-def get_db_connection():
-    dsn = os.environ.get('DATABASE_URL')
-    return psycopg2.connect(dsn, cursor_factory=RealDictCursor)
+from db import execute_prepared, get_db_connection
+from timing import span, traced
+from warm import s3_client
 
+BLOB_GRACE_MINUTES = 60
+BLOB_PURGE_BATCH = 20
+MAX_BATCH_SIZE = 1000
+
+PHOTO_METADATA_FIELDS = (
+    'width', 'height', 'orientation', 'content_hash',
+    'thumbnail_url', 'proxy_720_url', 'proxy_1080_url'
+)
+PHOTO_INSERT_COLUMNS = ('project_id', 'photo_url', 'photo_name', 'position') + PHOTO_METADATA_FIELDS
+
+PHOTO_FIELDS = '''
+    pp.id, pp.project_id, pp.photo_url, pp.photo_name, pp.position,
+    api_timestamp(pp.created_at) AS created_at,
+    pp.width, pp.height, pp.orientation, pp.content_hash,
+    pp.thumbnail_url, pp.proxy_720_url, pp.proxy_1080_url
+'''
+
+
+def purge_orphan_blobs(cur) -> list:
+    '''Удаляет blob-ы, на которые давно не ссылается ни одна строка project_photos или render_jobs'''
+    cur.execute('''
+        DELETE FROM photo_blobs
+        WHERE content_hash IN (
+            SELECT content_hash FROM photo_blobs
+            WHERE ref_count <= 0 AND last_used_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 minute'
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING s3_key, derivatives
+    ''', (BLOB_GRACE_MINUTES, BLOB_PURGE_BATCH))
+    keys = []
+    for blob in cur.fetchall():
+        keys.append(blob['s3_key'])
+        keys.extend(url.split('/bucket/', 1)[1] for url in (blob['derivatives'] or {}).values())
+    return keys
+
+
+def photo_row(project_id, photo: dict, default_position: int) -> tuple:
+    return (
+        project_id,
+        photo['photo_url'],
+        photo.get('photo_name', 'photo.jpg'),
+        photo.get('position', default_position),
+        *[photo.get(field) for field in PHOTO_METADATA_FIELDS]
+    )
+
+
+def insert_photos(cur, rows: list) -> list:
+    '''Вставляет все фото одним INSERT ... VALUES (...), (...) RETURNING'''
+    return execute_values(cur, f'''
+        INSERT INTO project_photos ({', '.join(PHOTO_INSERT_COLUMNS)})
+        VALUES %s
+        RETURNING *
+    ''', rows, page_size=len(rows), fetch=True)
+
+
+def parse_photo_ids(order: list) -> list:
+    '''Целые id из order (числа или строки из цифр); None, если хотя бы один id не целый'''
+    photo_ids = []
+    for photo_id in order:
+        if isinstance(photo_id, str) and photo_id.strip().isdigit():
+            photo_id = int(photo_id)
+        if not isinstance(photo_id, int) or isinstance(photo_id, bool):
+            return None
+        photo_ids.append(photo_id)
+    return photo_ids
+
+
+def next_photo_position(cur, project_id) -> int:
+    '''Позиция сразу за последним фото проекта'''
+    cur.execute('''
+        SELECT COALESCE(MAX(position) + 1, 0) AS position FROM project_photos WHERE project_id = %s
+    ''', (project_id,))
+    return cur.fetchone()['position']
+
+
+def project_photo_ids(cur, project_id) -> set:
+    '''id всех фото проекта; строки блокируются до конца транзакции, чтобы набор не поменялся до UPDATE'''
+    cur.execute('SELECT id FROM project_photos WHERE project_id = %s FOR UPDATE', (project_id,))
+    return {row['id'] for row in cur.fetchall()}
+
+
+def reorder_photos(cur, project_id, photo_ids: list) -> list:
+    '''Переписывает position всех фото проекта одним UPDATE: позиция - индекс id в списке'''
+    cur.execute('''
+        UPDATE project_photos pp
+        SET position = o.position - 1
+        FROM unnest(%s::int[]) WITH ORDINALITY AS o(id, position)
+        WHERE pp.id = o.id AND pp.project_id = %s
+        RETURNING pp.id, pp.position
+    ''', (photo_ids, project_id))
+    return cur.fetchall()
+
+
+def fetch_project_version(conn, cur, project_id):
+    '''Версия проекта; триггеры увеличивают её при любом изменении его фото'''
+    execute_prepared(conn, cur, 'project_version', 'SELECT version FROM projects WHERE id = %s', (project_id,))
+    row = cur.fetchone()
+    return row['version'] if row else None
+
+
+def etag_matches(event: dict, etag: str) -> bool:
+    '''Сравнивает ETag с If-None-Match (слабое сравнение, несколько значений через запятую)'''
+    header = next((value for name, value in (event.get('headers') or {}).items() if name.lower() == 'if-none-match'), None)
+    if not header:
+        return False
+    candidates = [tag.strip().removeprefix('W/') for tag in header.split(',')]
+    return '*' in candidates or etag in candidates
+
+
+@traced('photos')
 def handler(event: dict, context) -> dict:
     '''API для управления фотографиями в проектах'''
     
@@ -17,15 +126,16 @@ def handler(event: dict, context) -> dict:
             'statusCode': 200,
             'headers': {
                 'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type'
+                'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, If-None-Match, X-Profile'
             },
             'body': ''
         }
     
     headers = {
         'Content-Type': 'application/json',
-        'Access-Control-Allow-Origin': '*'
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Expose-Headers': 'ETag'
     }
     
     try:
@@ -35,6 +145,34 @@ def handler(event: dict, context) -> dict:
         if method == 'POST':
             body = json.loads(event.get('body', '{}'))
             project_id = body.get('project_id')
+            
+            if 'photos' in body:
+                photos = body['photos']
+                
+                if not project_id or not isinstance(photos, list) or not photos:
+                    return {
+                        'statusCode': 400,
+                        'headers': headers,
+                        'body': json.dumps({'error': 'project_id and non-empty photos required'})
+                    }
+                
+                if len(photos) > MAX_BATCH_SIZE or not all(isinstance(p, dict) and p.get('photo_url') for p in photos):
+                    return {
+                        'statusCode': 400,
+                        'headers': headers,
+                        'body': json.dumps({'error': f'Up to {MAX_BATCH_SIZE} photos, each with photo_url'})
+                    }
+                
+                start = next_photo_position(cur, project_id)
+                inserted = insert_photos(cur, [photo_row(project_id, photo, start + index) for index, photo in enumerate(photos)])
+                conn.commit()
+                
+                return {
+                    'statusCode': 201,
+                    'headers': headers,
+                    'body': json.dumps([dict(p) for p in inserted], default=str)
+                }
+            
             photo_url = body.get('photo_url')
             photo_name = body.get('photo_name', 'photo.jpg')
             position = body.get('position', 0)
@@ -46,11 +184,13 @@ def handler(event: dict, context) -> dict:
                     'body': json.dumps({'error': 'project_id and photo_url required'})
                 }
             
-            cur.execute('''
-                INSERT INTO project_photos (project_id, photo_url, photo_name, position)
-                VALUES (%s, %s, %s, %s)
+            metadata = [body.get(field) for field in PHOTO_METADATA_FIELDS]
+            
+            cur.execute(f'''
+                INSERT INTO project_photos ({', '.join(PHOTO_INSERT_COLUMNS)})
+                VALUES (%s, %s, %s, %s{', %s' * len(PHOTO_METADATA_FIELDS)})
                 RETURNING *
-            ''', (project_id, photo_url, photo_name, position))
+            ''', (project_id, photo_url, photo_name, position, *metadata))
             
             photo = cur.fetchone()
             conn.commit()
@@ -71,18 +211,112 @@ def handler(event: dict, context) -> dict:
                     'body': json.dumps({'error': 'project_id required'})
                 }
             
-            cur.execute('''
-                SELECT * FROM project_photos 
-                WHERE project_id = %s 
-                ORDER BY position
+            version = fetch_project_version(conn, cur, project_id)
+            if version is not None:
+                headers['ETag'] = f'"photos-{project_id}-{version}"'
+                if etag_matches(event, headers['ETag']):
+                    return {'statusCode': 304, 'headers': headers, 'body': ''}
+            
+            execute_prepared(conn, cur, 'photos_json_by_project', f'''
+                SELECT COALESCE(json_agg(fields ORDER BY pp.position), '[]')::text AS body
+                FROM project_photos pp
+                CROSS JOIN LATERAL (SELECT {PHOTO_FIELDS}) fields
+                WHERE pp.project_id = %s
             ''', (project_id,))
             
-            photos = cur.fetchall()
+            return {
+                'statusCode': 200,
+                'headers': headers,
+                'body': cur.fetchone()['body']
+            }
+        
+        elif method == 'PUT':
+            body = json.loads(event.get('body', '{}'))
+            project_id = body.get('project_id')
+            order = body.get('order')
+            
+            if not project_id or not isinstance(order, list) or not order:
+                return {
+                    'statusCode': 400,
+                    'headers': headers,
+                    'body': json.dumps({'error': 'project_id and order required'})
+                }
+            
+            photo_ids = parse_photo_ids(order)
+            
+            if photo_ids is None:
+                return {
+                    'statusCode': 400,
+                    'headers': headers,
+                    'body': json.dumps({'error': 'order must contain integer photo ids'})
+                }
+            
+            if len(set(photo_ids)) != len(photo_ids):
+                return {
+                    'statusCode': 400,
+                    'headers': headers,
+                    'body': json.dumps({'error': 'order contains duplicate ids'})
+                }
+            
+            existing = project_photo_ids(cur, project_id)
+            
+            if not set(photo_ids) <= existing:
+                conn.rollback()
+                return {
+                    'statusCode': 404,
+                    'headers': headers,
+                    'body': json.dumps({'error': 'Some photos not found in project'})
+                }
+            
+            if len(photo_ids) != len(existing):
+                conn.rollback()
+                return {
+                    'statusCode': 400,
+                    'headers': headers,
+                    'body': json.dumps({'error': 'order must list every photo of the project'})
+                }
+            
+            updated = reorder_photos(cur, project_id, photo_ids)
+            
+            conn.commit()
             
             return {
                 'statusCode': 200,
                 'headers': headers,
-                'body': json.dumps([dict(p) for p in photos], default=str)
+                'body': json.dumps(sorted((dict(p) for p in updated), key=lambda p: p['position']))
+            }
+        
+        elif method == 'DELETE':
+            photo_id = (event.get('queryStringParameters') or {}).get('id')
+            
+            if not photo_id:
+                return {
+                    'statusCode': 400,
+                    'headers': headers,
+                    'body': json.dumps({'error': 'id required'})
+                }
+            
+            cur.execute('DELETE FROM project_photos WHERE id = %s RETURNING *', (photo_id,))
+            photo = cur.fetchone()
+            
+            if not photo:
+                return {
+                    'statusCode': 404,
+                    'headers': headers,
+                    'body': json.dumps({'error': 'Photo not found'})
+                }
+            
+            purged_keys = purge_orphan_blobs(cur)
+            conn.commit()
+            
+            if purged_keys:
+                with span('s3_delete'):
+                    s3_client().delete_objects(Bucket='files', Delete={'Objects': [{'Key': key} for key in purged_keys]})
+            
+            return {
+                'statusCode': 200,
+                'headers': headers,
+                'body': json.dumps(dict(photo), default=str)
             }
         
         else:
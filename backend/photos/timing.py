@@ -0,0 +1,138 @@
+import contextvars
+import functools
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Optional
+
+TIMING_LOG = os.environ.get('TIMING_LOG', '1') != '0'
+PROFILE_DIR = os.environ.get('PROFILE_DIR')
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE') or 0)
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN')
+
+_current = contextvars.ContextVar('request_timer', default=None)
+_profiler_lock = threading.Lock()
+
+
+class RequestTimer:
+    """Длительности и объёмы данных по стадиям одного запроса; повторные стадии суммируются"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+
+    def add(self, name: str, ms: float = 0.0, size: Optional[int] = None):
+        stage = self.stages.setdefault(name, {'ms': 0.0, 'count': 0})
+        stage['ms'] += ms
+        stage['count'] += 1
+        if size is not None:
+            stage['bytes'] = stage.get('bytes', 0) + size
+
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def server_timing(self, total_ms: float) -> str:
+        metrics = [f"{name};dur={stage['ms']:.2f}" for name, stage in self.stages.items()]
+        return ', '.join(metrics + [f'total;dur={total_ms:.2f}'])
+
+
+@contextmanager
+def span(name: str, size: Optional[int] = None):
+    """Замеряет стадию текущего запроса; вне handler-а ничего не делает"""
+    timer = _current.get()
+    if timer is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.add(name, (time.perf_counter() - started) * 1000, size)
+
+
+def add_bytes(name: str, size: int):
+    """Объём данных стадии, известный только после её окончания (например, размер PNG)"""
+    timer = _current.get()
+    if timer is not None:
+        stage = timer.stages.setdefault(name, {'ms': 0.0, 'count': 0})
+        stage['bytes'] = stage.get('bytes', 0) + size
+
+
+def profiling_requested(event: dict) -> bool:
+    """Профилирование по заголовку X-Profile с PROFILE_TOKEN или случайная выборка PROFILE_SAMPLE_RATE"""
+    headers = {key.lower(): value for key, value in (event.get('headers') or {}).items()}
+    if PROFILE_TOKEN and headers.get('x-profile') == PROFILE_TOKEN:
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def start_profiler(event: dict):
+    """cProfile на поток запроса; одновременно профилируется не больше одного запроса"""
+    if not profiling_requested(event) or not _profiler_lock.acquire(blocking=False):
+        return None
+    import cProfile
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        _profiler_lock.release()
+        return None
+    return profiler
+
+
+def stop_profiler(profiler, function_name: str) -> str:
+    """Сохраняет дамп для pstats/snakeviz в PROFILE_DIR и возвращает путь к нему"""
+    import tempfile
+    try:
+        profiler.disable()
+        path = os.path.join(PROFILE_DIR or tempfile.gettempdir(), f'{function_name}-{int(time.time())}-{uuid.uuid4().hex[:8]}.prof')
+        profiler.dump_stats(path)
+        return path
+    finally:
+        _profiler_lock.release()
+
+
+def traced(function_name: str):
+    """Обёртка handler-а: Server-Timing в ответе и одна JSON-строка в лог со стадиями запроса"""
+    def decorate(handler):
+        @functools.wraps(handler)
+        def wrapper(event: dict, context) -> dict:
+            timer = RequestTimer()
+            token = _current.set(timer)
+            profiler = start_profiler(event)
+            response = None
+            try:
+                response = handler(event, context)
+                return response
+            finally:
+                _current.reset(token)
+                profile_path = stop_profiler(profiler, function_name) if profiler else None
+                total_ms = timer.total_ms()
+                if response is not None:
+                    response['headers'] = {
+                        **(response.get('headers') or {}),
+                        'Server-Timing': timer.server_timing(total_ms),
+                        'Timing-Allow-Origin': '*',
+                    }
+                if TIMING_LOG:
+                    record = {
+                        'function': function_name,
+                        'request_id': getattr(context, 'request_id', None),
+                        'method': event.get('httpMethod'),
+                        'status': response['statusCode'] if response is not None else None,
+                        'total_ms': round(total_ms, 2),
+                        'stages': {
+                            name: {key: round(value, 2) for key, value in stage.items()}
+                            for name, stage in timer.stages.items()
+                        },
+                    }
+                    if profile_path:
+                        record['profile'] = profile_path
+                    sys.stdout.write(json.dumps(record) + '\n')
+        return wrapper
+    return decorate
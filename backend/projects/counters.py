@@ -0,0 +1,52 @@
+import sys
+
+from db import get_db_connection
+
+BATCH_SIZE = 5000
+SAMPLE_SIZE = 20
+
+
+def check_counters(conn, repair: bool = False, batch_size: int = BATCH_SIZE) -> dict:
+    """Сверяет projects.photo_count с project_photos пачками по id; с repair=True исправляет расхождения.
+
+    Каждая пачка - отдельная транзакция, поэтому проверка не держит блокировки на всей таблице.
+    """
+    report = {'checked': 0, 'drifted': 0, 'repaired': 0, 'samples': []}
+    last_id = 0
+    while True:
+        with conn.cursor() as cur:
+            cur.execute('''
+                SELECT p.id, p.photo_count, COUNT(pp.id) AS actual
+                FROM (SELECT id, photo_count FROM projects WHERE id > %s ORDER BY id LIMIT %s) p
+                LEFT JOIN project_photos pp ON pp.project_id = p.id
+                GROUP BY p.id, p.photo_count
+                ORDER BY p.id
+            ''', (last_id, batch_size))
+            rows = cur.fetchall()
+            if not rows:
+                conn.commit()
+                return report
+            last_id = rows[-1]['id']
+            report['checked'] += len(rows)
+            drifted = [row for row in rows if row['photo_count'] != row['actual']]
+            report['drifted'] += len(drifted)
+            report['samples'].extend(
+                {'id': row['id'], 'stored': row['photo_count'], 'actual': row['actual']}
+                for row in drifted[:SAMPLE_SIZE - len(report['samples'])]
+            )
+            if repair and drifted:
+                cur.execute('''
+                    UPDATE projects p
+                    SET photo_count = (SELECT COUNT(*) FROM project_photos WHERE project_id = p.id)
+                    WHERE p.id = ANY(%s)
+                ''', ([row['id'] for row in drifted],))
+                report['repaired'] += cur.rowcount
+        conn.commit()
+
+
+if __name__ == '__main__':
+    conn = get_db_connection()
+    try:
+        print(check_counters(conn, repair='--repair' in sys.argv[1:]))
+    finally:
+        conn.close()
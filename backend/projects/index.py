@@ -1,12 +1,120 @@
+import base64
 import json
-import os
-import psycopg2
-from psycopg2.extras import RealDictCursor
+from datetime import datetime
 
-def get_db_connection():
-    dsn = os.environ.get('DATABASE_URL')
-    return psycopg2.connect(dsn, cursor_factory=RealDictCursor)
+from db import execute_prepared, get_db_connection
+from timing import traced
 
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+
+PROJECT_SUMMARY_COLUMNS = '''
+    cover.thumbnail_url AS cover_url
+'''
+
+PROJECT_SUMMARY_JOINS = '''
+    LEFT JOIN LATERAL (
+        SELECT COALESCE(thumbnail_url, photo_url) AS thumbnail_url
+        FROM project_photos WHERE project_id = p.id
+        ORDER BY position, id
+        LIMIT 1
+    ) cover ON TRUE
+'''
+
+PROJECT_PHOTOS_COLUMN = '''
+    COALESCE((
+        SELECT json_agg(json_build_object(
+            'id', pp.id,
+            'photo_url', pp.photo_url,
+            'photo_name', pp.photo_name,
+            'position', pp.position
+        ) ORDER BY pp.position)
+        FROM project_photos pp WHERE pp.project_id = p.id
+    ), '[]') AS photos
+'''
+
+PROJECT_FIELDS = '''
+    p.id, p.user_id, p.title, p.duration, p.animation_type, p.transition, p.status,
+    p.video_url, p.thumbnail_emoji,
+    api_timestamp(p.created_at) AS created_at, api_timestamp(p.updated_at) AS updated_at,
+    p.photo_count, p.total_duration, p.version
+'''
+
+PROJECT_CURSOR = '''
+    rtrim(translate(encode(convert_to(
+        replace(api_timestamp(p.created_at), ' ', 'T') || '|' || p.id, 'UTF8'
+    ), 'base64'), '+/', '-_'), '=')
+'''
+
+
+def decode_cursor(cursor: str) -> tuple:
+    '''Курсор keyset-пагинации: base64url от "created_at|id" последнего проекта страницы'''
+    raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+    created_at, project_id = raw.split('|')
+    return datetime.fromisoformat(created_at), int(project_id)
+
+
+def fetch_projects_page(conn, cur, user_id, view: str, limit: int, after) -> str:
+    '''Страница проектов пользователя по индексу (user_id, created_at, id), сразу в виде JSON ответа.
+
+    Берётся limit + 1 строка: лишняя говорит о том, что есть следующая страница, и не попадает в ответ.
+    '''
+    columns = PROJECT_PHOTOS_COLUMN if view == 'full' else PROJECT_SUMMARY_COLUMNS
+    joins = '' if view == 'full' else PROJECT_SUMMARY_JOINS
+    keyset = 'AND (p.created_at, p.id) < (%s, %s)' if after else ''
+    execute_prepared(conn, cur, f"projects_json_{view}_{'after' if after else 'first'}", f'''
+        SELECT json_build_object(
+            'projects', COALESCE(json_agg(page.project ORDER BY page.n) FILTER (WHERE page.n <= %s), '[]'),
+            'next_cursor', CASE WHEN COUNT(*) > %s THEN MAX(page.cursor) FILTER (WHERE page.n = %s) END
+        )::text AS body
+        FROM (
+            SELECT row_to_json(fields) AS project, {PROJECT_CURSOR} AS cursor,
+                   row_number() OVER (ORDER BY p.created_at DESC, p.id DESC) AS n
+            FROM projects p
+            {joins}
+            CROSS JOIN LATERAL (SELECT {PROJECT_FIELDS}, {columns}) fields
+            WHERE p.user_id = %s {keyset}
+            ORDER BY p.created_at DESC, p.id DESC
+            LIMIT %s
+        ) page
+    ''', (limit, limit, limit, user_id, *(after or ()), limit + 1))
+    return cur.fetchone()['body']
+
+
+def fetch_project_with_photos(conn, cur, project_id):
+    execute_prepared(conn, cur, 'project_json_with_photos', f'''
+        SELECT row_to_json(fields)::text AS body
+        FROM projects p
+        CROSS JOIN LATERAL (SELECT {PROJECT_FIELDS}, {PROJECT_PHOTOS_COLUMN}) fields
+        WHERE p.id = %s
+    ''', (project_id,))
+    row = cur.fetchone()
+    return row['body'] if row else None
+
+
+def fetch_list_version(conn, cur, user_id) -> int:
+    '''Версия списка проектов пользователя; триггер увеличивает её при любом изменении его проектов'''
+    execute_prepared(conn, cur, 'project_list_version', 'SELECT version FROM project_list_versions WHERE user_id = %s', (user_id,))
+    row = cur.fetchone()
+    return row['version'] if row else 0
+
+
+def fetch_project_version(conn, cur, project_id):
+    execute_prepared(conn, cur, 'project_version', 'SELECT version FROM projects WHERE id = %s', (project_id,))
+    row = cur.fetchone()
+    return row['version'] if row else None
+
+
+def etag_matches(event: dict, etag: str) -> bool:
+    '''Сравнивает ETag с If-None-Match (слабое сравнение, несколько значений через запятую)'''
+    header = next((value for name, value in (event.get('headers') or {}).items() if name.lower() == 'if-none-match'), None)
+    if not header:
+        return False
+    candidates = [tag.strip().removeprefix('W/') for tag in header.split(',')]
+    return '*' in candidates or etag in candidates
+
+
+@traced('projects')
 def handler(event: dict, context) -> dict:
     '''API для управления проектами видео'''
     
@@ -18,14 +126,15 @@ def handler(event: dict, context) -> dict:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id'
+                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, If-None-Match, X-Profile'
             },
             'body': ''
         }
     
     headers = {
         'Content-Type': 'application/json',
-        'Access-Control-Allow-Origin': '*'
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Expose-Headers': 'ETag'
     }
     
     try:
@@ -33,7 +142,30 @@ def handler(event: dict, context) -> dict:
         cur = conn.cursor()
         
         if method == 'GET':
-            user_id = event.get('queryStringParameters', {}).get('user_id')
+            params = event.get('queryStringParameters') or {}
+            user_id = params.get('user_id')
+            project_id = params.get('id')
+            
+            if project_id:
+                version = fetch_project_version(conn, cur, project_id)
+                project = None
+                if version is not None:
+                    etag = f'"project-{project_id}-{version}"'
+                    if etag_matches(event, etag):
+                        return {'statusCode': 304, 'headers': {**headers, 'ETag': etag}, 'body': ''}
+                    project = fetch_project_with_photos(conn, cur, project_id)
+                if not project:
+                    return {
+                        'statusCode': 404,
+                        'headers': headers,
+                        'body': json.dumps({'error': 'Project not found'})
+                    }
+                return {
+                    'statusCode': 200,
+                    'headers': {**headers, 'ETag': etag},
+                    'body': project
+                }
+            
             if not user_id:
                 return {
                     'statusCode': 400,
@@ -41,29 +173,26 @@ def handler(event: dict, context) -> dict:
                     'body': json.dumps({'error': 'user_id required'})
                 }
             
-            cur.execute('''
-                SELECT p.*, 
-                       COALESCE(json_agg(
-                           json_build_object(
-                               'id', pp.id,
-                               'photo_url', pp.photo_url,
-                               'photo_name', pp.photo_name,
-                               'position', pp.position
-                           ) ORDER BY pp.position
-                       ) FILTER (WHERE pp.id IS NOT NULL), '[]') as photos
-                FROM projects p
-                LEFT JOIN project_photos pp ON p.id = pp.project_id
-                WHERE p.user_id = %s
-                GROUP BY p.id
-                ORDER BY p.created_at DESC
-            ''', (user_id,))
-            
-            projects = cur.fetchall()
+            try:
+                limit = min(max(int(params.get('limit') or DEFAULT_PAGE_SIZE), 1), MAX_PAGE_SIZE)
+                after = decode_cursor(params['cursor']) if params.get('cursor') else None
+            except (ValueError, TypeError):
+                return {
+                    'statusCode': 400,
+                    'headers': headers,
+                    'body': json.dumps({'error': 'Invalid limit or cursor'})
+                }
+            
+            etag = f'"projects-{user_id}-{fetch_list_version(conn, cur, user_id)}"'
+            if etag_matches(event, etag):
+                return {'statusCode': 304, 'headers': {**headers, 'ETag': etag}, 'body': ''}
+            
+            view = 'full' if params.get('view') == 'full' else 'summary'
             
             return {
                 'statusCode': 200,
-                'headers': headers,
-                'body': json.dumps([dict(p) for p in projects], default=str)
+                'headers': {**headers, 'ETag': etag},
+                'body': fetch_projects_page(conn, cur, user_id, view, limit, after)
             }
         
         elif method == 'POST':
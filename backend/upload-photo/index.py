@@ -1,17 +1,370 @@
 import json
 import os
+import io
 import base64
-import boto3
+import hashlib
+import tempfile
 import uuid
 
-s3 = boto3.client('s3',
-    endpoint_url='https://bucket.poehali.dev',
-    aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'],
-    aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY'],
+from db import get_db_connection
+from timing import add_bytes, span, traced
+from warm import s3_client, warm
+
+CHUNK_SIZE = 8 * 1024 * 1024
+PRESIGN_EXPIRES = 900
+SPOOL_MEMORY_LIMIT = 4 * 1024 * 1024
+
+DERIVATIVES = (
+    ('proxy_1080_url', '1080.jpg', 'JPEG', (2400, 1350), 'cover', 85),
+    ('proxy_720_url', '720.jpg', 'JPEG', (1600, 900), 'cover', 85),
+    ('thumbnail_url', 'thumb.webp', 'WEBP', (320, 320), 'fit', 80),
 )
 
+
+def transfer_config():
+    def create():
+        from boto3.s3.transfer import TransferConfig
+        return TransferConfig(
+            multipart_threshold=CHUNK_SIZE,
+            multipart_chunksize=CHUNK_SIZE,
+            max_concurrency=4,
+        )
+    return warm('transfer_config', create)
+
+
+class BufferReader(io.RawIOBase):
+    """Файловый интерфейс поверх memoryview: S3 читает части без копирования всего буфера"""
+
+    def __init__(self, buffer):
+        self.view = memoryview(buffer)
+        self.position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, target) -> int:
+        chunk = self.view[self.position:self.position + len(target)]
+        target[:len(chunk)] = chunk
+        self.position += len(chunk)
+        return len(chunk)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.position, io.SEEK_END: len(self.view)}[whence]
+        self.position = max(0, base + offset)
+        return self.position
+
+    def tell(self) -> int:
+        return self.position
+
+
+class Base64Reader(io.RawIOBase):
+    """Декодирует base64-тело запроса по частям, не создавая полную копию файла в памяти"""
+
+    def __init__(self, encoded: str):
+        self.encoded = encoded
+        self.offset = 0
+        self.position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, target) -> int:
+        size = max(4, len(target) // 3 * 4)
+        chunk = base64.b64decode(self.encoded[self.offset:self.offset + size])
+        self.offset += size
+        target[:len(chunk)] = chunk
+        self.position += len(chunk)
+        return len(chunk)
+
+
+class HashingReader(io.RawIOBase):
+    """Читает поток загрузки, попутно считая sha256 и складывая копию во временный файл"""
+
+    def __init__(self, inner, spool):
+        self.inner = inner
+        self.spool = spool
+        self.digest = hashlib.sha256()
+        self.position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, target) -> int:
+        count = self.inner.readinto(target)
+        chunk = memoryview(target)[:count]
+        self.digest.update(chunk)
+        self.spool.write(chunk)
+        self.position += count
+        return count
+
+    def drain(self):
+        buffer = bytearray(CHUNK_SIZE)
+        while self.readinto(buffer):
+            pass
+
+
+def derivative_size(size: tuple, bounds: tuple, mode: str) -> tuple:
+    """Размер без увеличения: cover - минимально покрывающий bounds, fit - вписанный в bounds"""
+    ratios = (bounds[0] / size[0], bounds[1] / size[1])
+    scale = min(1.0, max(ratios) if mode == 'cover' else min(ratios))
+    return (max(1, round(size[0] * scale)), max(1, round(size[1] * scale)))
+
+
+def make_derivatives(spool, s3_key: str) -> tuple:
+    """Одно декодирование оригинала: метаданные и уменьшенные копии от большей к меньшей"""
+    from PIL import Image, ImageOps
+
+    spool.seek(0)
+    with span('image_decode'):
+        img = Image.open(spool)
+    exif_orientation = img.getexif().get(0x0112, 1)
+    width, height = img.size
+    if exif_orientation in (5, 6, 7, 8):
+        width, height = height, width
+    metadata = {
+        'width': width,
+        'height': height,
+        'orientation': 'square' if width == height else ('landscape' if width > height else 'portrait'),
+    }
+
+    largest = max(DERIVATIVES[0][3])
+    with span('image_decode'):
+        img.draft('RGB', (largest, largest))
+        current = ImageOps.exif_transpose(img).convert('RGB')
+    base_key = s3_key.rsplit('.', 1)[0]
+    derivatives = {}
+    for field, name, image_format, bounds, mode, quality in DERIVATIVES:
+        size = derivative_size(current.size, bounds, mode)
+        if size != current.size:
+            with span('resize'):
+                current = current.resize(size, Image.LANCZOS)
+        buffer = io.BytesIO()
+        with span('image_encode'):
+            current.save(buffer, format=image_format, quality=quality)
+        add_bytes('image_encode', buffer.tell())
+        derivative_key = f'{base_key}/{name}'
+        with span('s3_put', buffer.tell()):
+            buffer.seek(0)
+            s3_client().put_object(
+                Bucket='files',
+                Key=derivative_key,
+                Body=buffer,
+                ContentType=f'image/{image_format.lower()}'
+            )
+        derivatives[field] = cdn_url(derivative_key)
+    return derivatives, metadata
+
+
+def describe_file(file_name: str) -> tuple:
+    file_extension = file_name.split('.')[-1] if '.' in file_name else 'jpg'
+    content_type = 'image/jpeg'
+    if file_extension.lower() == 'png':
+        content_type = 'image/png'
+    elif file_extension.lower() == 'gif':
+        content_type = 'image/gif'
+    elif file_extension.lower() == 'webp':
+        content_type = 'image/webp'
+    return f'photos/{uuid.uuid4()}.{file_extension}', content_type
+
+
+def cdn_url(s3_key: str) -> str:
+    return f"https://cdn.poehali.dev/projects/{os.environ['AWS_ACCESS_KEY_ID']}/bucket/{s3_key}"
+
+
+def raw_body(event: dict) -> bytes:
+    body = event.get('body') or ''
+    if event.get('isBase64Encoded'):
+        return base64.b64decode(body)
+    return body.encode() if isinstance(body, str) else body
+
+
+def multipart_file(body: bytes, content_type: str) -> tuple:
+    """Находит файл в multipart/form-data и возвращает (имя, срез memoryview) без копирования"""
+    boundary = content_type.split('boundary=')[-1].strip().strip('"').encode()
+    delimiter = b'--' + boundary
+    view = memoryview(body)
+    start = body.find(delimiter)
+    while start != -1:
+        headers_end = body.find(b'\r\n\r\n', start)
+        if headers_end == -1:
+            break
+        part_headers = body[start:headers_end].decode(errors='replace')
+        end = body.find(b'\r\n' + delimiter, headers_end + 4)
+        if end == -1:
+            break
+        if 'filename=' in part_headers:
+            file_name = part_headers.split('filename=')[1].split('\r\n')[0].split(';')[0].strip().strip('"')
+            return file_name or 'photo.jpg', view[headers_end + 4:end]
+        start = end + 2
+    return None, None
+
+
+def upload_response(reader, file_name: str) -> dict:
+    """Хэширует поток до записи в S3, чтобы повторная загрузка того же файла не требовала PUT"""
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_LIMIT) as spool:
+        hashing = HashingReader(reader, spool)
+        with span('hash'):
+            hashing.drain()
+        add_bytes('hash', hashing.position)
+        return stored_response(spool, hashing.digest.hexdigest(), hashing.position, file_name)
+
+
+def register_upload(s3_key: str):
+    """Запоминает ключ, выданный presign: mode process принимает только такие ключи"""
+    try:
+        conn = get_db_connection()
+        with conn.cursor() as cur:
+            cur.execute('DELETE FROM pending_uploads WHERE expires_at < CURRENT_TIMESTAMP')
+            cur.execute('''
+                INSERT INTO pending_uploads (s3_key, expires_at)
+                VALUES (%s, CURRENT_TIMESTAMP + %s * INTERVAL '1 second')
+            ''', (s3_key, PRESIGN_EXPIRES))
+        conn.commit()
+    finally:
+        if 'conn' in locals():
+            conn.close()
+
+
+def upload_pending(s3_key: str) -> bool:
+    """Быстрая проверка до скачивания из S3; окончательно ключ забирает claim_upload"""
+    try:
+        conn = get_db_connection()
+        with conn.cursor() as cur:
+            cur.execute('''
+                SELECT 1 FROM pending_uploads
+                WHERE s3_key = %s AND expires_at > CURRENT_TIMESTAMP
+            ''', (s3_key,))
+            return cur.fetchone() is not None
+    finally:
+        if 'conn' in locals():
+            conn.close()
+
+
+def claim_upload(cur, s3_key: str) -> bool:
+    """Забирает ключ presign в текущей транзакции: обработать его можно только один раз"""
+    cur.execute('''
+        DELETE FROM pending_uploads
+        WHERE s3_key = %s AND expires_at > CURRENT_TIMESTAMP
+        RETURNING s3_key
+    ''', (s3_key,))
+    return cur.fetchone() is not None
+
+
+def unknown_upload_response() -> dict:
+    return {
+        'statusCode': 403,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'body': json.dumps({'error': 'key was not issued by presign, has expired or was already processed'})
+    }
+
+
+def process_response(s3_key: str, file_name: str) -> dict:
+    """Превью и метаданные для файла, загруженного напрямую по presigned URL"""
+    digest = hashlib.sha256()
+    size = 0
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_LIMIT) as spool:
+        with span('s3_get'):
+            for chunk in s3_client().get_object(Bucket='files', Key=s3_key)['Body'].iter_chunks(CHUNK_SIZE):
+                digest.update(chunk)
+                spool.write(chunk)
+                size += len(chunk)
+        add_bytes('s3_get', size)
+        return stored_response(spool, digest.hexdigest(), size, file_name, s3_key)
+
+
+def stored_response(spool, content_hash: str, size: int, file_name: str, uploaded_key: str = None) -> dict:
+    """Возвращает существующий blob с тем же хэшем или сохраняет новый в S3 и photo_blobs.
+
+    uploaded_key - ключ presign: он забирается в одной транзакции со счётчиком dedup_hits,
+    поэтому повтор того же process не удаляет файл и не накручивает счётчик.
+    """
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        if uploaded_key and not claim_upload(cur, uploaded_key):
+            conn.rollback()
+            return unknown_upload_response()
+        cur.execute('''
+            UPDATE photo_blobs
+            SET dedup_hits = dedup_hits + 1, last_used_at = CURRENT_TIMESTAMP
+            WHERE content_hash = %s
+            RETURNING *
+        ''', (content_hash,))
+        blob = cur.fetchone()
+        conn.commit()
+
+        if blob:
+            if uploaded_key and uploaded_key != blob['s3_key']:
+                s3_client().delete_object(Bucket='files', Key=uploaded_key)
+            return blob_response(blob, file_name, True)
+
+        s3_key = uploaded_key
+        if s3_key is None:
+            s3_key, content_type = describe_file(file_name)
+
+        try:
+            derivatives, metadata = make_derivatives(spool, s3_key)
+        except (OSError, ValueError):
+            derivatives, metadata = {}, {}
+
+        if uploaded_key is None:
+            spool.seek(0)
+            with span('s3_put', size):
+                s3_client().upload_fileobj(spool, 'files', s3_key, ExtraArgs={'ContentType': content_type}, Config=transfer_config())
+
+        cur.execute('''
+            INSERT INTO photo_blobs (content_hash, s3_key, size, derivatives, metadata)
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (content_hash) DO UPDATE SET last_used_at = CURRENT_TIMESTAMP
+            RETURNING *
+        ''', (content_hash, s3_key, size, json.dumps(derivatives), json.dumps(metadata)))
+        blob = cur.fetchone()
+        conn.commit()
+        return blob_response(blob, file_name, False)
+
+    finally:
+        if 'cur' in locals():
+            cur.close()
+        if 'conn' in locals():
+            conn.close()
+
+
+def blob_response(blob: dict, file_name: str, deduplicated: bool) -> dict:
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'body': json.dumps({
+            'url': cdn_url(blob['s3_key']),
+            'key': blob['s3_key'],
+            'size': blob['size'],
+            'fileName': file_name,
+            'deduplicated': deduplicated,
+            'derivatives': blob['derivatives'],
+            'metadata': {**blob['metadata'], 'content_hash': blob['content_hash']}
+        })
+    }
+
+
+def dedup_stats(conn) -> dict:
+    """Сколько байт и PUT-запросов в S3 сэкономила дедупликация"""
+    with conn.cursor() as cur:
+        cur.execute('''
+            SELECT COUNT(*) AS blobs,
+                   COALESCE(SUM(dedup_hits), 0) AS dedup_hits,
+                   COALESCE(SUM(dedup_hits * size), 0) AS bytes_saved,
+                   COALESCE(SUM(dedup_hits * (1 + (SELECT COUNT(*) FROM jsonb_object_keys(derivatives)))), 0) AS puts_saved,
+                   COALESCE(SUM(size), 0) AS bytes_stored
+            FROM photo_blobs
+        ''')
+        return cur.fetchone()
+
+
+@traced('upload-photo')
 def handler(event: dict, context) -> dict:
-    """API для загрузки фотографий в S3 хранилище"""
+    """API для загрузки фотографий в S3 хранилище: base64 в JSON, бинарное тело, multipart или presigned PUT"""
     method = event.get('httpMethod', 'POST')
 
     if method == 'OPTIONS':
@@ -19,12 +372,24 @@ def handler(event: dict, context) -> dict:
             'statusCode': 200,
             'headers': {
                 'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type'
+                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Profile'
             },
             'body': ''
         }
 
+    if method == 'GET':
+        try:
+            conn = get_db_connection()
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps(dedup_stats(conn), default=str)
+            }
+        finally:
+            if 'conn' in locals():
+                conn.close()
+
     if method != 'POST':
         return {
             'statusCode': 405,
@@ -33,53 +398,66 @@ def handler(event: dict, context) -> dict:
         }
 
     try:
-        body = json.loads(event.get('body', '{}'))
-        file_data = body.get('file')
-        file_name = body.get('fileName', 'photo.jpg')
-        
-        if not file_data:
+        request_headers = {key.lower(): value for key, value in (event.get('headers') or {}).items()}
+        request_type = request_headers.get('content-type', 'application/json')
+        query = event.get('queryStringParameters') or {}
+
+        if request_type.startswith('multipart/form-data'):
+            with span('parse', len(event.get('body') or '')):
+                file_name, file_view = multipart_file(raw_body(event), request_type)
+        elif not request_type.startswith('application/json'):
+            file_name = query.get('fileName', 'photo.jpg')
+            if event.get('isBase64Encoded') and event.get('body'):
+                return upload_response(Base64Reader(event['body']), file_name)
+            with span('base64_decode' if event.get('isBase64Encoded') else 'parse', len(event.get('body') or '')):
+                file_view = memoryview(raw_body(event))
+        else:
+            with span('parse', len(event.get('body') or '')):
+                body = json.loads(event.get('body', '{}'))
+            file_data = body.get('file')
+            file_name = body.get('fileName', 'photo.jpg')
+
+            if body.get('mode') == 'presign':
+                s3_key, content_type = describe_file(file_name)
+                register_upload(s3_key)
+                with span('presign'):
+                    upload_url = s3_client().generate_presigned_url(
+                        'put_object',
+                        Params={'Bucket': 'files', 'Key': s3_key, 'ContentType': content_type},
+                        ExpiresIn=PRESIGN_EXPIRES
+                    )
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({
+                        'uploadUrl': upload_url,
+                        'method': 'PUT',
+                        'headers': {'Content-Type': content_type},
+                        'expiresIn': PRESIGN_EXPIRES,
+                        'url': cdn_url(s3_key),
+                        'key': s3_key,
+                        'fileName': file_name
+                    })
+                }
+
+            if body.get('mode') == 'process':
+                if not upload_pending(body.get('key') or ''):
+                    return unknown_upload_response()
+                return process_response(body['key'], file_name)
+
+            if file_data and file_data.startswith('data:'):
+                file_data = file_data.split(',')[1]
+            with span('base64_decode', len(file_data or '')):
+                file_view = memoryview(base64.b64decode(file_data)) if file_data else None
+
+        if not file_view:
             return {
                 'statusCode': 400,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
                 'body': json.dumps({'error': 'No file data provided'})
             }
 
-        if file_data.startswith('data:'):
-            file_data = file_data.split(',')[1]
-        
-        file_bytes = base64.b64decode(file_data)
-        
-        file_extension = file_name.split('.')[-1] if '.' in file_name else 'jpg'
-        unique_id = str(uuid.uuid4())
-        s3_key = f'photos/{unique_id}.{file_extension}'
-        
-        content_type = 'image/jpeg'
-        if file_extension.lower() == 'png':
-            content_type = 'image/png'
-        elif file_extension.lower() == 'gif':
-            content_type = 'image/gif'
-        elif file_extension.lower() == 'webp':
-            content_type = 'image/webp'
-        
-        s3.put_object(
-            Bucket='files',
-            Key=s3_key,
-            Body=file_bytes,
-            ContentType=content_type
-        )
-        
-        cdn_url = f"https://cdn.poehali.dev/projects/{os.environ['AWS_ACCESS_KEY_ID']}/bucket/{s3_key}"
-        
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({
-                'url': cdn_url,
-                'key': s3_key,
-                'size': len(file_bytes),
-                'fileName': file_name
-            })
-        }
+        return upload_response(BufferReader(file_view), file_name)
 
     except Exception as e:
         return {
@@ -0,0 +1,30 @@
+import os
+import threading
+
+S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL') or 'https://bucket.poehali.dev'
+
+_lock = threading.Lock()
+_state = {}
+
+
+def warm(name: str, factory):
+    """Объект, переживающий тёплые вызовы функции: создаётся при первом обращении, дальше берётся из памяти процесса"""
+    value = _state.get(name)
+    if value is None:
+        with _lock:
+            value = _state.get(name)
+            if value is None:
+                value = _state[name] = factory()
+    return value
+
+
+def s3_client():
+    """S3-клиент; boto3 импортируется только здесь, чтобы OPTIONS и ошибки валидации не платили за его загрузку"""
+    def create():
+        import boto3
+        return boto3.client('s3',
+            endpoint_url=S3_ENDPOINT_URL,
+            aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'],
+            aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY'],
+        )
+    return warm('s3', create)
@@ -1,12 +1,42 @@
+import hashlib
 import json
 import os
-import psycopg2
-from psycopg2.extras import RealDictCursor
+import secrets
 
-def get_db_connection():
-    dsn = os.environ.get('DATABASE_URL')
-    return psycopg2.connect(dsn, cursor_factory=RealDictCursor)
+from db import execute_prepared, get_db_connection
+from timing import span, traced
+from user_cache import user_cache
 
+USER_JSON = '''
+    json_build_object(
+        'id', users.id,
+        'email', users.email,
+        'name', users.name,
+        'subscription_plan', users.subscription_plan,
+        'subscription_expires_at', api_timestamp(users.subscription_expires_at),
+        'created_at', api_timestamp(users.created_at)
+    )::text AS body
+'''
+
+SESSION_DAYS = int(os.environ.get('SESSION_DAYS') or 30)
+
+
+def create_session(cur, user_id: int) -> str:
+    '''Новая сессия пользователя; в базе хранится только sha256 токена'''
+    token = secrets.token_urlsafe(32)
+    cur.execute('''
+        INSERT INTO user_sessions (token_hash, user_id, expires_at)
+        VALUES (%s, %s, CURRENT_TIMESTAMP + %s * INTERVAL '1 day')
+    ''', (hashlib.sha256(token.encode()).hexdigest(), user_id, SESSION_DAYS))
+    return token
+
+
+def with_session(user: dict, token: str) -> str:
+    '''Тело ответа входа: JSON пользователя и session_token для заголовка X-Session-Token'''
+    return json.dumps({**json.loads(user['body']), 'session_token': token})
+
+
+@traced('users')
 def handler(event: dict, context) -> dict:
     '''API для управления пользователями'''
     
@@ -18,7 +48,7 @@ def handler(event: dict, context) -> dict:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, PUT, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type'
+                'Access-Control-Allow-Headers': 'Content-Type, X-Profile'
             },
             'body': ''
         }
@@ -28,6 +58,26 @@ def handler(event: dict, context) -> dict:
         'Access-Control-Allow-Origin': '*'
     }
     
+    if method == 'GET':
+        params = event.get('queryStringParameters') or {}
+        
+        if params.get('cache_stats'):
+            return {
+                'statusCode': 200,
+                'headers': headers,
+                'body': json.dumps(user_cache.stats)
+            }
+        
+        if params.get('email') or params.get('id'):
+            with span('cache'):
+                user = user_cache.get(email=params.get('email'), user_id=params.get('id'))
+            if user is not None:
+                return {
+                    'statusCode': 200,
+                    'headers': {**headers, 'X-Cache': 'HIT'},
+                    'body': user
+                }
+    
     try:
         conn = get_db_connection()
         cur = conn.cursor()
@@ -44,21 +94,40 @@ def handler(event: dict, context) -> dict:
                     'body': json.dumps({'error': 'email required'})
                 }
             
-            cur.execute('''
+            if body.get('action') == 'login':
+                execute_prepared(conn, cur, 'users_json_by_email', f'SELECT id, email, {USER_JSON} FROM users WHERE email = %s', (email,))
+                user = cur.fetchone()
+                if not user:
+                    return {
+                        'statusCode': 404,
+                        'headers': headers,
+                        'body': json.dumps({'error': 'User not found'})
+                    }
+                token = create_session(cur, user['id'])
+                conn.commit()
+                return {
+                    'statusCode': 200,
+                    'headers': headers,
+                    'body': with_session(user, token)
+                }
+            
+            cur.execute(f'''
                 INSERT INTO users (email, name, subscription_plan)
                 VALUES (%s, %s, 'demo')
                 ON CONFLICT (email) DO UPDATE 
                 SET name = EXCLUDED.name
-                RETURNING *
+                RETURNING id, email, {USER_JSON}
             ''', (email, name))
             
             user = cur.fetchone()
+            token = create_session(cur, user['id'])
             conn.commit()
+            user_cache.put(user)
             
             return {
                 'statusCode': 201,
                 'headers': headers,
-                'body': json.dumps(dict(user), default=str)
+                'body': with_session(user, token)
             }
         
         elif method == 'GET':
@@ -66,9 +135,9 @@ def handler(event: dict, context) -> dict:
             user_id = event.get('queryStringParameters', {}).get('id')
             
             if email:
-                cur.execute('SELECT * FROM users WHERE email = %s', (email,))
+                execute_prepared(conn, cur, 'users_json_by_email', f'SELECT id, email, {USER_JSON} FROM users WHERE email = %s', (email,))
             elif user_id:
-                cur.execute('SELECT * FROM users WHERE id = %s', (user_id,))
+                execute_prepared(conn, cur, 'users_json_by_id', f'SELECT id, email, {USER_JSON} FROM users WHERE id = %s', (user_id,))
             else:
                 return {
                     'statusCode': 400,
@@ -85,10 +154,12 @@ def handler(event: dict, context) -> dict:
                     'body': json.dumps({'error': 'User not found'})
                 }
             
+            user_cache.put(user)
+            
             return {
                 'statusCode': 200,
-                'headers': headers,
-                'body': json.dumps(dict(user), default=str)
+                'headers': {**headers, 'X-Cache': 'MISS'},
+                'body': user['body']
             }
         
         elif method == 'PUT':
@@ -123,7 +194,7 @@ def handler(event: dict, context) -> dict:
                 }
             
             params.append(user_id)
-            query = f"UPDATE users SET {', '.join(updates)} WHERE id = %s RETURNING *"
+            query = f"UPDATE users SET {', '.join(updates)} WHERE id = %s RETURNING id, email, {USER_JSON}"
             cur.execute(query, params)
             
             user = cur.fetchone()
@@ -136,10 +207,12 @@ def handler(event: dict, context) -> dict:
                     'body': json.dumps({'error': 'User not found'})
                 }
             
+            user_cache.put(user)
+            
             return {
                 'statusCode': 200,
                 'headers': headers,
-                'body': json.dumps(dict(user), default=str)
+                'body': user['body']
             }
         
         else:
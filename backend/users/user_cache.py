@@ -0,0 +1,104 @@
+"""Кэш готовых JSON-ответов users.
+
+Окно устаревания. put обновляет кэш только там, куда пишет этот экземпляр функции:
+- MemoryBackend (USER_CACHE_URL не задан) у каждого экземпляра свой, и после записи в users
+  другие тёплые экземпляры отдают прежний ответ до USER_CACHE_MEMORY_TTL секунд (по умолчанию 1).
+  Этого хватает, чтобы снять повторы одного запроса, но не больше;
+- RedisBackend общий: put сразу виден всем экземплярам, а USER_CACHE_TTL (по умолчанию 30 с)
+  ограничивает устаревание, только если запись в Redis не удалась.
+Если экземпляров функции может быть больше одного и секунда устаревания недопустима, задайте USER_CACHE_URL.
+USER_CACHE_TTL=0 выключает кэш в обоих случаях.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE') or 1024)
+USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL') or 30)
+USER_CACHE_MEMORY_TTL = min(USER_CACHE_TTL, float(os.environ.get('USER_CACHE_MEMORY_TTL') or 1))
+USER_CACHE_URL = os.environ.get('USER_CACHE_URL')
+
+
+class MemoryBackend:
+    """LRU с TTL в памяти процесса; живёт между тёплыми вызовами функции, но не видит записей других экземпляров"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, key: str) -> Optional[str]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, ttl: float):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+
+class RedisBackend:
+    """Общий кэш для всех экземпляров функции в Redis-совместимом хранилище.
+
+    Ошибки хранилища не роняют запрос: чтение считается промахом, запись пропускается.
+    """
+
+    def __init__(self, url: str):
+        import redis
+        self.errors = redis.RedisError
+        self.client = redis.Redis.from_url(url, socket_timeout=0.2, socket_connect_timeout=0.2)
+
+    def get(self, key: str) -> Optional[str]:
+        try:
+            raw = self.client.get(key)
+        except self.errors:
+            return None
+        return raw.decode() if raw else None
+
+    def set(self, key: str, value: str, ttl: float):
+        try:
+            self.client.set(key, value, px=int(ttl * 1000))
+        except self.errors:
+            pass
+
+
+class UserCache:
+    """Read-through кэш готовых JSON-ответов users по id и по email; каждая запись в users обязана вызвать put"""
+
+    def __init__(self, backend, ttl: float = USER_CACHE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self.stats = {'hits': 0, 'misses': 0, 'refreshes': 0}
+
+    def get(self, email: Optional[str] = None, user_id=None) -> Optional[str]:
+        key = f'user:email:{email}' if email else f'user:id:{user_id}'
+        user = self.backend.get(key)
+        self.stats['hits' if user is not None else 'misses'] += 1
+        return user
+
+    def put(self, user: dict):
+        """user - строка с id, email и body (JSON ответа)"""
+        self.stats['refreshes'] += 1
+        for key in (f"user:id:{user['id']}", f"user:email:{user['email']}"):
+            self.backend.set(key, user['body'], self.ttl)
+
+
+def create_backend():
+    if USER_CACHE_URL:
+        return RedisBackend(USER_CACHE_URL)
+    return MemoryBackend(USER_CACHE_SIZE)
+
+
+user_cache = UserCache(create_backend(), USER_CACHE_TTL if USER_CACHE_URL else USER_CACHE_MEMORY_TTL)
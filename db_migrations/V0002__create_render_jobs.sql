@@ -0,0 +1,20 @@
+CREATE TABLE IF NOT EXISTS render_jobs (
+    id SERIAL PRIMARY KEY,
+    video_id VARCHAR(36) NOT NULL,
+    project_id INTEGER REFERENCES projects(id),
+    params JSONB NOT NULL,
+    status VARCHAR(20) DEFAULT 'queued',
+    progress INTEGER DEFAULT 0,
+    video_url TEXT,
+    stats JSONB,
+    error TEXT,
+    attempts INTEGER DEFAULT 0,
+    locked_by VARCHAR(64),
+    locked_at TIMESTAMP,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+CREATE INDEX idx_render_jobs_queue ON render_jobs(created_at) WHERE status IN ('queued', 'rendering');
+CREATE INDEX idx_render_jobs_project_id ON render_jobs(project_id);
@@ -0,0 +1,9 @@
+ALTER TABLE project_photos ADD COLUMN IF NOT EXISTS width INTEGER;
+ALTER TABLE project_photos ADD COLUMN IF NOT EXISTS height INTEGER;
+ALTER TABLE project_photos ADD COLUMN IF NOT EXISTS orientation VARCHAR(10);
+ALTER TABLE project_photos ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64);
+ALTER TABLE project_photos ADD COLUMN IF NOT EXISTS thumbnail_url TEXT;
+ALTER TABLE project_photos ADD COLUMN IF NOT EXISTS proxy_720_url TEXT;
+ALTER TABLE project_photos ADD COLUMN IF NOT EXISTS proxy_1080_url TEXT;
+
+CREATE INDEX idx_photos_content_hash ON project_photos(content_hash);
@@ -0,0 +1,33 @@
+CREATE TABLE IF NOT EXISTS photo_blobs (
+    content_hash VARCHAR(64) PRIMARY KEY,
+    s3_key TEXT NOT NULL,
+    size BIGINT NOT NULL,
+    derivatives JSONB DEFAULT '{}',
+    metadata JSONB DEFAULT '{}',
+    ref_count INTEGER DEFAULT 0,
+    dedup_hits INTEGER DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX idx_photo_blobs_orphans ON photo_blobs(last_used_at) WHERE ref_count <= 0;
+
+CREATE OR REPLACE FUNCTION photo_blobs_ref_count() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.content_hash IS NOT NULL THEN
+        UPDATE photo_blobs
+        SET ref_count = ref_count + 1, last_used_at = CURRENT_TIMESTAMP
+        WHERE content_hash = NEW.content_hash;
+    END IF;
+    IF TG_OP IN ('DELETE', 'UPDATE') AND OLD.content_hash IS NOT NULL THEN
+        UPDATE photo_blobs
+        SET ref_count = ref_count - 1, last_used_at = CURRENT_TIMESTAMP
+        WHERE content_hash = OLD.content_hash;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER project_photos_blob_ref_count
+AFTER INSERT OR DELETE OR UPDATE OF content_hash ON project_photos
+FOR EACH ROW EXECUTE FUNCTION photo_blobs_ref_count();
@@ -0,0 +1,5 @@
+CREATE INDEX idx_projects_user_created ON projects(user_id, created_at DESC, id DESC);
+CREATE INDEX idx_photos_project_position ON project_photos(project_id, position, id);
+
+DROP INDEX IF EXISTS idx_projects_user_id;
+DROP INDEX IF EXISTS idx_photos_project_id;
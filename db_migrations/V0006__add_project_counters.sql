@@ -0,0 +1,50 @@
+ALTER TABLE projects ADD COLUMN IF NOT EXISTS photo_count INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE projects ADD COLUMN IF NOT EXISTS total_duration INTEGER GENERATED ALWAYS AS (photo_count * COALESCE(duration, 5)) STORED;
+
+CREATE OR REPLACE FUNCTION project_photos_counters() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE projects p
+        SET photo_count = p.photo_count + d.delta, updated_at = CURRENT_TIMESTAMP
+        FROM (SELECT project_id, COUNT(*) AS delta FROM new_photos GROUP BY project_id) d
+        WHERE p.id = d.project_id;
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE projects p
+        SET photo_count = p.photo_count - d.delta, updated_at = CURRENT_TIMESTAMP
+        FROM (SELECT project_id, COUNT(*) AS delta FROM old_photos GROUP BY project_id) d
+        WHERE p.id = d.project_id;
+    ELSE
+        UPDATE projects p
+        SET photo_count = p.photo_count + d.delta, updated_at = CURRENT_TIMESTAMP
+        FROM (
+            SELECT project_id, SUM(delta) AS delta FROM (
+                SELECT project_id, 1 AS delta FROM new_photos
+                UNION ALL
+                SELECT project_id, -1 AS delta FROM old_photos
+            ) changes GROUP BY project_id
+        ) d
+        WHERE p.id = d.project_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER project_photos_counters_insert
+AFTER INSERT ON project_photos
+REFERENCING NEW TABLE AS new_photos
+FOR EACH STATEMENT EXECUTE FUNCTION project_photos_counters();
+
+CREATE TRIGGER project_photos_counters_delete
+AFTER DELETE ON project_photos
+REFERENCING OLD TABLE AS old_photos
+FOR EACH STATEMENT EXECUTE FUNCTION project_photos_counters();
+
+CREATE TRIGGER project_photos_counters_update
+AFTER UPDATE ON project_photos
+REFERENCING OLD TABLE AS old_photos NEW TABLE AS new_photos
+FOR EACH STATEMENT EXECUTE FUNCTION project_photos_counters();
+
+UPDATE projects p
+SET photo_count = c.photo_count
+FROM (SELECT project_id, COUNT(*) AS photo_count FROM project_photos GROUP BY project_id) c
+WHERE p.id = c.project_id;
@@ -0,0 +1,40 @@
+ALTER TABLE projects ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 1;
+
+CREATE TABLE IF NOT EXISTS project_list_versions (
+    user_id INTEGER PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 1
+);
+
+CREATE OR REPLACE FUNCTION projects_bump_version() RETURNS trigger AS $$
+BEGIN
+    NEW.version = OLD.version + 1;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER projects_version
+BEFORE UPDATE ON projects
+FOR EACH ROW EXECUTE FUNCTION projects_bump_version();
+
+CREATE OR REPLACE FUNCTION projects_bump_list_version() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.user_id IS NOT NULL THEN
+        INSERT INTO project_list_versions (user_id) VALUES (NEW.user_id)
+        ON CONFLICT (user_id) DO UPDATE SET version = project_list_versions.version + 1;
+    END IF;
+    IF TG_OP = 'DELETE' OR (TG_OP = 'UPDATE' AND OLD.user_id IS DISTINCT FROM NEW.user_id) THEN
+        IF OLD.user_id IS NOT NULL THEN
+            UPDATE project_list_versions SET version = version + 1 WHERE user_id = OLD.user_id;
+        END IF;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER projects_list_version
+AFTER INSERT OR DELETE OR UPDATE ON projects
+FOR EACH ROW EXECUTE FUNCTION projects_bump_list_version();
+
+INSERT INTO project_list_versions (user_id)
+SELECT DISTINCT user_id FROM projects WHERE user_id IS NOT NULL
+ON CONFLICT (user_id) DO NOTHING;
@@ -0,0 +1,6 @@
+CREATE OR REPLACE FUNCTION api_timestamp(ts TIMESTAMP) RETURNS TEXT AS $$
+    SELECT CASE
+        WHEN EXTRACT(MICROSECONDS FROM ts)::BIGINT % 1000000 = 0 THEN to_char(ts, 'YYYY-MM-DD HH24:MI:SS')
+        ELSE to_char(ts, 'YYYY-MM-DD HH24:MI:SS.US')
+    END
+$$ LANGUAGE sql STABLE;
@@ -0,0 +1,20 @@
+ALTER TABLE render_jobs ADD COLUMN IF NOT EXISTS user_id INTEGER REFERENCES users(id);
+ALTER TABLE render_jobs ADD COLUMN IF NOT EXISTS plan VARCHAR(50) NOT NULL DEFAULT 'demo';
+ALTER TABLE render_jobs ADD COLUMN IF NOT EXISTS cost REAL NOT NULL DEFAULT 0;
+ALTER TABLE render_jobs ADD COLUMN IF NOT EXISTS queued_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+ALTER TABLE render_jobs ADD COLUMN IF NOT EXISTS started_at TIMESTAMP;
+
+UPDATE render_jobs j
+SET user_id = p.user_id,
+    plan = COALESCE(u.subscription_plan, 'demo')
+FROM projects p
+LEFT JOIN users u ON u.id = p.user_id
+WHERE p.id = j.project_id;
+
+UPDATE render_jobs
+SET cost = jsonb_array_length(params->'photos') * COALESCE((params->>'duration')::REAL, 5),
+    queued_at = created_at,
+    started_at = CASE WHEN status <> 'queued' THEN locked_at END;
+
+CREATE INDEX idx_render_jobs_user_active ON render_jobs(user_id) WHERE status IN ('queued', 'rendering');
+CREATE INDEX idx_render_jobs_started_at ON render_jobs(started_at);
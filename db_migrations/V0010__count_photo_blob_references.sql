@@ -0,0 +1,81 @@
+CREATE INDEX IF NOT EXISTS idx_photo_blobs_s3_key ON photo_blobs(s3_key);
+
+CREATE OR REPLACE FUNCTION photo_blob_key(url TEXT) RETURNS TEXT AS $$
+    SELECT substring(url FROM '/bucket/(.+)$')
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION render_job_photo_urls(params JSONB) RETURNS SETOF TEXT AS $$
+    SELECT CASE jsonb_typeof(photo) WHEN 'string' THEN photo #>> '{}' ELSE photo->>'url' END
+    FROM (
+        SELECT jsonb_array_elements(CASE jsonb_typeof(params->'photos') WHEN 'array' THEN params->'photos' ELSE '[]' END) AS photo
+        UNION ALL
+        SELECT jsonb_array_elements(CASE jsonb_typeof(item->'photos') WHEN 'array' THEN item->'photos' ELSE '[]' END)
+        FROM jsonb_array_elements(CASE jsonb_typeof(params->'batch') WHEN 'array' THEN params->'batch' ELSE '[]' END) AS item
+    ) photos
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION project_photos_resolve_blob() RETURNS trigger AS $$
+BEGIN
+    IF NEW.content_hash IS NULL
+       OR (TG_OP = 'UPDATE' AND NEW.photo_url IS DISTINCT FROM OLD.photo_url
+           AND NEW.content_hash IS NOT DISTINCT FROM OLD.content_hash) THEN
+        NEW.content_hash := (SELECT content_hash FROM photo_blobs WHERE s3_key = photo_blob_key(NEW.photo_url) LIMIT 1);
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER project_photos_resolve_blob
+BEFORE INSERT OR UPDATE OF photo_url, content_hash ON project_photos
+FOR EACH ROW EXECUTE FUNCTION project_photos_resolve_blob();
+
+DROP TRIGGER IF EXISTS project_photos_blob_ref_count ON project_photos;
+CREATE TRIGGER project_photos_blob_ref_count
+AFTER INSERT OR DELETE OR UPDATE OF photo_url, content_hash ON project_photos
+FOR EACH ROW EXECUTE FUNCTION photo_blobs_ref_count();
+
+CREATE OR REPLACE FUNCTION render_job_active(status TEXT) RETURNS BOOLEAN AS $$
+    SELECT COALESCE(status IN ('queued', 'rendering'), FALSE)
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION render_jobs_blob_ref_count() RETURNS trigger AS $$
+DECLARE
+    params JSONB;
+    delta INTEGER;
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') AND render_job_active(NEW.status)
+       AND NOT (TG_OP = 'UPDATE' AND render_job_active(OLD.status)) THEN
+        params := NEW.params;
+        delta := 1;
+    ELSIF TG_OP IN ('DELETE', 'UPDATE') AND render_job_active(OLD.status)
+          AND NOT (TG_OP = 'UPDATE' AND render_job_active(NEW.status)) THEN
+        params := OLD.params;
+        delta := -1;
+    ELSE
+        RETURN NULL;
+    END IF;
+    UPDATE photo_blobs b
+    SET ref_count = b.ref_count + delta * refs.count, last_used_at = CURRENT_TIMESTAMP
+    FROM (
+        SELECT photo_blob_key(url) AS s3_key, COUNT(*) AS count
+        FROM render_job_photo_urls(params) AS url
+        GROUP BY 1
+    ) refs
+    WHERE b.s3_key = refs.s3_key;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER render_jobs_blob_ref_count
+AFTER INSERT OR DELETE OR UPDATE OF status ON render_jobs
+FOR EACH ROW EXECUTE FUNCTION render_jobs_blob_ref_count();
+
+UPDATE project_photos pp
+SET content_hash = b.content_hash
+FROM photo_blobs b
+WHERE pp.content_hash IS NULL AND b.s3_key = photo_blob_key(pp.photo_url);
+
+UPDATE photo_blobs b
+SET ref_count = (SELECT COUNT(*) FROM project_photos pp WHERE pp.content_hash = b.content_hash)
+              + (SELECT COUNT(*) FROM render_jobs j, render_job_photo_urls(j.params) AS url
+                 WHERE render_job_active(j.status) AND photo_blob_key(url) = b.s3_key);
@@ -0,0 +1,8 @@
+CREATE TABLE IF NOT EXISTS user_sessions (
+    token_hash VARCHAR(64) PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP NOT NULL
+);
+
+CREATE INDEX idx_user_sessions_user_id ON user_sessions(user_id);
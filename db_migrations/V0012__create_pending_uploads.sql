@@ -0,0 +1,7 @@
+CREATE TABLE IF NOT EXISTS pending_uploads (
+    s3_key TEXT PRIMARY KEY,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP NOT NULL
+);
+
+CREATE INDEX idx_pending_uploads_expires_at ON pending_uploads(expires_at);
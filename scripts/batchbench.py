@@ -0,0 +1,121 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+FUNCTION_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'photos')
+sys.path.insert(0, FUNCTION_DIR)
+
+from bench import install_round_trip_counter, reset_database
+
+
+def write_transactions(database_url: str) -> int:
+    """Номер следующей транзакции с записью: разница двух замеров минус один - число закоммиченных записей.
+
+    Счёт идёт по всему кластеру: автоанализ после крупной вставки тоже может занять номер.
+    Соединение открывается через счётчик обращений, поэтому measure обнуляет его уже после замера.
+    """
+    import psycopg2
+    from psycopg2.extras import RealDictCursor
+
+    conn = psycopg2.connect(database_url)
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute('SELECT txid_current() AS xid')
+            value = cur.fetchone()['xid']
+        conn.commit()
+        return value
+    finally:
+        conn.close()
+
+
+def call(event: dict) -> dict:
+    import index
+
+    response = index.handler(event, None)
+    if response['statusCode'] not in (200, 201):
+        raise RuntimeError(response)
+    return response
+
+
+def measure(label: str, database_url: str, counter, run) -> dict:
+    """Время, число транзакций с записью и обращений к Postgres из процесса для одного сценария"""
+    first_xid = write_transactions(database_url)
+    counter.value = 0
+    started = time.perf_counter()
+    run()
+    seconds = time.perf_counter() - started
+    round_trips = counter.value
+    return {
+        'case': label,
+        'ms': seconds * 1000,
+        'commits': write_transactions(database_url) - first_xid - 1,
+        'round_trips': round_trips,
+    }
+
+
+def main() -> int:
+    """Добавление и перестановка 500 фото: по одному запросу на фото против пакетных POST и PUT"""
+    parser = argparse.ArgumentParser(description='Benchmark inserting and reordering a large batch of photos')
+    parser.add_argument('--photos', type=int, default=500)
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--reset-db', action='store_true', help='recreate schema public from db_migrations first')
+    args = parser.parse_args()
+
+    if not args.database_url:
+        parser.error('--database-url or DATABASE_URL is required')
+    if args.reset_db:
+        reset_database(args.database_url)
+    os.environ.update(DATABASE_URL=args.database_url, TIMING_LOG='0')
+    counter = install_round_trip_counter()
+
+    import psycopg2
+    from psycopg2.extras import RealDictCursor
+
+    conn = psycopg2.connect(args.database_url)
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute("INSERT INTO projects (title) VALUES ('batchbench single'), ('batchbench batch') RETURNING id")
+        single_project, batch_project = [row['id'] for row in cur.fetchall()]
+    conn.commit()
+    conn.close()
+
+    photos = [{'photo_url': f'https://cdn.poehali.dev/files/batchbench/{index}.jpg', 'photo_name': f'{index}.jpg',
+               'width': 4000, 'height': 3000, 'orientation': 'landscape'} for index in range(args.photos)]
+    inserted = {}
+
+    def insert_one_by_one():
+        for position, photo in enumerate(photos):
+            call({'httpMethod': 'POST', 'body': json.dumps({'project_id': single_project, 'position': position, **photo})})
+
+    def insert_batch():
+        response = call({'httpMethod': 'POST', 'body': json.dumps({'project_id': batch_project, 'photos': photos})})
+        inserted['ids'] = [photo['id'] for photo in json.loads(response['body'])]
+
+    def reorder_row_by_row():
+        raw = psycopg2.connect(args.database_url)
+        try:
+            with raw.cursor() as cur:
+                for position, photo_id in enumerate(reversed(inserted['ids'])):
+                    cur.execute('UPDATE project_photos SET position = %s WHERE id = %s', (position, photo_id))
+                    raw.commit()
+        finally:
+            raw.close()
+
+    def reorder_bulk():
+        call({'httpMethod': 'PUT', 'body': json.dumps({'project_id': batch_project, 'order': inserted['ids']})})
+
+    results = [
+        measure(f'{args.photos} single POSTs', args.database_url, counter, insert_one_by_one),
+        measure('one batch POST', args.database_url, counter, insert_batch),
+        measure('reorder row by row', args.database_url, counter, reorder_row_by_row),
+        measure('one reorder PUT', args.database_url, counter, reorder_bulk),
+    ]
+    print(f"{'case':<20} {'wall ms':>9} {'commits':>8} {'round trips':>12}")
+    for result in results:
+        print(f"{result['case']:<20} {result['ms']:>9.1f} {result['commits']:>8} {result['round_trips']:>12}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
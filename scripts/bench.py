@@ -0,0 +1,250 @@
+import argparse
+import glob
+import json
+import logging
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from urllib.parse import parse_qsl, urlsplit
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+BACKEND_DIR = os.path.join(ROOT_DIR, 'backend')
+MIGRATIONS_DIR = os.path.join(ROOT_DIR, 'db_migrations')
+
+HANDLERS = ('users', 'projects', 'photos', 'upload-photo', 'generate-video')
+
+
+def load_events(handler: str) -> list:
+    """События handler(event, context) из tests.json функции: path разбирается в queryStringParameters"""
+    with open(os.path.join(BACKEND_DIR, handler, 'tests.json')) as fixtures:
+        tests = json.load(fixtures)['tests']
+    events = []
+    for test in tests:
+        url = urlsplit(test.get('path', '/'))
+        event = {
+            'httpMethod': test['method'],
+            'path': url.path,
+            'headers': {'Content-Type': 'application/json', **test.get('headers', {})},
+            'queryStringParameters': dict(parse_qsl(url.query)),
+        }
+        if 'body' in test:
+            event['body'] = json.dumps(test['body'])
+        events.append((test['name'], event, test.get('expectedStatus')))
+    return events
+
+
+def percentile(sorted_values: list, share: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * share))]
+
+
+def install_round_trip_counter():
+    """Считает обращения к Postgres в текущем потоке: подключения, execute, commit и rollback"""
+    import psycopg2
+    from psycopg2.extras import RealDictCursor
+
+    counter = threading.local()
+
+    def count():
+        counter.value = getattr(counter, 'value', 0) + 1
+
+    class CountingCursor(RealDictCursor):
+        def execute(self, query, vars=None):
+            count()
+            return super().execute(query, vars)
+
+        def executemany(self, query, vars_list):
+            count()
+            return super().executemany(query, vars_list)
+
+    class CountingConnection(psycopg2.extensions.connection):
+        def cursor(self, *args, **kwargs):
+            kwargs['cursor_factory'] = CountingCursor
+            return super().cursor(*args, **kwargs)
+
+        def commit(self):
+            count()
+            return super().commit()
+
+        def rollback(self):
+            count()
+            return super().rollback()
+
+    connect = psycopg2.connect
+
+    def counting_connect(*args, **kwargs):
+        count()
+        return connect(*args, connection_factory=CountingConnection, **kwargs)
+
+    psycopg2.connect = counting_connect
+    return counter
+
+
+def run_worker(handler: str, concurrency: int, requests: int) -> dict:
+    """Прогон одной функции в отдельном процессе: свои db.py и warm.py, свой пиковый RSS"""
+    handler_dir = os.path.join(BACKEND_DIR, handler)
+    sys.path.insert(0, handler_dir)
+    os.chdir(handler_dir)
+    counter = install_round_trip_counter()
+    import index
+
+    def call(event: dict) -> tuple:
+        counter.value = 0
+        started = time.perf_counter()
+        response = index.handler(json.loads(json.dumps(event)), None)
+        return (time.perf_counter() - started) * 1000, response['statusCode'], counter.value
+
+    results = []
+    for name, event, expected in load_events(handler):
+        warmup = call(event)
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            started = time.perf_counter()
+            samples = list(pool.map(lambda _: call(event), range(requests)))
+            elapsed = time.perf_counter() - started
+        latencies = sorted(sample[0] for sample in samples)
+        results.append({
+            'name': name,
+            'method': event['httpMethod'],
+            'expected_status': expected,
+            'warmup_status': warmup[1],
+            'requests': requests,
+            'unexpected_status': sum(1 for sample in samples if expected and sample[1] != expected),
+            'throughput_rps': requests / elapsed,
+            'p50_ms': percentile(latencies, 0.50),
+            'p95_ms': percentile(latencies, 0.95),
+            'p99_ms': percentile(latencies, 0.99),
+            'db_round_trips': statistics.mean(sample[2] for sample in samples),
+        })
+    return {
+        'handler': handler,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'events': results,
+    }
+
+
+def reset_database(database_url: str):
+    """Пересоздаёт схему public и применяет db_migrations по порядку"""
+    import psycopg2
+
+    conn = psycopg2.connect(database_url)
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute('DROP SCHEMA public CASCADE; CREATE SCHEMA public')
+        for path in sorted(glob.glob(os.path.join(MIGRATIONS_DIR, 'V*.sql'))):
+            with open(path) as migration:
+                cur.execute(migration.read())
+    conn.close()
+
+
+def start_s3_stand_in() -> tuple:
+    """Локальный S3 на moto с бакетом files; для MinIO и т.п. задайте S3_ENDPOINT_URL сами"""
+    import boto3
+    from moto.server import ThreadedMotoServer
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = ThreadedMotoServer(ip_address='127.0.0.1', port=0)
+    server.start()
+    host, port = server.get_host_and_port()
+    endpoint = f'http://{host}:{port}'
+    boto3.client('s3', endpoint_url=endpoint, region_name='us-east-1',
+                 aws_access_key_id='bench', aws_secret_access_key='bench').create_bucket(Bucket='files')
+    return server, endpoint
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def print_report(report: dict, baseline: dict = None):
+    previous = {}
+    for handler in (baseline or {}).get('handlers', []):
+        for event in handler['events']:
+            previous[(handler['handler'], event['name'])] = event
+    print(f"{'handler / event':<58}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'db rt':>7}{'bad':>5}")
+    for handler in report['handlers']:
+        print(f"{handler['handler']}  (peak RSS {handler['peak_rss_mb']:.0f} MB)")
+        for event in handler['events']:
+            line = (f"  {event['name'][:56]:<56}{event['throughput_rps']:>9.0f}{event['p50_ms']:>9.2f}"
+                    f"{event['p95_ms']:>9.2f}{event['p99_ms']:>9.2f}{event['db_round_trips']:>7.1f}"
+                    f"{event['unexpected_status']:>5}")
+            before = previous.get((handler['handler'], event['name']))
+            if before:
+                line += f"   p50 {event['p50_ms'] / before['p50_ms'] - 1:+.0%}, rps {event['throughput_rps'] / before['throughput_rps'] - 1:+.0%}"
+            print(line)
+
+
+def main() -> int:
+    """Нагрузочный прогон handler-ов на событиях из tests.json против локальных Postgres и S3"""
+    parser = argparse.ArgumentParser(description='Benchmark backend handlers with their tests.json events')
+    parser.add_argument('handlers', nargs='*', default=list(HANDLERS), help='handler directories to run')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200, help='requests per event')
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--reset-db', action='store_true', help='recreate schema public from db_migrations first')
+    parser.add_argument('--output', help='save results as JSON')
+    parser.add_argument('--compare', help='JSON from a previous run to diff against')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args.worker, args.concurrency, args.requests)))
+        return 0
+
+    if not args.database_url:
+        parser.error('--database-url or DATABASE_URL is required')
+    if args.reset_db:
+        reset_database(args.database_url)
+
+    server = None
+    env = {'TIMING_LOG': '0', **os.environ, 'DATABASE_URL': args.database_url,
+           'DB_POOL_MAX_SIZE': str(max(args.concurrency, int(os.environ.get('DB_POOL_MAX_SIZE') or 0)))}
+    if not env.get('S3_ENDPOINT_URL'):
+        server, env['S3_ENDPOINT_URL'] = start_s3_stand_in()
+        env.update(AWS_ACCESS_KEY_ID='bench', AWS_SECRET_ACCESS_KEY='bench', AWS_DEFAULT_REGION='us-east-1')
+
+    try:
+        handlers = []
+        for handler in args.handlers:
+            result = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--worker', handler,
+                 '--concurrency', str(args.concurrency), '--requests', str(args.requests)],
+                env=env, capture_output=True, text=True,
+            )
+            if result.returncode != 0:
+                print(result.stderr, file=sys.stderr)
+                return 1
+            handlers.append(json.loads(result.stdout.strip().splitlines()[-1]))
+    finally:
+        if server:
+            server.stop()
+
+    report = {
+        'revision': git_revision(),
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'python': sys.version.split()[0],
+        'concurrency': args.concurrency,
+        'requests_per_event': args.requests,
+        'handlers': handlers,
+    }
+    baseline = None
+    if args.compare:
+        with open(args.compare) as previous:
+            baseline = json.load(previous)
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
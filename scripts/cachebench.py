@@ -0,0 +1,143 @@
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+FUNCTION_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'users')
+
+from bench import percentile, reset_database
+
+MODES = ('off', 'memory')
+
+
+def install_query_counter() -> dict:
+    """Общий для всех потоков счётчик SQL-запросов, которые users отправляет в Postgres"""
+    from db import TimedCursor
+
+    counter = {'queries': 0}
+    lock = threading.Lock()
+    execute = TimedCursor.execute
+
+    def counted_execute(self, query, vars=None):
+        with lock:
+            counter['queries'] += 1
+        return execute(self, query, vars)
+
+    TimedCursor.execute = counted_execute
+    return counter
+
+
+def run_worker(mode: str, users: int, requests: int, concurrency: int, write_share: float, seed: int) -> dict:
+    """Нагрузка в отдельном процессе: кэш настраивается переменными окружения до импорта user_cache"""
+    sys.path.insert(0, FUNCTION_DIR)
+    import index
+
+    counter = install_query_counter()
+    prefix = f'cachebench-{os.getpid()}'
+    for number in range(users):
+        index.handler({'httpMethod': 'POST', 'body': json.dumps({'email': f'{prefix}-{number}@example.com', 'name': 'Cache Bench'})}, None)
+    ids = {}
+    for number in range(users):
+        body = index.handler({'httpMethod': 'GET', 'queryStringParameters': {'email': f'{prefix}-{number}@example.com'}}, None)['body']
+        ids[number] = json.loads(body)['id']
+
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(users)]
+    plan = []
+    for _ in range(requests):
+        number = rng.choices(range(users), weights)[0]
+        if rng.random() < write_share:
+            plan.append({'httpMethod': 'PUT', 'body': json.dumps({'id': ids[number], 'name': f'Renamed {rng.random():.6f}'})})
+        elif rng.random() < 0.7:
+            plan.append({'httpMethod': 'GET', 'queryStringParameters': {'email': f'{prefix}-{number}@example.com'}})
+        else:
+            plan.append({'httpMethod': 'GET', 'queryStringParameters': {'id': str(ids[number])}})
+
+    def send(event: dict) -> float:
+        started = time.perf_counter()
+        response = index.handler(event, None)
+        if response['statusCode'] != 200:
+            raise RuntimeError(response)
+        return (time.perf_counter() - started) * 1000
+
+    index.user_cache.stats.update(hits=0, misses=0, refreshes=0)
+    counter['queries'] = 0
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = sorted(pool.map(send, plan))
+    seconds = time.perf_counter() - started
+
+    renamed = index.handler({'httpMethod': 'PUT', 'body': json.dumps({'id': ids[0], 'name': 'After Bench'})}, None)
+    after = index.handler({'httpMethod': 'GET', 'queryStringParameters': {'email': f'{prefix}-0@example.com'}}, None)
+    stats = index.user_cache.stats
+    return {
+        'mode': mode,
+        'requests': requests,
+        'rps': requests / seconds,
+        'db_qps': counter['queries'] / seconds,
+        'queries_per_request': counter['queries'] / requests,
+        'hit_rate': stats['hits'] / max(1, stats['hits'] + stats['misses']),
+        'p50_ms': percentile(latencies, 0.5),
+        'p99_ms': percentile(latencies, 0.99),
+        'fresh_after_write': json.loads(renamed['body'])['name'] == json.loads(after['body'])['name'] == 'After Bench',
+    }
+
+
+def main() -> int:
+    """Нагрузка на users с распределением Ципфа: запросов в Postgres в секунду с кэшем и без"""
+    parser = argparse.ArgumentParser(description='Load test users lookups and count Postgres queries with and without the cache')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--write-share', type=float, default=0.01, help='share of PUT renames in the mix')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--cache-url', help='also run against a Redis-compatible USER_CACHE_URL')
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--reset-db', action='store_true', help='recreate schema public from db_migrations first')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args.worker, args.users, args.requests, args.concurrency, args.write_share, args.seed)))
+        return 0
+
+    if not args.database_url:
+        parser.error('--database-url or DATABASE_URL is required')
+    if args.reset_db:
+        reset_database(args.database_url)
+
+    modes = {'off': {'USER_CACHE_TTL': '0'}, 'memory': {}}
+    if args.cache_url:
+        modes['redis'] = {'USER_CACHE_URL': args.cache_url}
+    results = []
+    for mode, overrides in modes.items():
+        env = {'TIMING_LOG': '0', **os.environ, 'DATABASE_URL': args.database_url,
+               'DB_POOL_MAX_SIZE': str(args.concurrency), **overrides}
+        if mode != 'redis':
+            env.pop('USER_CACHE_URL', None)
+        result = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--worker', mode, '--users', str(args.users),
+             '--requests', str(args.requests), '--concurrency', str(args.concurrency),
+             '--write-share', str(args.write_share), '--seed', str(args.seed)],
+            env=env, capture_output=True, text=True,
+        )
+        if result.returncode != 0:
+            print(result.stderr, file=sys.stderr)
+            return 1
+        results.append(json.loads(result.stdout.strip().splitlines()[-1]))
+
+    print(f'{args.requests} requests over {args.users} users, concurrency {args.concurrency}, {args.write_share:.0%} writes')
+    print(f"{'cache':<8} {'req/s':>8} {'db QPS':>8} {'queries/req':>12} {'hit rate':>9} {'p50 ms':>8} {'p99 ms':>8} {'fresh':>6}")
+    for result in results:
+        print(f"{result['mode']:<8} {result['rps']:>8.0f} {result['db_qps']:>8.0f} {result['queries_per_request']:>12.3f} "
+              f"{result['hit_rate']:>9.1%} {result['p50_ms']:>8.2f} {result['p99_ms']:>8.2f} {str(result['fresh_after_write']):>6}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
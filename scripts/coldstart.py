@@ -0,0 +1,130 @@
+import argparse
+import hashlib
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+
+SHARED_MODULES = ('db.py', 'timing.py', 'warm.py')
+
+IMPORT_BUDGET_MS = 150
+FIRST_REQUEST_BUDGET_MS = 200
+
+PROBE = '''
+import json, time
+started = time.perf_counter()
+import index
+imported = time.perf_counter()
+response = index.handler({'httpMethod': 'OPTIONS', 'headers': {}}, None)
+finished = time.perf_counter()
+print(json.dumps({
+    'status': response['statusCode'],
+    'import_ms': (imported - started) * 1000,
+    'first_request_ms': (finished - started) * 1000,
+}))
+'''
+
+
+def handler_dirs() -> list:
+    return sorted(
+        name for name in os.listdir(BACKEND_DIR)
+        if os.path.isfile(os.path.join(BACKEND_DIR, name, 'index.py'))
+    )
+
+
+def shared_module_drift() -> dict:
+    """Копии общих модулей в функциях, разошедшиеся между собой: {модуль: {sha256: [функции]}}"""
+    drift = {}
+    for module in SHARED_MODULES:
+        copies = {}
+        for name in handler_dirs():
+            path = os.path.join(BACKEND_DIR, name, module)
+            if os.path.isfile(path):
+                with open(path, 'rb') as source:
+                    copies.setdefault(hashlib.sha256(source.read()).hexdigest(), []).append(name)
+        if len(copies) > 1:
+            drift[module] = copies
+    return drift
+
+
+def parse_importtime(stderr: str) -> list:
+    """Строки -X importtime: (self_us, cumulative_us, module)"""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, module = line[len('import time:'):].split('|')
+        entries.append((int(self_us), int(cumulative_us), module.strip()))
+    return entries
+
+
+def probe(name: str) -> dict:
+    """Один холодный старт: новый интерпретатор, импорт index и первый OPTIONS-запрос"""
+    env = {
+        **os.environ,
+        'AWS_ACCESS_KEY_ID': os.environ.get('AWS_ACCESS_KEY_ID', 'coldstart'),
+        'AWS_SECRET_ACCESS_KEY': os.environ.get('AWS_SECRET_ACCESS_KEY', 'coldstart'),
+        'DATABASE_URL': os.environ.get('DATABASE_URL', 'postgresql://coldstart@localhost/coldstart'),
+        'PYTHONDONTWRITEBYTECODE': '1',
+    }
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', PROBE],
+        cwd=os.path.join(BACKEND_DIR, name), env=env, capture_output=True, text=True, check=True,
+    )
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    timings['imports'] = parse_importtime(result.stderr)
+    return timings
+
+
+def measure(name: str, runs: int) -> dict:
+    samples = [probe(name) for _ in range(runs)]
+    heaviest = sorted(samples[-1]['imports'], reverse=True)[:5]
+    return {
+        'handler': name,
+        'status': samples[-1]['status'],
+        'import_ms': statistics.median(s['import_ms'] for s in samples),
+        'first_request_ms': statistics.median(s['first_request_ms'] for s in samples),
+        'heaviest_imports': [(module, round(self_us / 1000, 1)) for self_us, _, module in heaviest],
+    }
+
+
+def main() -> int:
+    """Холодный старт каждой функции из backend/; код выхода 1, если какая-то вышла за бюджет
+    или копии общих модулей (SHARED_MODULES) в функциях различаются"""
+    parser = argparse.ArgumentParser(description='Cold-start benchmark and budget check for backend handlers')
+    parser.add_argument('handlers', nargs='*', help='handler directories, all by default')
+    parser.add_argument('--runs', type=int, default=5, help='cold starts per handler, the median is reported')
+    parser.add_argument('--scale', type=float, default=1.0, help='multiplier for budgets on slower machines')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    import_budget = IMPORT_BUDGET_MS * args.scale
+    request_budget = FIRST_REQUEST_BUDGET_MS * args.scale
+    results = [measure(name, args.runs) for name in args.handlers or handler_dirs()]
+    failures = [
+        r for r in results
+        if r['status'] != 200 or r['import_ms'] > import_budget or r['first_request_ms'] > request_budget
+    ]
+    drift = shared_module_drift()
+
+    if args.json:
+        print(json.dumps({'budget_ms': {'import': import_budget, 'first_request': request_budget},
+                          'results': results, 'shared_module_drift': drift}, indent=2))
+    else:
+        print(f"{'handler':<16}{'import ms':>12}{'first OPTIONS ms':>20}")
+        for r in results:
+            mark = '  OVER BUDGET' if r in failures else ''
+            print(f"{r['handler']:<16}{r['import_ms']:>12.1f}{r['first_request_ms']:>20.1f}{mark}")
+        print(f'budget: import {import_budget:.0f} ms, first request {request_budget:.0f} ms')
+        for r in failures:
+            print(f"{r['handler']}: heaviest imports (self ms): {r['heaviest_imports']}")
+        for module, copies in drift.items():
+            print(f"{module} copies differ: {' | '.join(', '.join(names) for names in copies.values())}")
+    return 1 if failures or drift else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
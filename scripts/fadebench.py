@@ -0,0 +1,104 @@
+import argparse
+import os
+import sys
+import time
+
+FUNCTION_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'generate-video')
+sys.path.insert(0, FUNCTION_DIR)
+
+import numpy as np
+from PIL import Image
+
+from render import RenderSpec, fit_source, iter_segment_frames
+
+RESOLUTIONS = {'720p': (1280, 720), '1080p': (1920, 1080)}
+
+
+def pillow_animate(source: Image.Image, progress: float, spec: RenderSpec) -> Image.Image:
+    """Прежний кадр Кена Бёрнса: окно считается заново в каждом кадре"""
+    zoom_from, zoom_to = spec.animation['zoom']
+    pan_from, pan_to = spec.animation['pan']
+    zoom = zoom_from + (zoom_to - zoom_from) * progress
+    pan = pan_from + (pan_to - pan_from) * progress
+    src_w, src_h = source.size
+    box_w, box_h = src_w / zoom, src_h / zoom
+    left = (src_w - box_w) / 2 * (1 + pan)
+    top = (src_h - box_h) / 2
+    return source.resize(spec.output_size, Image.BILINEAR, box=(left, top, left + box_w, top + box_h))
+
+
+def pillow_fade(current: Image.Image, upcoming: Image.Image, alpha: float, spec: RenderSpec) -> Image.Image:
+    """Прежний fade: два Image.blend через чёрный кадр, оба исходника сэмплируются всегда"""
+    black = Image.new('RGB', spec.output_size)
+    if alpha < 0.5:
+        return Image.blend(current, black, alpha * 2)
+    return Image.blend(black, upcoming, (alpha - 0.5) * 2)
+
+
+def pillow_segment_frames(current: Image.Image, upcoming: Image.Image, spec: RenderSpec):
+    """Прежний iter_segment_frames на Pillow: кадры - Image, в ffmpeg уходил frame.tobytes()"""
+    total = spec.frames_per_photo
+    lead = spec.transition_frames
+    span = total + lead
+    transition_start = total - lead
+    for index in range(total):
+        frame = pillow_animate(current, (index + lead) / span, spec)
+        if index >= transition_start:
+            step = index - transition_start
+            incoming = pillow_animate(upcoming, step / span, spec)
+            frame = pillow_fade(frame, incoming, (step + 1) / (lead + 1), spec)
+        yield frame.tobytes()
+
+
+def numpy_segment_frames(current: Image.Image, upcoming: Image.Image, spec: RenderSpec):
+    for frame in iter_segment_frames(current, upcoming, spec):
+        yield memoryview(frame)
+
+
+IMPLEMENTATIONS = {'pillow': pillow_segment_frames, 'numpy': numpy_segment_frames}
+
+
+def random_source(rng: np.random.Generator, spec: RenderSpec) -> Image.Image:
+    cells = (rng.random((9, 16, 3)) * 255).astype(np.uint8)
+    return fit_source(Image.fromarray(cells).resize((1920, 1080), Image.BICUBIC), spec)
+
+
+def measure(name: str, spec: RenderSpec, sources: list, rounds: int) -> dict:
+    """Кадров в секунду на одном ядре без кодирования: только сэмплинг и смешивание"""
+    frames_of = IMPLEMENTATIONS[name]
+    frames = 0
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for current, upcoming in zip(sources, sources[1:]):
+            for _ in frames_of(current, upcoming, spec):
+                frames += 1
+    seconds = time.perf_counter() - started
+    return {'implementation': name, 'frames': frames, 'seconds': seconds, 'fps': frames / seconds}
+
+
+def main() -> int:
+    """fps сегмента с fade: прежний вариант на Image.blend против NumPy-композитинга"""
+    parser = argparse.ArgumentParser(description='Measure fade segment frame rate before and after NumPy compositing')
+    parser.add_argument('--resolution', choices=RESOLUTIONS, default='720p')
+    parser.add_argument('--duration', type=int, default=3, help='seconds per photo')
+    parser.add_argument('--photos', type=int, default=3)
+    parser.add_argument('--rounds', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    width, height = RESOLUTIONS[args.resolution]
+    spec = RenderSpec(width=width, height=height, duration=args.duration, animation_type='zoom', transition='fade')
+    rng = np.random.default_rng(args.seed)
+    sources = [random_source(rng, spec) for _ in range(args.photos)]
+
+    results = [measure(name, spec, sources, args.rounds) for name in IMPLEMENTATIONS]
+    print(f"{args.resolution} fade, {spec.fps} fps video, {spec.transition_frames} transition frames per {spec.frames_per_photo}")
+    print(f"{'implementation':<15} {'frames':>7} {'seconds':>8} {'fps':>7}")
+    for result in results:
+        print(f"{result['implementation']:<15} {result['frames']:>7} {result['seconds']:>8.2f} {result['fps']:>7.1f}")
+    print(f"speedup: {results[1]['fps'] / results[0]['fps']:.2f}x")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,150 @@
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+
+FUNCTION_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'projects')
+sys.path.insert(0, FUNCTION_DIR)
+
+from bench import percentile, reset_database
+
+LEGACY_LISTING = '''
+    SELECT p.*,
+           COALESCE(json_agg(
+               json_build_object(
+                   'id', pp.id,
+                   'photo_url', pp.photo_url,
+                   'photo_name', pp.photo_name,
+                   'position', pp.position
+               ) ORDER BY pp.position
+           ) FILTER (WHERE pp.id IS NOT NULL), '[]') as photos
+    FROM projects p
+    LEFT JOIN project_photos pp ON p.id = pp.project_id
+    WHERE p.user_id = %s
+    GROUP BY p.id
+    ORDER BY p.created_at DESC
+'''
+
+
+def seed_user(cur, projects: int, photos: int) -> int:
+    """Новый пользователь с projects проектами по photos фото; created_at идут с шагом в минуту"""
+    cur.execute('INSERT INTO users (email, name) VALUES (%s, %s) RETURNING id', (f'listbench-{uuid.uuid4()}@example.com', 'List Bench'))
+    user_id = cur.fetchone()['id']
+    cur.execute('''
+        INSERT INTO projects (user_id, title, created_at)
+        SELECT %s, 'Project ' || g, CURRENT_TIMESTAMP - g * INTERVAL '1 minute'
+        FROM generate_series(1, %s) g
+    ''', (user_id, projects))
+    cur.execute('''
+        INSERT INTO project_photos (project_id, photo_url, photo_name, position, thumbnail_url)
+        SELECT p.id, 'https://cdn.poehali.dev/files/' || p.id || '-' || k || '.jpg', 'photo' || k || '.jpg', k,
+               'https://cdn.poehali.dev/files/' || p.id || '-' || k || '.webp'
+        FROM projects p, generate_series(0, %s - 1) k
+        WHERE p.user_id = %s
+    ''', (photos, user_id))
+    cur.execute('ANALYZE projects')
+    cur.execute('ANALYZE project_photos')
+    return user_id
+
+
+def legacy_listing(user_id: int) -> str:
+    """Прежний GET ?user_id=: все проекты со всеми фото одним GROUP BY, сериализация в Python"""
+    from db import get_db_connection
+
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(LEGACY_LISTING, (user_id,))
+            return json.dumps([dict(project) for project in cur.fetchall()], default=str)
+    finally:
+        conn.close()
+
+
+def handler_listing(params: dict) -> str:
+    import index
+
+    response = index.handler({'httpMethod': 'GET', 'queryStringParameters': params}, None)
+    if response['statusCode'] != 200:
+        raise RuntimeError(response)
+    return response['body']
+
+
+def measure(label: str, fetch, requests: int) -> dict:
+    latencies = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        body = fetch()
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+    return {'case': label, 'p50_ms': percentile(latencies, 0.5), 'p99_ms': percentile(latencies, 0.99), 'bytes': len(body)}
+
+
+def walk(user_id: int, limit: int) -> tuple:
+    """Проходит все страницы по next_cursor, возвращает id по порядку, число страниц и курсор последней"""
+    ids, pages, cursor, last_cursor = [], 0, None, None
+    while True:
+        params = {'user_id': str(user_id), 'limit': str(limit)}
+        if cursor:
+            params['cursor'] = cursor
+        page = json.loads(handler_listing(params))
+        pages += 1
+        ids.extend(project['id'] for project in page['projects'])
+        if not page['next_cursor']:
+            return ids, pages, cursor
+        cursor = page['next_cursor']
+
+
+def main() -> int:
+    """Список проектов пользователя с 10k проектов: прежний полный ответ против keyset-страниц"""
+    parser = argparse.ArgumentParser(description='Benchmark project listing for a user with many projects')
+    parser.add_argument('--projects', type=int, default=10000)
+    parser.add_argument('--photos', type=int, default=12, help='photos per project')
+    parser.add_argument('--requests', type=int, default=100, help='requests per page case')
+    parser.add_argument('--legacy-requests', type=int, default=5)
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--reset-db', action='store_true', help='recreate schema public from db_migrations first')
+    args = parser.parse_args()
+
+    if not args.database_url:
+        parser.error('--database-url or DATABASE_URL is required')
+    if args.reset_db:
+        reset_database(args.database_url)
+    os.environ.update(DATABASE_URL=args.database_url, TIMING_LOG='0')
+
+    from db import get_db_connection
+
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            started = time.perf_counter()
+            user_id = seed_user(cur, args.projects, args.photos)
+        conn.commit()
+    finally:
+        conn.close()
+    print(f'seeded user {user_id}: {args.projects} projects x {args.photos} photos in {time.perf_counter() - started:.1f}s')
+
+    started = time.perf_counter()
+    ids, pages, last_cursor = walk(user_id, 100)
+    walk_ms = (time.perf_counter() - started) * 1000
+    if len(ids) != args.projects or len(set(ids)) != len(ids):
+        raise RuntimeError(f'walk returned {len(ids)} ids, {len(set(ids))} unique')
+
+    user = str(user_id)
+    results = [
+        measure('legacy full listing', lambda: legacy_listing(user_id), args.legacy_requests),
+        measure('summary first page', lambda: handler_listing({'user_id': user}), args.requests),
+        measure('full first page', lambda: handler_listing({'user_id': user, 'view': 'full'}), args.requests),
+        measure('summary last page', lambda: handler_listing({'user_id': user, 'limit': '100', 'cursor': last_cursor}), args.requests),
+        measure('single project', lambda: handler_listing({'id': str(ids[len(ids) // 2])}), args.requests),
+    ]
+    print(f"{'case':<22} {'p50 ms':>9} {'p99 ms':>9} {'bytes':>10}")
+    for result in results:
+        print(f"{result['case']:<22} {result['p50_ms']:>9.2f} {result['p99_ms']:>9.2f} {result['bytes']:>10}")
+    print(f'walk: {pages} pages of 100, {walk_ms / pages:.2f} ms/page, every project once')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,77 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'users')
+sys.path.insert(0, BACKEND_DIR)
+
+from bench import percentile, reset_database
+
+MODES = ('unpooled', 'pooled')
+
+
+def connect_per_request(database_url: str):
+    """Прежний get_db_connection: новое соединение с Postgres на каждый вызов"""
+    import psycopg2
+
+    from db import TimedCursor
+    from timing import span
+
+    def get_db_connection():
+        with span('db_connect'):
+            return psycopg2.connect(database_url, cursor_factory=TimedCursor)
+
+    return get_db_connection
+
+
+def run(mode: str, requests: int, email: str, database_url: str) -> dict:
+    """Последовательные GET /?email=... в одном процессе, как тёплые вызовы функции"""
+    import db
+    import index
+
+    index.get_db_connection = connect_per_request(database_url) if mode == 'unpooled' else db.get_db_connection
+    event = {'httpMethod': 'GET', 'queryStringParameters': {'email': email}}
+    latencies = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        response = index.handler(event, None)
+        latencies.append((time.perf_counter() - started) * 1000)
+        if response['statusCode'] != 200:
+            raise RuntimeError(f'{mode}: {response}')
+    latencies.sort()
+    return {'mode': mode, 'p50_ms': percentile(latencies, 0.5), 'p99_ms': percentile(latencies, 0.99)}
+
+
+def main() -> int:
+    """p50/p99 GET пользователя с пулом соединений и с подключением на каждый запрос"""
+    parser = argparse.ArgumentParser(description='Compare users GET latency with and without the connection pool')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--reset-db', action='store_true', help='recreate schema public from db_migrations first')
+    parser.add_argument('--user-cache', action='store_true', help='keep the user cache on (by default every GET hits Postgres)')
+    args = parser.parse_args()
+
+    if not args.database_url:
+        parser.error('--database-url or DATABASE_URL is required')
+    if args.reset_db:
+        reset_database(args.database_url)
+    os.environ.update(DATABASE_URL=args.database_url, TIMING_LOG='0')
+    if not args.user_cache:
+        os.environ['USER_CACHE_TTL'] = '0'
+
+    import index
+
+    email = 'poolbench@example.com'
+    index.handler({'httpMethod': 'POST', 'body': json.dumps({'email': email, 'name': 'Pool Bench'})}, None)
+
+    results = [run(mode, args.requests, email, args.database_url) for mode in MODES]
+    print(f"{'mode':<10} {'p50 ms':>8} {'p99 ms':>8}")
+    for result in results:
+        print(f"{result['mode']:<10} {result['p50_ms']:>8.2f} {result['p99_ms']:>8.2f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,185 @@
+import argparse
+import heapq
+import json
+import os
+import random
+import sys
+
+SCHEDULER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'generate-video')
+sys.path.insert(0, SCHEDULER_DIR)
+
+from scheduler import FAIR_SHARE_WINDOW_MINUTES, admission_error, estimate_cost, pick, plan_name
+
+RENDER_SECONDS_PER_COST = 1.7
+POLICIES = ('fifo', 'fair')
+
+
+def workload(minutes: float, seed: int) -> list:
+    """Смешанный поток заявок (секунда, пользователь, тариф, params), отсортированный по времени.
+
+    Много demo-пользователей с короткими роликами и черновиками, pro с проектами по 10-20 фото,
+    пара обычных enterprise и один enterprise, который в начале выгружает пачку проектов по 200 фото;
+    ещё один pro пытается делать то же самое и должен упираться в допуск.
+    """
+    rng = random.Random(seed)
+    horizon = minutes * 60
+    requests = []
+
+    def poisson(user: str, plan: str, per_hour: float, make_params):
+        at = rng.expovariate(per_hour / 3600)
+        while at < horizon:
+            requests.append((at, user, plan, make_params()))
+            at += rng.expovariate(per_hour / 3600)
+
+    def photos(count: int) -> list:
+        return ['photo.jpg'] * count
+
+    for index in range(40):
+        poisson(f'demo-{index}', 'demo', 4, lambda: {
+            'photos': photos(rng.randint(1, 3)), 'duration': rng.choice((3, 5)),
+            'quality': 'draft' if rng.random() < 0.3 else 'final',
+        })
+    for index in range(10):
+        poisson(f'pro-{index}', 'pro', 3, lambda: {
+            'photos': photos(rng.randint(10, 20)), 'duration': rng.choice((3, 5)),
+            'resolution': '1080p' if rng.random() < 0.3 else '720p',
+            'quality': 'draft' if rng.random() < 0.3 else 'final',
+        })
+    for index in range(2):
+        poisson(f'enterprise-{index}', 'enterprise', 3, lambda: {
+            'photos': photos(rng.randint(20, 50)), 'duration': 5, 'resolution': '1080p',
+        })
+    for index in range(8):
+        requests.append((60 + index, 'heavy-enterprise', 'enterprise', {'photos': photos(200), 'duration': 5}))
+        requests.append((60 + index, 'heavy-pro', 'pro', {'photos': photos(200), 'duration': 5}))
+    return sorted(requests, key=lambda request: request[0])
+
+
+def fifo_pick(queued: list, running: list, started: dict, now: float) -> dict:
+    """Прежний claim_job: черновики раньше финальных, дальше по времени постановки, без лимитов"""
+    return min(queued, key=lambda job: (job['quality'] != 'draft', job['queued_at'], job['id']))
+
+
+def fair_pick(queued: list, running: list, started: dict, now: float) -> dict:
+    """Те же строки, что собирает SQL в claim_job, и тот же scheduler.pick; started - начатые задачи по пользователям"""
+    window = FAIR_SHARE_WINDOW_MINUTES * 60
+    users = {}
+    for job in running:
+        user = users.setdefault(job['user'], {'plan': job['plan'], 'running': 0, 'service': 0.0,
+                                              'job_id': None, 'job_cost': None, 'queued_at': None})
+        user['running'] += 1
+    for job in queued:
+        users.setdefault(job['user'], {'plan': job['plan'], 'running': 0, 'service': 0.0,
+                                       'job_id': None, 'job_cost': None, 'queued_at': None})
+    for user_key, user in users.items():
+        user['service'] = sum(job['cost'] for job in started.get(user_key, ())
+                              if job['finished_at'] is None or job['started_at'] > now - window)
+    heads = {}
+    for job in sorted(queued, key=lambda job: (job['quality'] != 'draft', job['queued_at'], job['id'])):
+        heads.setdefault(job['user'], job)
+    for user_key, job in heads.items():
+        users[user_key].update(job_id=job['id'], job_cost=job['cost'], queued_at=job['queued_at'])
+    chosen = pick(list(users.values()))
+    return next((job for job in queued if job['id'] == chosen), None)
+
+
+def simulate(policy: str, requests: list, workers: int) -> dict:
+    """Событийная модель: воркер занят cost * RENDER_SECONDS_PER_COST секунд, выбор - при каждом освобождении"""
+    choose = fair_pick if policy == 'fair' else fifo_pick
+    queued, running, finished, rejected = [], [], [], []
+    completions = []
+    peak_depth = {}
+    backlog = {}
+    started = {}
+    now = 0.0
+    arrivals = list(requests)
+
+    def dispatch():
+        while queued and len(running) < workers:
+            job = choose(queued, running, started, now)
+            if job is None:
+                return
+            queued.remove(job)
+            job['started_at'] = now
+            running.append(job)
+            started.setdefault(job['user'], []).append(job)
+            heapq.heappush(completions, (now + job['cost'] * RENDER_SECONDS_PER_COST, job['id'], job))
+
+    next_id = 0
+    while arrivals or completions:
+        if completions and (not arrivals or completions[0][0] <= arrivals[0][0]):
+            now, _, job = heapq.heappop(completions)
+            job['finished_at'] = now
+            running.remove(job)
+            finished.append(job)
+            backlog[job['user']] -= job['cost']
+        else:
+            now, user, plan, params = arrivals.pop(0)
+            plan = plan_name(plan)
+            if policy == 'fair' and admission_error(plan, params, backlog.get(user, 0.0)):
+                rejected.append({'user': user, 'plan': plan})
+            else:
+                next_id += 1
+                job = {'id': next_id, 'user': user, 'plan': plan, 'cost': estimate_cost(params),
+                       'quality': params.get('quality', 'final'), 'queued_at': now,
+                       'started_at': None, 'finished_at': None}
+                queued.append(job)
+                backlog[user] = backlog.get(user, 0.0) + job['cost']
+        dispatch()
+        for plan in {job['plan'] for job in queued}:
+            peak_depth[plan] = max(peak_depth.get(plan, 0), sum(1 for job in queued if job['plan'] == plan))
+
+    report = {}
+    for plan in sorted({job['plan'] for job in finished} | {job['plan'] for job in rejected}):
+        waits = sorted(job['started_at'] - job['queued_at'] for job in finished if job['plan'] == plan)
+        report[plan] = {
+            'jobs': len(waits),
+            'rejected': sum(1 for job in rejected if job['plan'] == plan),
+            'wait_p50_s': percentile(waits, 0.50),
+            'wait_p95_s': percentile(waits, 0.95),
+            'wait_max_s': waits[-1] if waits else 0.0,
+            'peak_queue_depth': peak_depth.get(plan, 0),
+        }
+    light = sorted(job['started_at'] - job['queued_at'] for job in finished if not job['user'].startswith('heavy'))
+    return {'policy': policy, 'makespan_s': now, 'plans': report,
+            'others_wait_p95_s': percentile(light, 0.95)}
+
+
+def percentile(sorted_values: list, share: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * share))]
+
+
+def print_report(result: dict):
+    print(f"{result['policy']}: makespan {result['makespan_s'] / 60:.0f} min, "
+          f"p95 wait of everyone but the heavy users {result['others_wait_p95_s']:.0f} s")
+    print(f"  {'plan':<12}{'jobs':>6}{'rejected':>10}{'p50 wait':>11}{'p95 wait':>11}{'max wait':>11}{'peak depth':>12}")
+    for plan, row in result['plans'].items():
+        print(f"  {plan:<12}{row['jobs']:>6}{row['rejected']:>10}{row['wait_p50_s']:>10.0f}s"
+              f"{row['wait_p95_s']:>10.0f}s{row['wait_max_s']:>10.0f}s{row['peak_queue_depth']:>12}")
+
+
+def main() -> int:
+    """Прогон смешанной нагрузки через прежний FIFO и через scheduler: p95 ожидания по тарифам"""
+    parser = argparse.ArgumentParser(description='Replay a mixed render workload through the queue policies')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--minutes', type=float, default=60, help='length of the arrival window')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--policy', choices=POLICIES, action='append', help='default: all policies')
+    parser.add_argument('--output', help='save results as JSON')
+    args = parser.parse_args()
+
+    requests = workload(args.minutes, args.seed)
+    results = [simulate(policy, requests, args.workers) for policy in args.policy or POLICIES]
+    for result in results:
+        print_report(result)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump({'workers': args.workers, 'minutes': args.minutes, 'seed': args.seed,
+                       'requests': len(requests), 'results': results}, output, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
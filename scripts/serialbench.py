@@ -0,0 +1,110 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+FUNCTION_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'photos')
+sys.path.insert(0, FUNCTION_DIR)
+
+from bench import reset_database
+
+
+def seed_project(cur, rows: int) -> int:
+    """Проект с rows фото: все поля метаданных заполнены, у части фото нет имени"""
+    cur.execute("INSERT INTO projects (title) VALUES ('serialbench') RETURNING id")
+    project_id = cur.fetchone()['id']
+    cur.execute('''
+        INSERT INTO project_photos (project_id, photo_url, photo_name, position, width, height, orientation,
+                                    content_hash, thumbnail_url, proxy_720_url, proxy_1080_url)
+        SELECT %s, 'https://cdn.poehali.dev/files/serialbench/' || k || '.jpg',
+               CASE WHEN k %% 10 = 0 THEN NULL ELSE 'Фото ' || k || '.jpg' END, k, 4000, 3000, 'landscape',
+               md5(k::text) || md5(k::text), 'https://cdn.poehali.dev/files/serialbench/' || k || '/thumb.webp',
+               'https://cdn.poehali.dev/files/serialbench/' || k || '/720.jpg',
+               'https://cdn.poehali.dev/files/serialbench/' || k || '/1080.jpg'
+        FROM generate_series(0, %s - 1) k
+    ''', (project_id, rows))
+    return project_id
+
+
+def median_ms(run, repeats: int) -> float:
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        run()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main() -> int:
+    """Стоимость сериализации фото проекта на 1k строк: dict + json.dumps в Python против JSON из Postgres"""
+    parser = argparse.ArgumentParser(description='Measure per-1k-row serialization cost of the photos GET body')
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--repeats', type=int, default=100)
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--reset-db', action='store_true', help='recreate schema public from db_migrations first')
+    args = parser.parse_args()
+
+    if not args.database_url:
+        parser.error('--database-url or DATABASE_URL is required')
+    if args.reset_db:
+        reset_database(args.database_url)
+    os.environ.update(DATABASE_URL=args.database_url, TIMING_LOG='0')
+
+    import psycopg2
+    from psycopg2.extras import RealDictCursor
+
+    import index
+
+    conn = psycopg2.connect(args.database_url, cursor_factory=RealDictCursor)
+    cur = conn.cursor()
+    project_id = seed_project(cur, args.rows)
+    conn.commit()
+
+    rows_query = f'''
+        SELECT pp.id, pp.project_id, pp.photo_url, pp.photo_name, pp.position, pp.created_at,
+               pp.width, pp.height, pp.orientation, pp.content_hash,
+               pp.thumbnail_url, pp.proxy_720_url, pp.proxy_1080_url
+        FROM project_photos pp WHERE pp.project_id = {project_id} ORDER BY pp.position
+    '''
+    json_query = f'''
+        SELECT COALESCE(json_agg(fields ORDER BY pp.position), '[]')::text AS body
+        FROM project_photos pp
+        CROSS JOIN LATERAL (SELECT {index.PHOTO_FIELDS}) fields
+        WHERE pp.project_id = {project_id}
+    '''
+
+    def fetch_rows() -> list:
+        cur.execute(rows_query)
+        return cur.fetchall()
+
+    def fetch_json() -> str:
+        cur.execute(json_query)
+        return cur.fetchone()['body']
+
+    rows = fetch_rows()
+    if json.loads(json.dumps([dict(row) for row in rows], default=str)) != json.loads(fetch_json()):
+        raise RuntimeError('Python and Postgres bodies differ')
+
+    event = {'httpMethod': 'GET', 'queryStringParameters': {'project_id': str(project_id)}}
+    scale = 1000 / args.rows
+    results = [
+        ('python: query + fetch rows', median_ms(fetch_rows, args.repeats)),
+        ('python: dict copy', median_ms(lambda: [dict(row) for row in rows], args.repeats)),
+        ('python: dict copy + json.dumps', median_ms(lambda: json.dumps([dict(row) for row in rows], default=str), args.repeats)),
+        ('postgres: JSON query + fetch', median_ms(fetch_json, args.repeats)),
+        ('handler GET photos', median_ms(lambda: index.handler(event, None), args.repeats)),
+    ]
+    conn.close()
+
+    print(f'{args.rows} photos, median of {args.repeats}, scaled to 1k rows; bodies checked equal')
+    for label, ms in results:
+        print(f'{label:<32} {ms * scale:>8.2f} ms')
+    python_total = results[0][1] + results[2][1]
+    print(f"{'python path total':<32} {python_total * scale:>8.2f} ms")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
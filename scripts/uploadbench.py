@@ -0,0 +1,152 @@
+import argparse
+import base64
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+import uuid
+
+FUNCTION_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'upload-photo')
+
+from bench import reset_database, start_s3_stand_in
+
+MODES = ('legacy', 'json', 'binary', 'multipart', 'presign')
+BOUNDARY = 'uploadbench'
+
+
+def peak_rss_kb() -> int:
+    """VmHWM процесса: пиковый RSS с последнего сброса"""
+    with open('/proc/self/status') as status:
+        return int(re.search(r'VmHWM:\s+(\d+)', status.read()).group(1))
+
+
+def reset_peak_rss():
+    """Сбрасывает VmHWM до текущего RSS (Linux 4.0+), чтобы пик подготовки события не попал в замер"""
+    with open('/proc/self/clear_refs', 'w') as clear_refs:
+        clear_refs.write('5')
+
+
+def legacy_upload(event: dict) -> dict:
+    """Прежний upload-photo: base64 из JSON декодируется целиком и уходит одним put_object"""
+    from warm import s3_client
+
+    body = json.loads(event['body'])
+    file_bytes = base64.b64decode(body['file'])
+    s3_key = f'photos/{uuid.uuid4()}.jpg'
+    s3_client().put_object(Bucket='files', Key=s3_key, Body=file_bytes, ContentType='image/jpeg')
+    return {'statusCode': 200, 'body': json.dumps({'key': s3_key, 'size': len(file_bytes)})}
+
+
+def presigned_upload(data: bytes) -> dict:
+    """Браузер получает presigned URL, сам кладёт файл в S3, функция только обрабатывает его"""
+    import urllib3
+
+    import index
+
+    presign = index.handler({'httpMethod': 'POST', 'body': json.dumps({'mode': 'presign', 'fileName': 'bench.jpg'})}, None)
+    target = json.loads(presign['body'])
+    put = urllib3.PoolManager().request('PUT', target['uploadUrl'], body=data, headers=target['headers'])
+    if put.status != 200:
+        return {'statusCode': put.status, 'body': put.data.decode(errors='replace')}
+    return index.handler({'httpMethod': 'POST', 'body': json.dumps({'mode': 'process', 'key': target['key'], 'fileName': 'bench.jpg'})}, None)
+
+
+def make_event(mode: str, data: bytes) -> dict:
+    if mode in ('legacy', 'json'):
+        return {'httpMethod': 'POST', 'headers': {'Content-Type': 'application/json'},
+                'body': json.dumps({'file': base64.b64encode(data).decode(), 'fileName': 'bench.jpg'})}
+    if mode == 'binary':
+        return {'httpMethod': 'POST', 'headers': {'Content-Type': 'image/jpeg'}, 'isBase64Encoded': True,
+                'body': base64.b64encode(data).decode(), 'queryStringParameters': {'fileName': 'bench.jpg'}}
+    body = (f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="file"; filename="bench.jpg"\r\n'
+            f'Content-Type: image/jpeg\r\n\r\n').encode() + data + f'\r\n--{BOUNDARY}--\r\n'.encode()
+    return {'httpMethod': 'POST', 'headers': {'Content-Type': f'multipart/form-data; boundary={BOUNDARY}'},
+            'isBase64Encoded': True, 'body': base64.b64encode(body).decode()}
+
+
+def run_worker(mode: str, size_mb: float) -> dict:
+    """Одна загрузка в отдельном процессе: пик RSS считается от состояния после сборки события"""
+    sys.path.insert(0, FUNCTION_DIR)
+    import index
+    from warm import s3_client
+
+    s3_client()
+    index.handler({'httpMethod': 'POST', 'body': json.dumps({'mode': 'presign', 'fileName': 'warm.jpg'})}, None)
+    data = os.urandom(int(size_mb * 1024 * 1024))
+    event = None if mode == 'presign' else make_event(mode, data)
+    if event is not None:
+        del data
+
+    reset_peak_rss()
+    baseline = peak_rss_kb()
+    started = time.perf_counter()
+    if mode == 'legacy':
+        response = legacy_upload(event)
+    elif mode == 'presign':
+        response = presigned_upload(data)
+    else:
+        response = index.handler(event, None)
+    seconds = time.perf_counter() - started
+    peak = peak_rss_kb()
+    return {
+        'mode': mode,
+        'status': response['statusCode'],
+        'latency_ms': seconds * 1000,
+        'rss_before_mb': baseline / 1024,
+        'peak_rss_mb': peak / 1024,
+        'peak_over_before_mb': (peak - baseline) / 1024,
+    }
+
+
+def main() -> int:
+    """Пиковый RSS и задержка загрузки большого файла: прежний base64-путь против потоковых режимов"""
+    parser = argparse.ArgumentParser(description='Measure peak RSS and latency of one large upload per mode')
+    parser.add_argument('--size-mb', type=float, default=25)
+    parser.add_argument('--mode', choices=MODES, action='append', help='default: all modes')
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--reset-db', action='store_true', help='recreate schema public from db_migrations first')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args.worker, args.size_mb)))
+        return 0
+
+    if not args.database_url:
+        parser.error('--database-url or DATABASE_URL is required')
+    if args.reset_db:
+        reset_database(args.database_url)
+
+    server = None
+    env = {'TIMING_LOG': '0', **os.environ, 'DATABASE_URL': args.database_url}
+    if not env.get('S3_ENDPOINT_URL'):
+        server, env['S3_ENDPOINT_URL'] = start_s3_stand_in()
+        env.update(AWS_ACCESS_KEY_ID='bench', AWS_SECRET_ACCESS_KEY='bench', AWS_DEFAULT_REGION='us-east-1')
+
+    try:
+        results = []
+        for mode in args.mode or MODES:
+            result = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--worker', mode, '--size-mb', str(args.size_mb)],
+                env=env, capture_output=True, text=True,
+            )
+            if result.returncode != 0:
+                print(result.stderr, file=sys.stderr)
+                return 1
+            results.append(json.loads(result.stdout.strip().splitlines()[-1]))
+    finally:
+        if server:
+            server.stop()
+
+    print(f'{args.size_mb:g} MB of random bytes per upload (not an image: derivatives are skipped)')
+    print(f"{'mode':<10} {'status':>6} {'latency ms':>11} {'RSS before MB':>14} {'peak RSS MB':>12} {'peak - before':>14}")
+    for result in results:
+        print(f"{result['mode']:<10} {result['status']:>6} {result['latency_ms']:>11.0f} {result['rss_before_mb']:>14.1f} "
+              f"{result['peak_rss_mb']:>12.1f} {result['peak_over_before_mb']:>14.1f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
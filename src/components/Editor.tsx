@@ -15,10 +15,24 @@ interface Photo {
   s3Url?: string;
 }
 
+interface UploadedPhoto {
+  url: string;
+  thumbnail_url?: string;
+  proxy_720_url?: string;
+  proxy_1080_url?: string;
+}
+
 const UPLOAD_API = 'https://functions.poehali.dev/ddcb5c35-3e04-44df-bde7-5315313e9aba';
 const GENERATE_VIDEO_API = 'https://functions.poehali.dev/6db7685b-2938-4e77-83f4-3ed428cc994e';
+const RENDER_POLL_INTERVAL = 2000;
+const RENDER_TIMEOUT = 15 * 60 * 1000;
+
+interface EditorProps {
+  userId: number | null;
+  sessionToken: string | null;
+}
 
-const Editor = () => {
+const Editor = ({ userId, sessionToken }: EditorProps) => {
   const [photos, setPhotos] = useState<Photo[]>([]);
   const [isProcessing, setIsProcessing] = useState(false);
   const [progress, setProgress] = useState(0);
@@ -27,6 +41,8 @@ const Editor = () => {
   const [transition, setTransition] = useState('fade');
   const [isDragging, setIsDragging] = useState(false);
   const [videoPreview, setVideoPreview] = useState<string>('');
+  const [videoUrl, setVideoUrl] = useState<string>('');
+  const [renderError, setRenderError] = useState<string>('');
   const [isPlaying, setIsPlaying] = useState(false);
   const fileInputRef = useRef<HTMLInputElement>(null);
 
@@ -89,40 +105,30 @@ const Editor = () => {
   };
 
   const handleDownloadVideo = () => {
-    if (!videoPreview) return;
+    if (!videoUrl && !videoPreview) return;
     
     const link = document.createElement('a');
-    link.href = videoPreview;
-    link.download = `video-${Date.now()}.png`;
+    link.href = videoUrl || videoPreview;
+    link.download = videoUrl ? `video-${Date.now()}.mp4` : `video-${Date.now()}.png`;
     document.body.appendChild(link);
     link.click();
     document.body.removeChild(link);
-    toast.success('Превью скачано!');
+    toast.success(videoUrl ? 'Видео скачано!' : 'Превью скачано!');
   };
 
-  const uploadPhotoToS3 = async (photo: Photo): Promise<string> => {
-    if (photo.s3Url) return photo.s3Url;
+  const uploadPhotoToS3 = async (photo: Photo): Promise<UploadedPhoto> => {
+    if (photo.s3Url) return { url: photo.s3Url };
     if (!photo.file) throw new Error('No file data');
 
-    const reader = new FileReader();
-    const base64 = await new Promise<string>((resolve, reject) => {
-      reader.onload = () => resolve(reader.result as string);
-      reader.onerror = reject;
-      reader.readAsDataURL(photo.file!);
-    });
-
-    const response = await fetch(UPLOAD_API, {
+    const response = await fetch(`${UPLOAD_API}?fileName=${encodeURIComponent(photo.name)}`, {
       method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify({
-        file: base64,
-        fileName: photo.name
-      })
+      headers: { 'Content-Type': photo.file.type || 'application/octet-stream' },
+      body: photo.file
     });
 
     if (!response.ok) throw new Error('Upload failed');
     const data = await response.json();
-    return data.url;
+    return { url: data.url, ...data.derivatives };
   };
 
   const generateVideoPreview = async () => {
@@ -164,6 +170,23 @@ const Editor = () => {
     }
   };
 
+  const waitForRender = async (jobId: number): Promise<{ videoUrl?: string; error?: string }> => {
+    const deadline = Date.now() + RENDER_TIMEOUT;
+    while (Date.now() < deadline) {
+      await new Promise(resolve => setTimeout(resolve, RENDER_POLL_INTERVAL));
+      const response = await fetch(`${GENERATE_VIDEO_API}?job_id=${jobId}`);
+      if (!response.ok) throw new Error('Render status failed');
+
+      const job = await response.json();
+      if (job.status === 'failed') {
+        return { error: `Не удалось собрать видео${job.error ? `: ${job.error}` : ''}` };
+      }
+      setProgress(40 + Math.round(job.progress * 0.6));
+      if (job.status === 'completed') return { videoUrl: job.video_url };
+    }
+    return { error: `Видео собирается дольше ${RENDER_TIMEOUT / 60000} минут. Попробуйте ещё раз позже` };
+  };
+
   const handleGenerate = async () => {
     if (photos.length === 0) {
       toast.error('Загрузите хотя бы одно фото');
@@ -173,6 +196,8 @@ const Editor = () => {
     setIsProcessing(true);
     setProgress(0);
     setVideoPreview('');
+    setVideoUrl('');
+    setRenderError('');
 
     try {
       setProgress(10);
@@ -180,8 +205,8 @@ const Editor = () => {
 
       const uploadedPhotos = await Promise.all(
         photos.map(async (photo) => {
-          const s3Url = await uploadPhotoToS3(photo);
-          return { url: s3Url, name: photo.name };
+          const uploaded = await uploadPhotoToS3(photo);
+          return { ...uploaded, name: photo.name };
         })
       );
 
@@ -190,22 +215,33 @@ const Editor = () => {
 
       const response = await fetch(GENERATE_VIDEO_API, {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
+        headers: {
+          'Content-Type': 'application/json',
+          ...(sessionToken ? { 'X-Session-Token': sessionToken } : {})
+        },
         body: JSON.stringify({
           photos: uploadedPhotos,
           duration: duration[0],
           animationType: animationType,
-          transition: transition
+          transition: transition,
+          user_id: userId
         })
       });
 
       if (!response.ok) throw new Error('Video generation failed');
 
-      setProgress(70);
       const data = await response.json();
+      setVideoPreview(data.preview_url);
+
+      const result = await waitForRender(data.job_id);
+      if (result.error) {
+        setRenderError(result.error);
+        toast.error(result.error);
+        return;
+      }
 
+      setVideoUrl(result.videoUrl ?? '');
       setProgress(100);
-      setVideoPreview(data.preview_url);
       toast.success('Видео готово!');
 
     } catch (error) {
@@ -299,7 +335,7 @@ const Editor = () => {
               <CardContent className="p-6">
                 <div className="flex items-center justify-between mb-4">
                   <h2 className="text-xl font-bold">Превью</h2>
-                  {videoPreview && <span className="text-xs text-green-500">✓ Готово</span>}
+                  {videoUrl && <span className="text-xs text-green-500">✓ Готово</span>}
                 </div>
                 <div className="aspect-video bg-gradient-to-br from-primary/20 to-secondary/20 rounded-xl flex items-center justify-center overflow-hidden relative">
                   {isProcessing ? (
@@ -311,6 +347,36 @@ const Editor = () => {
                         <p className="text-sm text-muted-foreground">{progress}%</p>
                       </div>
                     </div>
+                  ) : videoUrl ? (
+                    <div className="relative w-full h-full group">
+                      <video
+                        src={videoUrl}
+                        poster={videoPreview || undefined}
+                        controls
+                        className="w-full h-full object-cover"
+                      />
+                      <div className="absolute top-4 right-4 flex gap-2 opacity-0 group-hover:opacity-100 transition-opacity">
+                        <Button size="sm" variant="secondary" asChild>
+                          <a href={videoUrl} target="_blank" rel="noreferrer">
+                            <Icon name="ExternalLink" size={16} className="mr-1" />
+                            Открыть
+                          </a>
+                        </Button>
+                        <Button 
+                          size="sm" 
+                          variant="secondary"
+                          onClick={handleDownloadVideo}
+                        >
+                          <Icon name="Download" size={16} className="mr-1" />
+                          Скачать
+                        </Button>
+                      </div>
+                    </div>
+                  ) : renderError ? (
+                    <div className="text-center px-8">
+                      <Icon name="AlertTriangle" size={48} className="mx-auto mb-4 text-destructive" />
+                      <p className="text-destructive">{renderError}</p>
+                    </div>
                   ) : videoPreview && videoPreview.length > 0 ? (
                     <div className="relative w-full h-full group">
                       <img 
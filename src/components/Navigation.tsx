@@ -4,19 +4,43 @@ import { Dialog, DialogContent, DialogHeader, DialogTitle, DialogTrigger } from
 import { Input } from '@/components/ui/input';
 import { Label } from '@/components/ui/label';
 import { useState } from 'react';
+import { toast } from 'sonner';
+
+const USERS_API = 'https://functions.poehali.dev/d7dd1e63-1c30-4391-be59-794052130ee9';
 
 interface NavigationProps {
   activeTab: 'home' | 'editor' | 'projects' | 'gallery' | 'profile';
   setActiveTab: (tab: 'home' | 'editor' | 'projects' | 'gallery' | 'profile') => void;
   isLoggedIn: boolean;
   setIsLoggedIn: (value: boolean) => void;
+  setUserId: (value: number | null) => void;
+  setSessionToken: (value: string | null) => void;
 }
 
-const Navigation = ({ activeTab, setActiveTab, isLoggedIn, setIsLoggedIn }: NavigationProps) => {
+const Navigation = ({ activeTab, setActiveTab, isLoggedIn, setIsLoggedIn, setUserId, setSessionToken }: NavigationProps) => {
   const [showAuthDialog, setShowAuthDialog] = useState(false);
   const [authMode, setAuthMode] = useState<'login' | 'register'>('login');
+  const [email, setEmail] = useState('');
+
+  const handleAuth = async () => {
+    if (!email) {
+      toast.error('Введите email');
+      return;
+    }
+
+    const response = await fetch(USERS_API, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify(authMode === 'login' ? { email, action: 'login' } : { email })
+    });
+    if (!response.ok) {
+      toast.error(authMode === 'login' ? 'Пользователь не найден' : 'Не удалось создать аккаунт');
+      return;
+    }
 
-  const handleAuth = () => {
+    const user = await response.json();
+    setUserId(user.id);
+    setSessionToken(user.session_token);
     setIsLoggedIn(true);
     setShowAuthDialog(false);
     setActiveTab('editor');
@@ -101,7 +125,7 @@ const Navigation = ({ activeTab, setActiveTab, isLoggedIn, setIsLoggedIn }: Navi
                   <div className="space-y-4 py-4">
                     <div className="space-y-2">
                       <Label htmlFor="email">Email</Label>
-                      <Input id="email" type="email" placeholder="your@email.com" />
+                      <Input id="email" type="email" placeholder="your@email.com" value={email} onChange={(e) => setEmail(e.target.value)} />
                     </div>
                     <div className="space-y-2">
                       <Label htmlFor="password">Пароль</Label>
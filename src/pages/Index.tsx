@@ -11,6 +11,8 @@ import Navigation from '@/components/Navigation';
 const Index = () => {
   const [activeTab, setActiveTab] = useState<'home' | 'editor' | 'projects' | 'gallery' | 'profile'>('home');
   const [isLoggedIn, setIsLoggedIn] = useState(false);
+  const [userId, setUserId] = useState<number | null>(null);
+  const [sessionToken, setSessionToken] = useState<string | null>(null);
 
   return (
     <div className="min-h-screen bg-background">
@@ -19,6 +21,8 @@ const Index = () => {
         setActiveTab={setActiveTab}
         isLoggedIn={isLoggedIn}
         setIsLoggedIn={setIsLoggedIn}
+        setUserId={setUserId}
+        setSessionToken={setSessionToken}
       />
       
       <main>
@@ -31,7 +35,7 @@ const Index = () => {
           </>
         )}
         
-        {activeTab === 'editor' && isLoggedIn && <Editor />}
+        {activeTab === 'editor' && isLoggedIn && <Editor userId={userId} sessionToken={sessionToken} />}
         {activeTab === 'projects' && isLoggedIn && <Projects />}
         {activeTab === 'gallery' && <Gallery showAll />}
         {activeTab === 'profile' && isLoggedIn && <Profile />}
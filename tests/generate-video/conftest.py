@@ -0,0 +1,113 @@
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+FUNCTION_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'backend', 'generate-video')
+sys.path.insert(0, FUNCTION_DIR)
+
+CACHE_ROOT = tempfile.mkdtemp(prefix='generate-video-tests-')
+os.environ.setdefault('SOURCE_CACHE_DIR', os.path.join(CACHE_ROOT, 'sources'))
+os.environ.setdefault('SEGMENT_CACHE_DIR', os.path.join(CACHE_ROOT, 'segments'))
+
+import numpy as np
+from PIL import Image
+
+import render
+from cache import SegmentCache, SourceCache
+
+
+def make_photo(seed: int, size: tuple = (480, 270)) -> bytes:
+    """JPEG с крупными цветными пятнами: у каждого seed своя картинка"""
+    cells = (np.random.default_rng(seed).random((9, 16, 3)) * 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(cells).resize(size, Image.BICUBIC).save(buffer, format='JPEG', quality=85)
+    return buffer.getvalue()
+
+
+class PhotoServer:
+    """Локальная замена CDN: отдаёт photos[name] по /name.jpg с задержкой latency[name] секунд.
+
+    Считает запросы по именам (hits) и принятые TCP-соединения (connections).
+    """
+
+    def __init__(self):
+        self.photos = {}
+        self.latency = {}
+        self.hits = Counter()
+        self.connections = 0
+        self.lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                with server.lock:
+                    server.connections += 1
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                name = self.path.strip('/').rsplit('.', 1)[0]
+                time.sleep(server.latency.get(name, 0))
+                with server.lock:
+                    server.hits[name] += 1
+                data = server.photos.get(name)
+                if data is None:
+                    self.send_response(404)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'image/jpeg')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def url(self, name: str) -> str:
+        return f'http://127.0.0.1:{self.httpd.server_port}/{name}.jpg'
+
+    def add(self, name: str, data: bytes, latency: float = 0.0) -> str:
+        self.photos[name] = data
+        self.latency[name] = latency
+        return self.url(name)
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def photo_server():
+    server = PhotoServer()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def caches(tmp_path, monkeypatch):
+    """Пустые кэши исходников и сегментов на каждый тест; процессы пула получают их через fork"""
+    source_cache = SourceCache(str(tmp_path / 'sources'), 1024 ** 3)
+    segment_cache = SegmentCache(str(tmp_path / 'segments'), 1024 ** 3)
+    monkeypatch.setattr(render, 'source_cache', source_cache)
+    monkeypatch.setattr(render, 'segment_cache', segment_cache)
+    return source_cache, segment_cache
+
+
+@pytest.fixture
+def small_spec():
+    """Маленький кадр и низкий fps: рендер в тестах идёт за доли секунды на сегмент"""
+    return render.RenderSpec(width=320, height=180, fps=10, duration=2, animation_type='zoom', transition='fade')
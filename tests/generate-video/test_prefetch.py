@@ -0,0 +1,75 @@
+import time
+
+import render
+from cache import content_digest
+from conftest import make_photo
+from prefetch import PREFETCH_CONCURRENCY, Prefetcher
+
+
+def test_fetch_time_is_close_to_max_latency(photo_server, caches, small_spec):
+    latency = 0.4
+    photos = [photo_server.add(f'p{index}', make_photo(index), latency) for index in range(8)]
+
+    started = time.perf_counter()
+    sources = list(render.iter_sources(photos, small_spec))
+    elapsed = time.perf_counter() - started
+
+    assert len(sources) == len(photos)
+    assert latency <= elapsed < 2 * latency < len(photos) * latency
+
+
+def test_sources_come_in_position_order(photo_server, caches, small_spec):
+    data = [make_photo(index) for index in range(6)]
+    photos = [photo_server.add(f'p{index}', photo, 0.05 * (6 - index)) for index, photo in enumerate(data)]
+
+    sources = list(render.iter_sources(photos, small_spec))
+
+    assert [index for index, *_ in sources] == list(range(len(photos)))
+    assert [digest for _, digest, *_ in sources] == [content_digest(photo) for photo in data]
+    assert [upcoming for _, _, _, upcoming, _ in sources] == [content_digest(photo) for photo in data[1:]] + [None]
+
+
+def test_first_segment_is_ready_while_later_photos_download(photo_server, caches, small_spec):
+    photos = [photo_server.add(f'p{index}', make_photo(index), 1.0 if index == 5 else 0.0) for index in range(6)]
+
+    started = time.perf_counter()
+    sources = render.iter_sources(photos, small_spec)
+    next(sources)
+    first_ready = time.perf_counter() - started
+    list(sources)
+
+    assert first_ready < 0.5
+    assert time.perf_counter() - started >= 1.0
+
+
+def test_buffered_bytes_stay_under_the_cap():
+    def load(item: int) -> tuple:
+        return item, 100
+
+    prefetcher = Prefetcher(list(range(20)), load, concurrency=2, max_bytes=250)
+    values = []
+    for value in prefetcher:
+        time.sleep(0.01)
+        values.append(value)
+
+    assert values == list(range(20))
+    assert 0 < prefetcher.peak_buffered <= 200 + 2 * 100
+
+
+def test_connections_are_reused(photo_server, caches, small_spec):
+    photos = [photo_server.add(f'p{index}', make_photo(index), 0.05) for index in range(24)]
+
+    list(render.iter_sources(photos, small_spec))
+
+    assert sum(photo_server.hits.values()) == len(photos)
+    assert photo_server.connections <= PREFETCH_CONCURRENCY < len(photos)
+
+
+def test_pool_workers_do_not_download_again(photo_server, caches, small_spec, tmp_path):
+    photos = [photo_server.add(f'p{index}', make_photo(index)) for index in range(4)]
+    photos.insert(2, photo_server.url('missing'))
+
+    stats = render.render_video(photos, small_spec, str(tmp_path / 'output.mp4'), workers=2)
+
+    assert stats['segments_rendered'] == len(photos)
+    assert dict(photo_server.hits) == {'p0': 1, 'p1': 1, 'missing': 1, 'p2': 1, 'p3': 1}
@@ -0,0 +1,51 @@
+import tracemalloc
+
+import pytest
+
+import render
+from conftest import make_photo
+from prefetch import Prefetcher
+
+
+def test_twenty_photo_render_keeps_a_few_frames_in_memory(photo_server, caches, tmp_path, monkeypatch):
+    """tracemalloc видит кадры и массивы NumPy, но не память PIL: исходники в буфере предзагрузки
+    проверяются отдельно по peak_buffered"""
+    spec = render.RenderSpec(width=640, height=360, fps=10, duration=2, animation_type='zoom', transition='fade')
+    frame_bytes = spec.width * spec.height * 3
+    source_bytes = render.source_size(spec)[0] * render.source_size(spec)[1] * 3
+    prefetchers = []
+
+    def bounded_prefetcher(*args, **kwargs):
+        prefetchers.append(Prefetcher(*args, concurrency=1, max_bytes=2 * source_bytes, **kwargs))
+        return prefetchers[-1]
+
+    monkeypatch.setattr(render, 'Prefetcher', bounded_prefetcher)
+    photos = [photo_server.add(f'p{index}', make_photo(index, (1280, 720))) for index in range(20)]
+
+    tracemalloc.start()
+    try:
+        stats = render.render_video(photos, spec, str(tmp_path / 'output.mp4'), workers=1)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    assert stats['frames'] == 20 * spec.frames_per_photo
+    assert peak < 12 * frame_bytes < stats['frames'] * frame_bytes / 30
+    assert prefetchers[0].peak_buffered <= 3 * source_bytes
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+@pytest.mark.parametrize('edited', [0, 2, 4])
+def test_editing_one_photo_re_renders_only_adjacent_segments(photo_server, caches, small_spec, tmp_path, edited, workers):
+    photos = [photo_server.add(f'p{index}', make_photo(index)) for index in range(5)]
+    first = render.render_video(photos, small_spec, str(tmp_path / 'first.mp4'), workers=workers)
+    unchanged = render.render_video(photos, small_spec, str(tmp_path / 'unchanged.mp4'), workers=workers)
+
+    photos[edited] = photo_server.add('edited', make_photo(100))
+    edited_stats = render.render_video(photos, small_spec, str(tmp_path / 'edited.mp4'), workers=workers)
+
+    assert first['segments_rendered'] == 5
+    assert unchanged['segments_rendered'] == 0
+    assert edited_stats['segments_rendered'] == (1 if edited == 0 else 2)
+    assert edited_stats['segments_reused'] == 5 - edited_stats['segments_rendered']
+    assert edited_stats['frames'] == first['frames']
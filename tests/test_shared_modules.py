@@ -0,0 +1,10 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+from coldstart import shared_module_drift
+
+
+def test_shared_module_copies_are_identical():
+    assert shared_module_drift() == {}